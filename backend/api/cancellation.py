@@ -0,0 +1,92 @@
+import asyncio
+import time
+from collections.abc import Awaitable
+from contextlib import contextmanager
+from typing import TypeVar
+
+from fastapi import HTTPException, Request
+
+from lib import CancellationMetrics, Cancelled, CancelToken
+
+from .config import (
+    DISCONNECT_POLL_SECONDS,
+    RENDER_DEADLINE_MARGIN_SECONDS,
+    RENDER_DEADLINE_SECONDS,
+)
+
+R = TypeVar("R")
+
+DISCONNECTED = "disconnected"
+DEADLINE = "deadline"
+# クライアントが切断したリクエストの応答（nginx の慣習。実際には届かない）
+CLIENT_CLOSED_REQUEST = 499
+
+cancellation_metrics = CancellationMetrics()
+
+
+def request_deadline(http_request: Request) -> float | None:
+    """
+    このリクエストがレンダリングを待つ期限（time.monotonic() の値、無期限なら None）
+
+    RENDER_DEADLINE_SECONDS と、Lambda（Mangum が scope["aws.context"] に渡す）の
+    残り実行時間の短い方。
+    """
+    budgets = []
+    if RENDER_DEADLINE_SECONDS > 0:
+        budgets.append(RENDER_DEADLINE_SECONDS)
+    context = http_request.scope.get("aws.context")
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        remaining = context.get_remaining_time_in_millis() / 1000
+        budgets.append(max(0.0, remaining - RENDER_DEADLINE_MARGIN_SECONDS))
+    return time.monotonic() + min(budgets) if budgets else None
+
+
+async def until_abandoned(http_request: Request, awaitable: Awaitable[R]) -> R:
+    """
+    awaitable を待ち、クライアントが切断するか期限を過ぎたら待つのをやめる
+
+    待つのをやめると awaitable をキャンセルする（SingleFlight の最後の待ち手なら
+    レンダリングも中断される）。期限切れは 504、切断は 499 を送出する。
+    """
+    deadline = request_deadline(http_request)
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            timeout = DISCONNECT_POLL_SECONDS
+            if deadline is not None:
+                timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                return task.result()
+            if deadline is not None and time.monotonic() >= deadline:
+                reason = DEADLINE
+                break
+            if await http_request.is_disconnected():
+                reason = DISCONNECTED
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+
+    cancellation_metrics.record_abandoned(reason)
+    if reason == DEADLINE:
+        raise HTTPException(status_code=504, detail="Render deadline exceeded")
+    raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client disconnected")
+
+
+@contextmanager
+def track_render(cancel: CancelToken | None):
+    """
+    中断したレンダリングと、待つ側がいなくなった後に完了したレンダリングの時間を集計
+
+    イベントループが先に終わっても集計できるよう、レンダリングのスレッド内で使う。
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Cancelled:
+        cancellation_metrics.record_cancelled(time.perf_counter() - start)
+        raise
+    if cancel is not None and cancel.cancelled:
+        cancellation_metrics.record_unclaimed(time.perf_counter() - start)
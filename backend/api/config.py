@@ -1,17 +1,111 @@
 import os
 from pathlib import Path
+from typing import get_args
+
+from .schemas import NormalizationMode
 
 AUDIO_INPUT_DIR = Path(os.environ.get("AUDIO_INPUT_DIR", "/app/audio/input"))
 AUDIO_OUTPUT_DIR = Path(os.environ.get("AUDIO_OUTPUT_DIR", "/app/audio/output"))
 AUDIO_NORMALIZED_DIR = AUDIO_OUTPUT_DIR / "normalized"
 
+# 出力ファイルの掃除設定（最終アクセスからの TTL とディスク予算）
+OUTPUT_TTL_SECONDS = float(os.environ.get("OUTPUT_TTL_SECONDS", "3600"))
+OUTPUT_DISK_BUDGET_BYTES = int(os.environ.get("OUTPUT_DISK_BUDGET_BYTES", str(1024**3)))
+OUTPUT_MIN_AGE_SECONDS = float(os.environ.get("OUTPUT_MIN_AGE_SECONDS", "300"))
+JANITOR_INTERVAL_SECONDS = float(os.environ.get("JANITOR_INTERVAL_SECONDS", "60"))
+
+# 表示用正規化: "peak"（ピークを揃える）または "loudness"（入出力のラウドネスを揃える）
+DISPLAY_NORMALIZATION = os.environ.get("DISPLAY_NORMALIZATION", "peak")
+if DISPLAY_NORMALIZATION not in get_args(NormalizationMode):
+    # 不正な値はレンダリング後の正規化で初めて失敗するため、起動時に弾く
+    raise ValueError(f"Unknown DISPLAY_NORMALIZATION: {DISPLAY_NORMALIZATION}")
+
+# レンダリングの受け付け制御（同時数・推定 CPU 秒・推定メモリの予算と待ち行列）
+RENDER_MAX_CONCURRENCY = int(os.environ.get("RENDER_MAX_CONCURRENCY", str(os.cpu_count() or 1)))
+RENDER_CPU_BUDGET_SECONDS = float(
+    os.environ.get("RENDER_CPU_BUDGET_SECONDS", str(10.0 * RENDER_MAX_CONCURRENCY))
+)
+RENDER_MEMORY_BUDGET_BYTES = int(os.environ.get("RENDER_MEMORY_BUDGET_BYTES", str(1024**3)))
+# リクエスト1件あたりのメモリ予算（超える入力はブロック単位に分割して処理する）
+RENDER_MEMORY_PER_REQUEST_BYTES = int(
+    os.environ.get("RENDER_MEMORY_PER_REQUEST_BYTES", str(256 * 1024**2))
+)
+RENDER_MAX_QUEUE = int(os.environ.get("RENDER_MAX_QUEUE", "16"))
+RENDER_MAX_WAIT_SECONDS = float(os.environ.get("RENDER_MAX_WAIT_SECONDS", "10"))
+
+# 一括レンダリング（並行に処理するファイル数と1リクエストあたりの上限）
+BULK_MAX_WORKERS = int(os.environ.get("BULK_MAX_WORKERS", str(os.cpu_count() or 1)))
+BULK_MAX_FILES = int(os.environ.get("BULK_MAX_FILES", "200"))
+
+# 人気の入力×チェーンの事前レンダリング（ライブのリクエストがない間だけ、CPU 使用率と
+# 1回あたりの CPU 秒を制限して実行）
+PRERENDER_ENABLED = os.environ.get("PRERENDER_ENABLED", "0") == "1"
+PRERENDER_INTERVAL_SECONDS = float(os.environ.get("PRERENDER_INTERVAL_SECONDS", "3600"))
+PRERENDER_CPU_FRACTION = float(os.environ.get("PRERENDER_CPU_FRACTION", "0.25"))
+PRERENDER_CPU_BUDGET_SECONDS = float(os.environ.get("PRERENDER_CPU_BUDGET_SECONDS", "60"))
+PRERENDER_MAX_JOBS = int(os.environ.get("PRERENDER_MAX_JOBS", "100"))
+PRERENDER_TRACKED_COMBINATIONS = int(os.environ.get("PRERENDER_TRACKED_COMBINATIONS", "1000"))
+PRERENDER_CHAINS_PATH = (
+    Path(os.environ["PRERENDER_CHAINS_PATH"]) if os.environ.get("PRERENDER_CHAINS_PATH") else None
+)
+
+# 直接アップロードして処理する場合のボディの上限（超える場合は S3 経由を案内する）
+DIRECT_RENDER_MAX_BYTES = int(os.environ.get("DIRECT_RENDER_MAX_BYTES", str(10 * 1024**2)))
+
+# リクエスト単位のプロファイル（既定では無効）。PROFILING_TOKEN を設定すると
+# X-Profile ヘッダーに同じ値を付けたリクエストだけ、PROFILE_RENDERS=1 なら全レンダリングを記録
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+PROFILE_RENDERS = os.environ.get("PROFILE_RENDERS", "0") == "1"
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_INTERVAL_SECONDS", "0.002"))
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", AUDIO_OUTPUT_DIR / "profiles"))
+
+# エフェクトの処理コストの計測結果（ビルド時または起動時に計測してキャッシュ）
+COST_MODEL_PATH = Path(
+    os.environ.get("COST_MODEL_PATH", Path(__file__).resolve().parent.parent / "effect_costs.json")
+)
+COST_MODEL_CALIBRATE = os.environ.get("COST_MODEL_CALIBRATE", "1") == "1"
+
+# 起動時のウォームアップ（プラグイン・コーデック・解析の初期化を初回リクエスト前に済ませる）
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "1") == "1"
+
 # S3 settings (for Lambda deployment)
 S3_BUCKET = os.environ.get("AUDIO_BUCKET", "")
 S3_REGION = os.environ.get("AWS_REGION", "ap-northeast-1")
 S3_INPUT_PREFIX = "input/"
 S3_OUTPUT_PREFIX = "output/"
+S3_PROFILE_PREFIX = "profiles/"
 PRESIGNED_URL_EXPIRATION = 3600  # 1 hour
 
+# S3 上の大きな WAV は、範囲指定のダウンロード・レンダリング・マルチパートアップロードを
+# 待ち行列でつないで並行に行う。パートは S3 の最小サイズ（最後以外 5MiB）以上にする
+S3_STREAM_MIN_BYTES = int(os.environ.get("S3_STREAM_MIN_BYTES", str(32 * 1024**2)))
+S3_STREAM_PART_BYTES = max(
+    5 * 1024**2, int(os.environ.get("S3_STREAM_PART_BYTES", str(8 * 1024**2)))
+)
+S3_STREAM_QUEUE_DEPTH = int(os.environ.get("S3_STREAM_QUEUE_DEPTH", "2"))
+
+# ワーカー・インスタンス間で共有するレンダリング結果の2段目のキャッシュ
+# "directory"（RENDER_CACHE_DIR に SQLite の索引付きで保存）、"s3"（S3 の RENDER_CACHE_PREFIX）、
+# 空なら無効。directory の保存は別スレッドで行い、待ちが RENDER_CACHE_MAX_PENDING 件を超えた分は
+# 捨てる。s3 は Lambda でスレッドが止まるため、レスポンスの前に保存する
+RENDER_CACHE_BACKEND = os.environ.get("RENDER_CACHE_BACKEND", "")
+RENDER_CACHE_DIR = Path(os.environ.get("RENDER_CACHE_DIR", "/app/audio/cache"))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", str(10 * 1024**3)))
+RENDER_CACHE_PREFIX = os.environ.get("RENDER_CACHE_PREFIX", "cache/")
+RENDER_CACHE_MAX_PENDING = int(os.environ.get("RENDER_CACHE_MAX_PENDING", "16"))
+
+# レンダリングを待つ期限（秒、0 なら無期限）。Lambda では残り実行時間から
+# RENDER_DEADLINE_MARGIN_SECONDS（中断の後始末と応答に使う）を引いた時間と短い方を使う
+RENDER_DEADLINE_SECONDS = float(os.environ.get("RENDER_DEADLINE_SECONDS", "0"))
+RENDER_DEADLINE_MARGIN_SECONDS = float(os.environ.get("RENDER_DEADLINE_MARGIN_SECONDS", "2"))
+# クライアントの切断を確認する間隔と、中断を確認するレンダリングの区切り（音声の秒数）
+DISCONNECT_POLL_SECONDS = float(os.environ.get("DISCONNECT_POLL_SECONDS", "0.25"))
+RENDER_CANCEL_CHECK_SECONDS = float(os.environ.get("RENDER_CANCEL_CHECK_SECONDS", "5"))
+
+# 同じ Idempotency-Key の再試行に完了済みの応答を返す期間と保持件数
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "900"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
 # Environment: "production" uses S3, "development" uses local files
 ENV = os.environ.get("ENV", "development")
 IS_PRODUCTION = ENV == "production"
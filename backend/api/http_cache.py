@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+# 内容アドレス化された出力（同じ名前なら同じ内容）は永続的にキャッシュさせる
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 差し替えられる可能性があるファイルは毎回 ETag で再検証させる
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_DIGEST_CHUNK_SIZE = 1024 * 1024
+_DIGEST_CACHE_SIZE = 1024
+
+# (パス, サイズ, mtime) → ダイジェスト
+_digest_cache: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+_digest_lock = threading.Lock()
+
+
+def file_digest(path: Path) -> str:
+    """ファイル内容の SHA-256（サイズと mtime が変わらない限り再計算しない）"""
+    stat = path.stat()
+    cache_key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_cache.get(cache_key)
+        if digest is not None:
+            _digest_cache.move_to_end(cache_key)
+            return digest
+
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_DIGEST_CHUNK_SIZE):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+
+    with _digest_lock:
+        _digest_cache[cache_key] = digest
+        while len(_digest_cache) > _DIGEST_CACHE_SIZE:
+            _digest_cache.popitem(last=False)
+    return digest
+
+
+def make_etag(digest: str) -> str:
+    """ダイジェストから強い ETag を生成"""
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match が ETag に一致するか（弱い比較）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """304 Not Modified レスポンス"""
+    return Response(status_code=304, headers={"etag": etag, "cache-control": cache_control})
+
+
+def cached_bytes_response(
+    request: Request, body: bytes, etag: str, cache_control: str, media_type: str
+) -> Response:
+    """事前計算済みのボディを ETag 付きで返却"""
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    return Response(
+        content=body,
+        media_type=media_type,
+        headers={"etag": etag, "cache-control": cache_control},
+    )
+
+
+async def cached_file_response(
+    request: Request,
+    path: Path,
+    filename: str,
+    cache_control: str,
+    media_type: str = "audio/wav",
+) -> Response:
+    """
+    ファイルを ETag・Cache-Control 付きで返却
+
+    If-None-Match が一致すれば 304 を返す。Range / If-Range は FileResponse が処理する。
+    """
+    etag = make_etag(await run_in_threadpool(file_digest, path))
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    return FileResponse(
+        path,
+        media_type=media_type,
+        filename=filename,
+        headers={"etag": etag, "cache-control": cache_control},
+    )
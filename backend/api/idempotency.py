@@ -0,0 +1,65 @@
+import hashlib
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from lib import IdempotencyStore
+
+from .config import IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL_SECONDS
+
+# クライアントが再試行で同じ値を送るリクエストヘッダーと、保存した応答を返したことを示すヘッダー
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# インスタンス内のメモリに保持する（Lambda ではウォームなインスタンスへの再試行のみ）
+idempotency_store = IdempotencyStore(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_ENTRIES)
+
+
+@dataclass(frozen=True)
+class IdempotencyKey:
+    """エンドポイント毎の Idempotency-Key とリクエスト内容の指紋"""
+
+    key: str
+    fingerprint: str
+
+
+def idempotency_key(http_request: Request, endpoint: str, body: BaseModel) -> IdempotencyKey | None:
+    """Idempotency-Key ヘッダーがあれば、エンドポイントとリクエスト内容と組にして返す"""
+    key = http_request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=400, detail=f"Idempotency-Key is too long (max {MAX_KEY_LENGTH})"
+        )
+    fingerprint = hashlib.sha256(body.model_dump_json().encode()).hexdigest()
+    return IdempotencyKey(key=f"{endpoint}:{key}", fingerprint=fingerprint)
+
+
+def replay_response(idempotency: IdempotencyKey | None) -> JSONResponse | None:
+    """
+    同じキーで完了したリクエストがあれば、その応答を返す
+
+    同じキーを内容の異なるリクエストに使った場合は 422 を返す。
+    """
+    if idempotency is None:
+        return None
+    stored = idempotency_store.get(idempotency.key)
+    if stored is None:
+        return None
+    if stored.fingerprint != idempotency.fingerprint:
+        raise HTTPException(
+            status_code=422, detail="Idempotency-Key was already used for a different request"
+        )
+    return JSONResponse(stored.body, headers={REPLAYED_HEADER: "true"})
+
+
+def remember_response(idempotency: IdempotencyKey | None, response: BaseModel) -> None:
+    """完了した応答を Idempotency-Key に対して保存"""
+    if idempotency is not None:
+        idempotency_store.put(
+            idempotency.key, idempotency.fingerprint, response.model_dump(mode="json")
+        )
@@ -0,0 +1,177 @@
+import argparse
+import json
+import logging
+from collections import Counter
+from collections.abc import Iterable
+from pathlib import Path
+
+from pedalboard.io import AudioFile
+
+from lib import (
+    EFFECT_MAPPING,
+    EffectChainError,
+    Prerenderer,
+    PrerenderJob,
+    compile_effect_chain,
+)
+
+from .config import (
+    AUDIO_INPUT_DIR,
+    DISPLAY_NORMALIZATION,
+    PRERENDER_CHAINS_PATH,
+    PRERENDER_CPU_BUDGET_SECONDS,
+    PRERENDER_CPU_FRACTION,
+    PRERENDER_INTERVAL_SECONDS,
+    PRERENDER_MAX_JOBS,
+)
+from .http_cache import file_digest
+from .routes import (
+    REQUEST_LOG_MARKER,
+    admission,
+    local_outputs,
+    plan_render,
+    popularity,
+    render_key,
+    render_local,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def render_job(job: PrerenderJob) -> bool:
+    """/api/process と同じキャッシュに出力一式を作る（既にあれば False）"""
+    input_path = AUDIO_INPUT_DIR / job.input_file
+    chain = compile_effect_chain(job.chain_dicts())
+    key = render_key(file_digest(input_path), chain, DISPLAY_NORMALIZATION)
+    outputs = local_outputs(job.input_file, key)
+    if outputs.exist():
+        return False
+    with AudioFile(str(input_path)) as f:
+        cost, memory = plan_render(f.frames, f.num_channels, f.samplerate, chain)
+    # ライブのリクエストと同じ予算に計上する（空いていなければ Overloaded で次回に回す）
+    with admission.reserve(cost):
+        render_local(input_path, chain, DISPLAY_NORMALIZATION, outputs, memory)
+    return True
+
+
+def _job(input_file: str, effect_chain: list[dict]) -> PrerenderJob | None:
+    try:
+        return PrerenderJob.from_chain(input_file, compile_effect_chain(effect_chain))
+    except (EffectChainError, AttributeError, TypeError):
+        return None
+
+
+def configured_chains(path: Path | None) -> list[list[dict]]:
+    """
+    設定ファイル（エフェクトチェーンの JSON 配列）のチェーン
+
+    読めない・不正なチェーンを含む場合は ValueError（バックグラウンドで黙って失敗しない
+    よう、起動時に1回だけ読み込んで検証する）
+    """
+    if path is None:
+        return []
+    try:
+        chains = json.loads(path.read_text())
+        if not isinstance(chains, list):
+            raise ValueError("expected a JSON array of effect chains")
+        for chain in chains:
+            compile_effect_chain(chain)
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        raise ValueError(f"Invalid PRERENDER_CHAINS_PATH {path}: {e}") from e
+    return chains
+
+
+CONFIGURED_CHAINS = configured_chains(PRERENDER_CHAINS_PATH)
+
+
+def jobs_from_log(lines: Iterable[str]) -> list[PrerenderJob]:
+    """リクエストログ（/api/process が出力する行）から、リクエスト数の多い順に組み合わせを返す"""
+    counts: Counter[PrerenderJob] = Counter()
+    for line in lines:
+        index = line.find(REQUEST_LOG_MARKER)
+        if index < 0:
+            continue
+        try:
+            entry = json.loads(line[index + len(REQUEST_LOG_MARKER) :])
+            job = _job(entry["input_file"], entry["effect_chain"])
+        except (ValueError, KeyError, TypeError):
+            continue
+        if job is not None:
+            counts[job] += 1
+    return [job for job, _ in counts.most_common()]
+
+
+def prerender_jobs(
+    max_jobs: int = PRERENDER_MAX_JOBS, extra: Iterable[PrerenderJob] = ()
+) -> list[PrerenderJob]:
+    """
+    事前レンダリングの対象
+
+    人気の組み合わせ（このプロセスのリクエスト数とログ）、設定済みのチェーン、
+    単体エフェクトのプリセットの順に、入力ディレクトリの全ファイルと組み合わせる。
+    """
+    inputs = sorted(f.name for f in AUDIO_INPUT_DIR.glob("*.wav"))
+    chains = [*CONFIGURED_CHAINS, *[[{"name": name}] for name in EFFECT_MAPPING]]
+    candidates = [*popularity.top(max_jobs), *extra]
+    candidates += [_job(name, chain) for chain in chains for name in inputs]
+
+    jobs: list[PrerenderJob] = []
+    for job in dict.fromkeys(candidates):
+        if job is None or not (AUDIO_INPUT_DIR / job.input_file).exists():
+            continue
+        jobs.append(job)
+        if len(jobs) >= max_jobs:
+            break
+    return jobs
+
+
+def _is_idle() -> bool:
+    load = admission.snapshot()
+    return load["running"] == 0 and load["queued"] == 0
+
+
+prerenderer = Prerenderer(
+    render=render_job,
+    jobs=prerender_jobs,
+    is_idle=_is_idle,
+    cpu_budget_seconds=PRERENDER_CPU_BUDGET_SECONDS,
+    cpu_fraction=PRERENDER_CPU_FRACTION,
+    interval_seconds=PRERENDER_INTERVAL_SECONDS,
+)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="人気の入力×チェーンを事前レンダリング")
+    parser.add_argument(
+        "--log", type=Path, action="append", default=[], help="リクエストログのパス"
+    )
+    parser.add_argument("--max-jobs", type=int, default=PRERENDER_MAX_JOBS)
+    parser.add_argument("--cpu-budget", type=float, default=PRERENDER_CPU_BUDGET_SECONDS)
+    parser.add_argument(
+        "--cpu-fraction",
+        type=float,
+        default=1.0,
+        help="CPU 使用率の上限（デプロイ時は 1.0、稼働中のサーバーと同居するなら小さく）",
+    )
+    args = parser.parse_args(argv)
+
+    from_logs: list[PrerenderJob] = []
+    for path in args.log:
+        try:
+            with path.open(errors="replace") as lines:
+                from_logs += jobs_from_log(lines)
+        except OSError as e:
+            parser.error(f"cannot read request log {path}: {e}")
+    runner = Prerenderer(
+        render=render_job,
+        jobs=lambda: prerender_jobs(args.max_jobs, from_logs),
+        is_idle=lambda: True,
+        cpu_budget_seconds=args.cpu_budget,
+        cpu_fraction=args.cpu_fraction,
+        interval_seconds=0,
+    )
+    print(json.dumps(runner.run_once().to_dict()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import hmac
+import logging
+import uuid
+from collections.abc import Callable
+from pathlib import Path
+from typing import TypeVar
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+from lib import SamplingProfiler
+
+from .config import PROFILE_INTERVAL_SECONDS, PROFILE_RENDERS, PROFILING_TOKEN
+
+R = TypeVar("R")
+
+# プロファイルを要求するリクエストヘッダー（値は PROFILING_TOKEN と一致する必要がある）
+PROFILE_HEADER = "x-profile"
+PROFILE_SUFFIX = ".folded"
+
+logger = logging.getLogger(__name__)
+
+
+def profiling_requested(request: Request) -> bool:
+    """
+    このリクエストをプロファイルするか
+
+    PROFILE_RENDERS が有効なら全レンダリング、そうでなければ X-Profile ヘッダーが
+    PROFILING_TOKEN と一致する場合のみ（トークン未設定ならヘッダーは無視する）。
+    """
+    if PROFILE_RENDERS:
+        return True
+    if not PROFILING_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get(PROFILE_HEADER, ""), PROFILING_TOKEN)
+
+
+async def run_render(
+    profile: bool, func: Callable[..., R], *args
+) -> tuple[R, SamplingProfiler | None]:
+    """スレッドプールで func を実行（profile が真ならサンプリングしながら）"""
+    if not profile:
+        return await run_in_threadpool(func, *args), None
+    with SamplingProfiler(PROFILE_INTERVAL_SECONDS) as profiler:
+        result = await run_in_threadpool(profiler.run, func, *args)
+    logger.info(
+        "profiled %s: %.3fs, %d samples",
+        getattr(func, "__name__", func),
+        profiler.duration_seconds,
+        sum(profiler.samples.values()),
+    )
+    return result, profiler
+
+
+def profile_filename() -> str:
+    return f"{uuid.uuid4().hex}{PROFILE_SUFFIX}"
+
+
+def write_profile(profiler: SamplingProfiler, directory: Path) -> str:
+    """プロファイルをディレクトリに書き出し、ファイル名を返す"""
+    filename = profile_filename()
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / filename).write_text(profiler.collapsed())
+    return filename
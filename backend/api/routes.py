@@ -1,45 +1,260 @@
+import hashlib
+import io
+import json
+import logging
 import os
 import uuid
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO
 from urllib.parse import quote
 
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pedalboard.io import AudioFile
+from pydantic import TypeAdapter, ValidationError
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 
-from lib import EFFECT_MAPPING, normalize_audio_for_display
-from lib.effects import build_effect_chain
+from lib import (
+    ARTIFACT_INPUT_NORM,
+    ARTIFACT_OUTPUT,
+    ARTIFACT_OUTPUT_NORM,
+    ARTIFACT_STATS,
+    EFFECT_MAPPING,
+    AdmissionController,
+    CancelToken,
+    CompiledChain,
+    CostModel,
+    EffectChainError,
+    MemoryMetrics,
+    MemoryTracker,
+    OutputJanitor,
+    Overloaded,
+    RenderCost,
+    RenderResult,
+    RequestPopularity,
+    SamplingProfiler,
+    SingleFlight,
+    WavFormat,
+    ZipStream,
+    compile_effect_chain,
+    current_cost_model,
+    estimate_render,
+    estimate_render_cost,
+    last_warmup,
+    map_bounded,
+    parse_wav_header,
+    plan_block_frames,
+    render_file,
+    waveform_peaks,
+    write_display_versions,
+)
 
+from .cancellation import cancellation_metrics, track_render, until_abandoned
 from .config import (
     AUDIO_INPUT_DIR,
     AUDIO_NORMALIZED_DIR,
     AUDIO_OUTPUT_DIR,
+    BULK_MAX_FILES,
+    BULK_MAX_WORKERS,
+    DIRECT_RENDER_MAX_BYTES,
+    DISPLAY_NORMALIZATION,
     IS_PRODUCTION,
+    JANITOR_INTERVAL_SECONDS,
+    OUTPUT_DISK_BUDGET_BYTES,
+    OUTPUT_MIN_AGE_SECONDS,
+    OUTPUT_TTL_SECONDS,
+    PRERENDER_TRACKED_COMBINATIONS,
     PRESIGNED_URL_EXPIRATION,
+    PROFILE_DIR,
+    RENDER_CANCEL_CHECK_SECONDS,
+    RENDER_CPU_BUDGET_SECONDS,
+    RENDER_MAX_CONCURRENCY,
+    RENDER_MAX_QUEUE,
+    RENDER_MAX_WAIT_SECONDS,
+    RENDER_MEMORY_BUDGET_BYTES,
+    RENDER_MEMORY_PER_REQUEST_BYTES,
     S3_BUCKET,
     S3_INPUT_PREFIX,
     S3_OUTPUT_PREFIX,
+    S3_PROFILE_PREFIX,
     S3_REGION,
+    S3_STREAM_MIN_BYTES,
+    S3_STREAM_PART_BYTES,
+    S3_STREAM_QUEUE_DEPTH,
+)
+from .http_cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    cached_bytes_response,
+    cached_file_response,
+    file_digest,
+    make_etag,
+)
+from .idempotency import (
+    idempotency_key,
+    idempotency_store,
+    remember_response,
+    replay_response,
 )
+from .profiles import (
+    PROFILE_SUFFIX,
+    profile_filename,
+    profiling_requested,
+    run_render,
+    write_profile,
+)
+from .s3_stream import read_range, render_s3_stream
 from .schemas import (
+    AudioStats,
+    BulkFileResult,
+    BulkProcessRequest,
+    DirectRenderMode,
+    DirectRenderResponse,
+    EffectConfig,
+    EstimateRequest,
+    EstimateResponse,
     ProcessRequest,
     ProcessResponse,
+    S3BulkProcessRequest,
+    S3BulkProcessResponse,
     S3ProcessRequest,
     S3ProcessResponse,
     UploadUrlRequest,
     UploadUrlResponse,
 )
+from .shared_cache import SharedRenderCache, create_shared_cache
+from .upload import read_upload
 
 router = APIRouter(prefix="/api")
+logger = logging.getLogger(__name__)
+
+# 事前レンダリングの対象をログから集計するための、処理リクエストのログ行の目印
+REQUEST_LOG_MARKER = "render request: "
+
+# 出力ファイルはリクエスト毎には消さず、バックグラウンドで TTL・容量予算に従い削除する
+janitor = OutputJanitor(
+    directories=[AUDIO_OUTPUT_DIR, AUDIO_NORMALIZED_DIR, PROFILE_DIR],
+    ttl_seconds=OUTPUT_TTL_SECONDS,
+    max_bytes=OUTPUT_DISK_BUDGET_BYTES,
+    min_age_seconds=OUTPUT_MIN_AGE_SECONDS,
+    interval_seconds=JANITOR_INTERVAL_SECONDS,
+    patterns=("*.wav", "*.json", f"*{PROFILE_SUFFIX}"),
+)
+
+# レンダリングは推定コストに応じて受け付け、予算を超える分は待たせるか 429 を返す
+admission = AdmissionController(
+    max_concurrency=RENDER_MAX_CONCURRENCY,
+    cpu_budget_seconds=RENDER_CPU_BUDGET_SECONDS,
+    memory_budget_bytes=RENDER_MEMORY_BUDGET_BYTES,
+    max_queue=RENDER_MAX_QUEUE,
+    max_wait_seconds=RENDER_MAX_WAIT_SECONDS,
+)
+memory_metrics = MemoryMetrics()
+# 同じ入力・チェーンのレンダリングを同時に1回だけ実行する
+render_flights = SingleFlight()
+# 事前レンダリングの対象を選ぶための、入力×チェーン毎のリクエスト数
+popularity = RequestPopularity(PRERENDER_TRACKED_COMBINATIONS)
+# ワーカー・インスタンス間で共有する2段目のキャッシュ（RENDER_CACHE_BACKEND 未設定なら None）
+shared_cache = create_shared_cache(lambda: get_s3_client())
+
+
+def compile_request_chain(effect_chain: list[EffectConfig]) -> CompiledChain:
+    """リクエストのエフェクトチェーンを I/O 前に検証・コンパイル"""
+    try:
+        return compile_effect_chain(
+            [{"name": e.name, "params": e.params or {}} for e in effect_chain]
+        )
+    except EffectChainError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@asynccontextmanager
+async def admit_render(input_path: Path | BinaryIO, chain: CompiledChain):
+    """入力のフレーム数・チャンネル数を読み、admit_frames で受け付けを待つ"""
+    try:
+        with AudioFile(str(input_path) if isinstance(input_path, Path) else input_path) as f:
+            frames, num_channels, samplerate = f.frames, f.num_channels, f.samplerate
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Unsupported audio data: {e}")
+    if not isinstance(input_path, Path):
+        input_path.seek(0)
+
+    async with admit_frames(frames, num_channels, samplerate, chain) as memory:
+        yield memory
+
+
+def plan_render(
+    frames: int,
+    num_channels: int,
+    samplerate: float,
+    chain: CompiledChain,
+    max_block_frames: int | None = None,
+) -> tuple[RenderCost, MemoryTracker]:
+    """分割処理のブロックを決め、受け付けに使うコストと MemoryTracker を返す"""
+    block_frames = plan_block_frames(frames, num_channels, RENDER_MEMORY_PER_REQUEST_BYTES)
+    if max_block_frames is not None:
+        block_frames = min(block_frames or max_block_frames, max_block_frames)
+    # 切断・期限で途中から中断できるよう、長い入力は RENDER_CANCEL_CHECK_SECONDS 毎に区切る
+    cancel_frames = max(1, int(samplerate * RENDER_CANCEL_CHECK_SECONDS))
+    if frames > cancel_frames:
+        block_frames = min(block_frames or cancel_frames, cancel_frames)
+    cost = estimate_render_cost(
+        frames, num_channels, chain, samplerate, current_cost_model(), block_frames
+    )
+    memory = MemoryTracker(budget_bytes=RENDER_MEMORY_PER_REQUEST_BYTES, block_frames=block_frames)
+    return cost, memory
+
+
+@asynccontextmanager
+async def admit_frames(
+    frames: int,
+    num_channels: int,
+    samplerate: float,
+    chain: CompiledChain,
+    max_block_frames: int | None = None,
+):
+    """
+    フレーム数・チャンネル数とチェーンからコストを推定し、受け付けを待つ
+
+    ファイル全体を一度に処理するとリクエスト毎のメモリ予算を超える場合は分割処理の
+    ブロックを決め（ストリーミングで処理する場合は max_block_frames 以下にする）、
+    MemoryTracker として渡す。長い入力は中断を確認できるよう常に分割する。
+    完了後にメモリ使用量をログと集計に残す。
+    """
+    cost, memory = plan_render(frames, num_channels, samplerate, chain, max_block_frames)
+    try:
+        async with admission.admit(cost):
+            yield memory
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    memory_metrics.record(memory)
+    logger.info("render memory: %s", json.dumps(memory.to_dict()))
 
 
 @router.get("/health")
 async def health_check():
     """ヘルスチェック"""
-    return {"status": "ok", "mode": "s3" if IS_PRODUCTION else "local"}
+    warmup = last_warmup()
+    return {
+        "status": "ok",
+        "mode": "s3" if IS_PRODUCTION else "local",
+        "load": admission.snapshot(),
+        "memory": memory_metrics.snapshot(),
+        "warmup": warmup.to_dict() if warmup else None,
+        "coalescing": render_flights.snapshot(),
+        "idempotency": idempotency_store.snapshot(),
+        "cancellation": cancellation_metrics.snapshot(),
+        "render_cache": shared_cache.snapshot() if shared_cache else None,
+    }
 
 
 @router.get("/input-files")
@@ -51,24 +266,250 @@ async def list_input_files():
     return {"files": files}
 
 
-@router.get("/effects")
-async def get_available_effects():
-    """利用可能なエフェクト一覧"""
+def _effects_payload(model: CostModel | None) -> bytes:
     effects = []
     for name, config in EFFECT_MAPPING.items():
-        effects.append(
-            {
-                "name": name,
-                "default_params": config["params"],
-                "class_name": config["class"].__name__,
+        effect = {
+            "name": name,
+            "default_params": config["params"],
+            "class_name": config["class"].__name__,
+        }
+        if model is not None:
+            cost = model.effects[name]
+            effect["cost"] = {
+                "ns_per_sample": cost.ns_per_sample,
+                "latency_seconds": cost.latency_seconds,
+                "tail_seconds": cost.tail_seconds,
             }
+        effects.append(effect)
+    return json.dumps({"effects": effects}, ensure_ascii=False).encode()
+
+
+EFFECTS_CACHE_CONTROL = "public, max-age=300"
+# エフェクト一覧はコストモデルが変わるまで同じなので、ボディと ETag を使い回す
+_effects_cache: tuple[CostModel | None, bytes, str] | None = None
+
+
+def _effects_response_body() -> tuple[bytes, str]:
+    global _effects_cache
+    model = current_cost_model()
+    if _effects_cache is None or _effects_cache[0] is not model:
+        body = _effects_payload(model)
+        _effects_cache = (model, body, make_etag(hashlib.sha256(body).hexdigest()))
+    return _effects_cache[1], _effects_cache[2]
+
+
+@router.get("/effects")
+async def get_available_effects(http_request: Request):
+    """利用可能なエフェクト一覧（計測済みなら処理コストを含む）"""
+    body, etag = _effects_response_body()
+    return cached_bytes_response(
+        http_request, body, etag, EFFECTS_CACHE_CONTROL, media_type="application/json"
+    )
+
+
+@router.post("/estimate", response_model=EstimateResponse)
+async def estimate_render_time(request: EstimateRequest):
+    """エフェクトチェーンと入力からレンダリング時間を見積もる"""
+    chain = compile_request_chain(request.effect_chain)
+    model = current_cost_model()
+    if model is None:
+        raise HTTPException(status_code=503, detail="Cost model is not calibrated yet")
+
+    if request.input_file is not None:
+        input_path = AUDIO_INPUT_DIR / request.input_file
+        if not input_path.exists():
+            raise HTTPException(
+                status_code=404,
+                detail=f"Input file not found: {request.input_file}",
+            )
+        with AudioFile(str(input_path)) as f:
+            frames, num_channels, samplerate = f.frames, f.num_channels, f.samplerate
+    elif request.duration_seconds is not None:
+        samplerate = request.samplerate
+        frames = int(request.duration_seconds * samplerate)
+        num_channels = request.num_channels
+    else:
+        raise HTTPException(
+            status_code=400, detail="Either input_file or duration_seconds is required"
         )
-    return {"effects": effects}
+
+    estimate = estimate_render(chain, frames, num_channels, samplerate, model)
+    return EstimateResponse(
+        estimated_seconds=estimate.seconds,
+        base_seconds=estimate.base_seconds,
+        stage_seconds=estimate.stage_seconds,
+        tail_seconds=estimate.tail_seconds,
+        frames=frames,
+        num_channels=num_channels,
+        samplerate=samplerate,
+    )
+
+
+def render_key(input_digest: str, chain: CompiledChain, normalization: str) -> str:
+    """入力内容・チェーン・正規化方式から出力のキーを決定（同じなら同じ出力名）"""
+    return hashlib.sha256(f"{input_digest}:{chain.key}:{normalization}".encode()).hexdigest()
+
+
+def _temporary_path(path: Path) -> Path:
+    """書き込み途中のファイル名（完成後に os.replace で差し替える）"""
+    return path.with_name(f".{path.stem}.{uuid.uuid4().hex[:8]}.tmp{path.suffix}")
+
+
+def _remove_files(paths: list[Path]) -> None:
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def _stats_payload(result: RenderResult) -> dict:
+    return {"input": result.input_stats.to_dict(), "output": result.output_stats.to_dict()}
+
+
+@dataclass(frozen=True)
+class LocalOutputs:
+    """ローカル処理の出力一式（処理結果・表示用正規化ファイル・統計）"""
+
+    output_path: Path
+    input_norm_path: Path
+    output_norm_path: Path
+    stats_path: Path
+
+    def paths(self) -> list[Path]:
+        return [self.output_path, self.input_norm_path, self.output_norm_path, self.stats_path]
+
+    def exist(self) -> bool:
+        return all(path.exists() for path in self.paths())
+
+    def load_stats(self) -> dict | None:
+        """
+        残っている出力の統計を読む（揃っていなければ None）
+
+        先にアクセスを記録して janitor の削除対象から外し、読んだ後にもう一度揃っているか
+        確かめる（確認と記録の間に削除された場合に備える）。
+        """
+        for path in self.paths():
+            janitor.touch(path)
+        try:
+            stats = json.loads(self.stats_path.read_text())
+        except OSError:
+            return None
+        return stats if self.exist() else None
+
+    def artifacts(self) -> dict[str, Path]:
+        """2段目のキャッシュの成果物名とパスの対応"""
+        return {
+            ARTIFACT_OUTPUT: self.output_path,
+            ARTIFACT_INPUT_NORM: self.input_norm_path,
+            ARTIFACT_OUTPUT_NORM: self.output_norm_path,
+            ARTIFACT_STATS: self.stats_path,
+        }
+
+
+def local_outputs(input_file: str, key: str) -> LocalOutputs:
+    """入力ファイル名とレンダリングのキーから出力のパスを決定"""
+    return LocalOutputs(
+        # 強い ETag と immutable で配信するため、衝突しないだけの長さのキーを名前に含める
+        output_path=AUDIO_OUTPUT_DIR / f"{Path(input_file).stem}_{key[:32]}.wav",
+        input_norm_path=AUDIO_NORMALIZED_DIR / f"input_{key[:32]}.wav",
+        output_norm_path=AUDIO_NORMALIZED_DIR / f"output_{key[:32]}.wav",
+        stats_path=AUDIO_NORMALIZED_DIR / f"stats_{key[:32]}.json",
+    )
+
+
+def render_local(
+    input_path: Path,
+    chain: CompiledChain,
+    normalization: str,
+    outputs: LocalOutputs,
+    memory: MemoryTracker,
+    cancel: CancelToken | None = None,
+) -> dict:
+    """
+    レンダリングと表示用正規化を行い、出力一式を差し替えて統計を返す
+
+    中断された場合は書き途中のファイルを削除する。
+    """
+    output_path = outputs.output_path
+    input_norm_path = outputs.input_norm_path
+    output_norm_path = outputs.output_norm_path
+    stats_path = outputs.stats_path
+    output_tmp = _temporary_path(output_path)
+    input_norm_tmp = _temporary_path(input_norm_path)
+    output_norm_tmp = _temporary_path(output_norm_path)
+    stats_tmp = _temporary_path(stats_path)
+    try:
+        with track_render(cancel):
+            with memory.stage("render"):
+                result = render_file(
+                    input_path, output_tmp, chain.build(), memory.block_frames, memory, cancel
+                )
+
+            # 表示用に正規化（レンダリング中に計測した統計を使う）
+            if cancel is not None:
+                cancel.check()
+            with memory.stage("normalize"):
+                write_display_versions(
+                    input_path,
+                    output_tmp,
+                    input_norm_tmp,
+                    output_norm_tmp,
+                    result,
+                    mode=normalization,
+                )
+            stats = _stats_payload(result)
+            stats_tmp.write_text(json.dumps(stats))
+    except BaseException:
+        _remove_files([output_tmp, input_norm_tmp, output_norm_tmp, stats_tmp])
+        raise
+
+    # 同じキーの並行リクエストが途中のファイルを読まないよう、完成後に差し替える
+    os.replace(input_norm_tmp, input_norm_path)
+    os.replace(output_norm_tmp, output_norm_path)
+    os.replace(stats_tmp, stats_path)
+    os.replace(output_tmp, output_path)
+    return stats
+
+
+async def publish_profile(profiler: SamplingProfiler | None) -> str | None:
+    """プロファイルを保存してリンクを返す（本番は S3、ローカルは PROFILE_DIR）"""
+    if profiler is None:
+        return None
+    if IS_PRODUCTION and S3_BUCKET:
+        key = f"{S3_PROFILE_PREFIX}{profile_filename()}"
+        try:
+            s3 = get_s3_client()
+            s3.put_object(
+                Bucket=S3_BUCKET,
+                Key=key,
+                Body=profiler.collapsed().encode(),
+                ContentType="text/plain; charset=utf-8",
+            )
+            return s3.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": S3_BUCKET, "Key": key},
+                ExpiresIn=PRESIGNED_URL_EXPIRATION,
+            )
+        except ClientError:
+            # プロファイルの保存に失敗してもレンダリング結果は返す
+            return None
+    filename = await run_in_threadpool(write_profile, profiler, PROFILE_DIR)
+    return f"/api/profiles/{filename}"
 
 
 @router.post("/process", response_model=ProcessResponse)
-async def process_audio(request: ProcessRequest):
-    """音声処理API"""
+async def process_audio(request: ProcessRequest, http_request: Request):
+    """
+    音声処理API
+
+    同じ入力・チェーンを処理中のリクエストはその結果を共有し、Idempotency-Key ヘッダーが
+    同じ再試行には完了済みの応答を返す。クライアントの切断・期限切れでは待つのをやめる。
+    """
+    idempotency = idempotency_key(http_request, "process", request)
+    if (replayed := replay_response(idempotency)) is not None:
+        return replayed
+    chain = compile_request_chain(request.effect_chain)
+    normalization = request.normalization or DISPLAY_NORMALIZATION
+
     input_path = AUDIO_INPUT_DIR / request.input_file
     if not input_path.exists():
         raise HTTPException(
@@ -76,75 +517,261 @@ async def process_audio(request: ProcessRequest):
             detail=f"Input file not found: {request.input_file}",
         )
 
-    # 前回の出力ファイルを削除
-    for old_file in AUDIO_OUTPUT_DIR.glob("*.wav"):
-        old_file.unlink()
-    if AUDIO_NORMALIZED_DIR.exists():
-        for old_file in AUDIO_NORMALIZED_DIR.glob("*.wav"):
-            old_file.unlink()
+    # 出力ファイル名を生成（元のファイル名 + 入力内容とチェーンのハッシュ）
+    key = render_key(file_digest(input_path), chain, normalization)
+    outputs = local_outputs(request.input_file, key)
+    popularity.record(request.input_file, chain)
+    logger.info(
+        "%s%s",
+        REQUEST_LOG_MARKER,
+        json.dumps(
+            {
+                "input_file": request.input_file,
+                "effect_chain": [
+                    {"name": stage.name, "params": dict(stage.params)} for stage in chain.stages
+                ],
+            }
+        ),
+    )
+
+    profile_url = None
+    # 同じ入力・チェーンの出力が残っていれば再レンダリングしない（janitor が途中で
+    # 削除した場合はレンダリングし直す）
+    stats = outputs.load_stats() if outputs.exist() else None
+    if stats is None:
+        profile = profiling_requested(http_request)
+
+        async def render(cancel: CancelToken) -> tuple[dict, str | None]:
+            if shared_cache is not None and await shared_cache.fetch(key, outputs.artifacts()):
+                # 他のワーカー・インスタンスがレンダリング済み
+                if (fetched := outputs.load_stats()) is not None:
+                    return fetched, None
+            async with admit_render(input_path, chain) as memory:
+                stats, profiler = await run_render(
+                    profile, render_local, input_path, chain, normalization, outputs, memory, cancel
+                )
+            if shared_cache is not None:
+                await shared_cache.store(key, outputs.artifacts())
+            return stats, await publish_profile(profiler)
 
-    # 出力ファイル名を生成（元のファイル名 + ランダム文字列）
-    base_name = Path(request.input_file).stem
-    short_id = uuid.uuid4().hex[:8]
-    output_filename = f"{base_name}_{short_id}.wav"
-    output_path = AUDIO_OUTPUT_DIR / output_filename
-    AUDIO_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        # 同じ出力を作成中のリクエストがあれば、その結果を待って共有する（同じ出力パスに
+        # 書くため、プロファイルの有無で分けない。相乗りした側は先頭のプロファイルを受け取る）。
+        # 切断・期限切れで全員が待つのをやめたらレンダリングを中断する
+        stats, profile_url = await until_abandoned(
+            http_request, render_flights.run(("process", key), render)
+        )
 
-    # エフェクトチェーンを構築・適用
-    effect_chain = [{"name": e.name, "params": e.params or {}} for e in request.effect_chain]
-    board = build_effect_chain(effect_chain)
+    response = ProcessResponse(
+        output_file=outputs.output_path.name,
+        download_url=f"/api/audio/{outputs.output_path.name}",
+        effects_applied=[e.name for e in request.effect_chain],
+        input_normalized=outputs.input_norm_path.name,
+        output_normalized=outputs.output_norm_path.name,
+        input_stats=AudioStats(**stats["input"]),
+        output_stats=AudioStats(**stats["output"]),
+        profile_url=profile_url,
+    )
+    remember_response(idempotency, response)
+    return response
 
-    with AudioFile(str(input_path)) as f:
-        audio = f.read(f.frames)
-        samplerate = f.samplerate
 
-    effected = board(audio, samplerate)
+def _bulk_inputs(names: list[str]) -> list[str]:
+    """重複を除き、件数の上限を検証"""
+    unique = list(dict.fromkeys(names))
+    if not unique:
+        raise HTTPException(status_code=400, detail="No input files")
+    if len(unique) > BULK_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many input files (max {BULK_MAX_FILES})")
+    return unique
 
-    with AudioFile(str(output_path), "w", samplerate, effected.shape[0]) as f:
-        f.write(effected)
 
-    # 表示用に正規化
-    normalized_id = uuid.uuid4().hex
-    input_norm_filename = f"input_{normalized_id}.wav"
-    output_norm_filename = f"output_{normalized_id}.wav"
+def _error_detail(error: BaseException) -> str:
+    return str(error.detail) if isinstance(error, HTTPException) else str(error)
 
-    normalize_audio_for_display(input_path, AUDIO_NORMALIZED_DIR / input_norm_filename)
-    normalize_audio_for_display(output_path, AUDIO_NORMALIZED_DIR / output_norm_filename)
 
-    return ProcessResponse(
-        output_file=output_filename,
-        download_url=f"/api/audio/{output_filename}",
-        effects_applied=[e.name for e in request.effect_chain],
-        input_normalized=input_norm_filename,
-        output_normalized=output_norm_filename,
+def _render_output(
+    input_path: Path, chain: CompiledChain, output_path: Path, memory: MemoryTracker
+) -> None:
+    output_tmp = _temporary_path(output_path)
+    with memory.stage("render"):
+        render_file(input_path, output_tmp, chain.build(), memory.block_frames, memory)
+    os.replace(output_tmp, output_path)
+
+
+@router.post("/bulk-process")
+async def bulk_process_audio(request: BulkProcessRequest):
+    """
+    複数の入力に同じエフェクトチェーンを適用し、ZIP でストリーミング返却
+
+    最大 BULK_MAX_WORKERS 件を並行にレンダリングし、終わった順にアーカイブへ追加する。
+    アーカイブは逐次生成するため、ディスクやメモリに全体を保持しない。
+    失敗したファイルは manifest.json に理由を記録して残りの処理を続ける。
+    """
+    chain = compile_request_chain(request.effect_chain)
+    if request.input_files is None:
+        names = sorted(f.name for f in AUDIO_INPUT_DIR.glob("*.wav"))
+    else:
+        names = request.input_files
+    names = _bulk_inputs(names)
+    missing = [name for name in names if not (AUDIO_INPUT_DIR / name).exists()]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Input file not found: {', '.join(missing)}")
+
+    async def render_one(name: str) -> Path:
+        input_path = AUDIO_INPUT_DIR / name
+        digest = await run_in_threadpool(file_digest, input_path)
+        key = render_key(digest, chain, DISPLAY_NORMALIZATION)
+        # /api/process と同じ出力名にして、出力を相互に再利用する
+        output_path = local_outputs(name, key).output_path
+        if output_path.exists():
+            janitor.touch(output_path)
+            return output_path
+        async with admit_render(input_path, chain) as memory:
+            await run_in_threadpool(_render_output, input_path, chain, output_path, memory)
+        return output_path
+
+    async def archive_stream():
+        archive = ZipStream()
+        manifest = {"effects_applied": [e.name for e in request.effect_chain], "files": []}
+        async for name, result in map_bounded(names, render_one, BULK_MAX_WORKERS):
+            if isinstance(result, BaseException):
+                manifest["files"].append({"input": name, "error": _error_detail(result)})
+                continue
+            async for chunk in iterate_in_threadpool(archive.add_file(result.name, result)):
+                yield chunk
+            manifest["files"].append({"input": name, "output": result.name})
+        yield archive.add_bytes("manifest.json", json.dumps(manifest, indent=2).encode())
+        yield archive.close()
+
+    return StreamingResponse(
+        archive_stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="bulk_{chain.key[:8]}.zip"'},
     )
 
 
+_effect_chain_adapter = TypeAdapter(list[EffectConfig])
+
+
+def _render_direct(
+    audio: BinaryIO, chain: CompiledChain, peaks: int | None, memory: MemoryTracker
+) -> tuple[RenderResult, io.BytesIO, list[float], list[float]]:
+    output = io.BytesIO()
+    with memory.stage("render"):
+        result = render_file(audio, output, chain.build(), memory.block_frames, memory)
+    input_peaks: list[float] = []
+    output_peaks: list[float] = []
+    if peaks is not None:
+        audio.seek(0)
+        output.seek(0)
+        with memory.stage("peaks"):
+            input_peaks = waveform_peaks(audio, peaks)
+            output_peaks = waveform_peaks(output, peaks)
+    return result, output, input_peaks, output_peaks
+
+
+@router.post(
+    "/render",
+    response_model=DirectRenderResponse,
+    responses={200: {"content": {"audio/wav": {}}}},
+)
+async def render_direct(
+    request: Request,
+    effect_chain: str | None = None,
+    response: DirectRenderMode = "audio",
+    peaks: int = Query(1000, ge=1, le=10000),
+):
+    """
+    音声を直接アップロードして処理し、同じレスポンスで結果を返す
+
+    ボディは multipart/form-data（file と effect_chain フィールド）または音声そのもの
+    （effect_chain はクエリで JSON を指定）。response=audio なら処理後の WAV を
+    （統計は X-Input-Stats / X-Output-Stats ヘッダー）、response=peaks なら波形と統計を返す。
+    DIRECT_RENDER_MAX_BYTES を超えるボディは 413 で S3 経由のアップロードを案内する。
+    """
+    upload = await read_upload(request, DIRECT_RENDER_MAX_BYTES)
+    chain_json = upload.fields.get("effect_chain", effect_chain)
+    if chain_json is None:
+        raise HTTPException(status_code=400, detail="effect_chain is required")
+    try:
+        effect_configs = _effect_chain_adapter.validate_json(chain_json)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    chain = compile_request_chain(effect_configs)
+
+    async with admit_render(upload.audio, chain) as memory:
+        (result, output, input_peaks, output_peaks), profiler = await run_render(
+            profiling_requested(request),
+            _render_direct,
+            upload.audio,
+            chain,
+            peaks if response == "peaks" else None,
+            memory,
+        )
+    profile_url = await publish_profile(profiler)
+
+    input_stats = result.input_stats.to_dict()
+    output_stats = result.output_stats.to_dict()
+    if response == "peaks":
+        return DirectRenderResponse(
+            effects_applied=[e.name for e in effect_configs],
+            samplerate=result.samplerate,
+            frames=result.frames,
+            input_peaks=input_peaks,
+            output_peaks=output_peaks,
+            input_stats=AudioStats(**input_stats),
+            output_stats=AudioStats(**output_stats),
+            profile_url=profile_url,
+        )
+
+    base_name = Path(upload.filename).stem if upload.filename else "output"
+    encoded_filename = quote(f"{base_name}_processed.wav")
+    headers = {
+        "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
+        "X-Input-Stats": json.dumps(input_stats),
+        "X-Output-Stats": json.dumps(output_stats),
+    }
+    if profile_url:
+        headers["X-Profile-Url"] = profile_url
+    return Response(content=output.getvalue(), media_type="audio/wav", headers=headers)
+
+
 @router.get("/audio/{filename}")
-async def get_audio(filename: str):
+async def get_audio(filename: str, http_request: Request):
     """処理済み音声ファイルを返却"""
     file_path = AUDIO_OUTPUT_DIR / filename
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Audio file not found")
-    return FileResponse(file_path, media_type="audio/wav", filename=filename)
+    janitor.touch(file_path)
+    return await cached_file_response(http_request, file_path, filename, IMMUTABLE_CACHE_CONTROL)
 
 
 @router.get("/input-audio/{filename}")
-async def get_input_audio(filename: str):
+async def get_input_audio(filename: str, http_request: Request):
     """入力音声ファイルを返却"""
     file_path = AUDIO_INPUT_DIR / filename
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Input audio file not found")
-    return FileResponse(file_path, media_type="audio/wav", filename=filename)
+    return await cached_file_response(http_request, file_path, filename, REVALIDATE_CACHE_CONTROL)
 
 
 @router.get("/normalized/{filename}")
-async def get_normalized_audio(filename: str):
+async def get_normalized_audio(filename: str, http_request: Request):
     """表示用正規化音声ファイルを返却"""
     file_path = AUDIO_NORMALIZED_DIR / filename
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Normalized audio file not found")
-    return FileResponse(file_path, media_type="audio/wav", filename=filename)
+    janitor.touch(file_path)
+    return await cached_file_response(http_request, file_path, filename, IMMUTABLE_CACHE_CONTROL)
+
+
+@router.get("/profiles/{filename}")
+async def get_profile(filename: str):
+    """レンダリングのプロファイル（collapsed stack 形式）を返却"""
+    file_path = PROFILE_DIR / filename
+    if file_path.suffix != PROFILE_SUFFIX or not file_path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(file_path, media_type="text/plain; charset=utf-8")
 
 
 # ============================================
@@ -189,64 +816,343 @@ async def get_upload_url(request: UploadUrlRequest):
         raise HTTPException(status_code=500, detail=f"Failed to generate upload URL: {e}")
 
 
-@router.post("/s3-process", response_model=S3ProcessResponse)
-async def process_s3_audio(request: S3ProcessRequest):
-    """S3上の音声ファイルを処理"""
-    if not S3_BUCKET:
-        raise HTTPException(status_code=500, detail="S3 bucket not configured")
+# S3 に書き出す音声のメタデータ（キーは毎回新しいので不変としてキャッシュさせる）
+S3_OUTPUT_EXTRA_ARGS = {"ContentType": "audio/wav", "CacheControl": IMMUTABLE_CACHE_CONTROL}
 
-    s3 = get_s3_client()
-    input_key = request.s3_key
 
-    # 入力ファイルをダウンロード
-    input_path = f"/tmp/input_{uuid.uuid4().hex}.wav"
-    try:
-        s3.download_file(S3_BUCKET, input_key, input_path)
-    except ClientError as e:
-        raise HTTPException(status_code=404, detail=f"Input file not found in S3: {e}")
+def _render_s3(
+    input_path: Path,
+    output_path: Path,
+    input_norm_path: Path,
+    output_norm_path: Path,
+    chain: CompiledChain,
+    normalization: str,
+    memory: MemoryTracker,
+    cancel: CancelToken,
+) -> RenderResult:
+    with track_render(cancel):
+        with memory.stage("render"):
+            result = render_file(
+                input_path, output_path, chain.build(), memory.block_frames, memory, cancel
+            )
+        # 表示用に正規化
+        cancel.check()
+        with memory.stage("normalize"):
+            write_display_versions(
+                input_path,
+                output_path,
+                input_norm_path,
+                output_norm_path,
+                result,
+                mode=normalization,
+            )
+        return result
+
+
+def _render_s3_stream(
+    s3,
+    input_key: str,
+    output_key: str,
+    size: int,
+    fmt: WavFormat,
+    first_part: bytes,
+    input_path: Path,
+    output_path: Path,
+    input_norm_path: Path,
+    output_norm_path: Path,
+    chain: CompiledChain,
+    normalization: str,
+    memory: MemoryTracker,
+    cancel: CancelToken,
+) -> RenderResult:
+    with track_render(cancel):
+        with memory.stage("stream"):
+            result = render_s3_stream(
+                s3,
+                S3_BUCKET,
+                input_key,
+                output_key,
+                size,
+                fmt,
+                first_part,
+                chain.build(),
+                memory,
+                input_path,
+                output_path,
+                S3_STREAM_PART_BYTES,
+                S3_STREAM_QUEUE_DEPTH,
+                S3_OUTPUT_EXTRA_ARGS,
+                cancel,
+            )
+        cancel.check()
+        with memory.stage("normalize"):
+            write_display_versions(
+                input_path,
+                output_path,
+                input_norm_path,
+                output_norm_path,
+                result,
+                mode=normalization,
+            )
+        return result
+
+
+@dataclass(frozen=True)
+class S3Outputs:
+    """S3 に書き出したレンダリング結果（同じ入力・チェーンのリクエストで共有する）"""
 
-    # エフェクトチェーンを構築・適用
-    effect_chain = [{"name": e.name, "params": e.params or {}} for e in request.effect_chain]
-    board = build_effect_chain(effect_chain)
+    output_id: str
+    output_key: str
+    input_norm_key: str
+    output_norm_key: str
+    stats: dict
+    profile_url: str | None
 
-    with AudioFile(input_path) as f:
-        audio = f.read(f.frames)
-        samplerate = f.samplerate
 
-    effected = board(audio, samplerate)
+def _cache_object_keys(cache: SharedRenderCache, cache_key: str) -> tuple[str, str, str] | None:
+    """2段目のキャッシュの出力・正規化ファイルのキー（出力と同じバケットになければ None）"""
+    keys = []
+    for name in (ARTIFACT_OUTPUT, ARTIFACT_INPUT_NORM, ARTIFACT_OUTPUT_NORM):
+        location = cache.location(cache_key, name)
+        if location is None or location[0] != S3_BUCKET:
+            return None
+        keys.append(location[1])
+    output_key, input_norm_key, output_norm_key = keys
+    return output_key, input_norm_key, output_norm_key
+
+
+async def _process_s3(
+    s3,
+    input_key: str,
+    size: int,
+    chain: CompiledChain,
+    normalization: str,
+    profile: bool,
+    cache: SharedRenderCache | None,
+    cache_key: str,
+    cancel: CancelToken,
+) -> S3Outputs:
+    """
+    S3 上の入力をレンダリングして出力と正規化ファイルを S3 に書き出す
+
+    2段目のキャッシュにあればレンダリングしない。キャッシュが出力と同じバケットにあれば、
+    成果物をそのまま返し、ミスの場合もキャッシュの位置に直接書き出す（最後に統計を書いて
+    揃ったことを示す）。S3_STREAM_MIN_BYTES 以上の WAV は、範囲指定のダウンロード・
+    レンダリング・マルチパートアップロードを並行に行う。それ以外はダウンロードしてから
+    処理する。cancel で中断された場合は一時ファイルと途中までの出力を削除する。
+    """
+    cache_keys = _cache_object_keys(cache, cache_key) if cache is not None else None
+    cached_stats = None
+    if cache is not None:
+        cached_stats = await cache.load_stats(cache_key)
+        if cached_stats is not None and cache_keys is not None:
+            output_key, input_norm_key, output_norm_key = cache_keys
+            return S3Outputs(
+                output_id=cache_key,
+                output_key=output_key,
+                input_norm_key=input_norm_key,
+                output_norm_key=output_norm_key,
+                stats=cached_stats,
+                profile_url=None,
+            )
+
+    # 大きな入力は先頭のパートでヘッダーを読み、ストリーミングできる WAV か判定する
+    first_part = b""
+    stream_format = None
+    if size >= S3_STREAM_MIN_BYTES and cached_stats is None:
+        first_part = await run_in_threadpool(
+            read_range, s3, S3_BUCKET, input_key, 0, min(size, S3_STREAM_PART_BYTES)
+        )
+        stream_format = parse_wav_header(first_part, size)
 
-    # 出力ファイルを書き込み
     output_id = uuid.uuid4().hex
     output_path = f"/tmp/output_{output_id}.wav"
-    with AudioFile(output_path, "w", samplerate, effected.shape[0]) as f:
-        f.write(effected)
-
-    # 表示用に正規化
     normalized_id = uuid.uuid4().hex
     input_norm_path = Path(f"/tmp/input_norm_{normalized_id}.wav")
     output_norm_path = Path(f"/tmp/output_norm_{normalized_id}.wav")
-    normalize_audio_for_display(Path(input_path), input_norm_path)
-    normalize_audio_for_display(Path(output_path), output_norm_path)
+    if cache_keys is not None:
+        output_id = cache_key
+        output_key, input_norm_key, output_norm_key = cache_keys
+    else:
+        output_key = f"{S3_OUTPUT_PREFIX}{output_id}.wav"
+        input_norm_key = f"{S3_OUTPUT_PREFIX}normalized/input_{normalized_id}.wav"
+        output_norm_key = f"{S3_OUTPUT_PREFIX}normalized/output_{normalized_id}.wav"
+    input_path = f"/tmp/input_{uuid.uuid4().hex}.wav"
+    stats_path = Path(f"/tmp/stats_{normalized_id}.json")
+    artifacts = {
+        ARTIFACT_OUTPUT: Path(output_path),
+        ARTIFACT_INPUT_NORM: input_norm_path,
+        ARTIFACT_OUTPUT_NORM: output_norm_path,
+        ARTIFACT_STATS: stats_path,
+    }
+
+    uploads = [(input_norm_path, input_norm_key), (output_norm_path, output_norm_key)]
+    # 中断・失敗した場合に削除する、アップロード済みのキー
+    uploaded: list[str] = []
+    profiler = None
+    try:
+        fetched = (
+            cached_stats is not None
+            and cache is not None
+            and await cache.fetch(cache_key, artifacts)
+        )
+        if fetched:
+            # 他のインスタンスのレンダリング結果を取り出してアップロードする
+            stats = json.loads(stats_path.read_text())
+            uploads.insert(0, (Path(output_path), output_key))
+        elif stream_format is not None:
+            # 出力はレンダリングしながらアップロードする。アップロードの完了後（正規化中）に
+            # 中断・失敗しても出力を残さないよう、先に削除の対象にしておく
+            uploaded.append(output_key)
+            max_block_frames = max(1, S3_STREAM_PART_BYTES // stream_format.block_align)
+            async with admit_frames(
+                stream_format.frames,
+                stream_format.num_channels,
+                stream_format.samplerate,
+                chain,
+                max_block_frames,
+            ) as memory:
+                try:
+                    result, profiler = await run_render(
+                        profile,
+                        _render_s3_stream,
+                        s3,
+                        input_key,
+                        output_key,
+                        size,
+                        stream_format,
+                        first_part,
+                        Path(input_path),
+                        Path(output_path),
+                        input_norm_path,
+                        output_norm_path,
+                        chain,
+                        normalization,
+                        memory,
+                        cancel,
+                    )
+                except ClientError as e:
+                    raise HTTPException(status_code=500, detail=f"S3 streaming failed: {e}")
+        else:
+            # 入力ファイルをダウンロード
+            cancel.check()
+            try:
+                await run_in_threadpool(s3.download_file, S3_BUCKET, input_key, input_path)
+            except ClientError as e:
+                raise HTTPException(status_code=404, detail=f"Input file not found in S3: {e}")
 
-    # S3にアップロード（出力 + 正規化ファイル）
-    output_key = f"{S3_OUTPUT_PREFIX}{output_id}.wav"
-    input_norm_key = f"{S3_OUTPUT_PREFIX}normalized/input_{normalized_id}.wav"
-    output_norm_key = f"{S3_OUTPUT_PREFIX}normalized/output_{normalized_id}.wav"
+            # エフェクトチェーンを適用して出力ファイルを書き込み（同時に入出力を解析）
+            async with admit_render(Path(input_path), chain) as memory:
+                result, profiler = await run_render(
+                    profile,
+                    _render_s3,
+                    Path(input_path),
+                    Path(output_path),
+                    input_norm_path,
+                    output_norm_path,
+                    chain,
+                    normalization,
+                    memory,
+                    cancel,
+                )
+            uploads.insert(0, (Path(output_path), output_key))
+        if not fetched:
+            stats = _stats_payload(result)
+            stats_path.write_text(json.dumps(stats))
 
+        # S3にアップロード（出力 + 正規化ファイル）
+        try:
+            for path, key in uploads:
+                cancel.check()
+                await run_in_threadpool(
+                    s3.upload_file, str(path), S3_BUCKET, key, ExtraArgs=S3_OUTPUT_EXTRA_ARGS
+                )
+                uploaded.append(key)
+        except ClientError as e:
+            raise HTTPException(status_code=500, detail=f"Failed to upload output to S3: {e}")
+    except BaseException:
+        # 中断・失敗したら一時ファイルと途中までの出力を残さない
+        _remove_files([Path(input_path), *artifacts.values()])
+        for key in uploaded:
+            with suppress(ClientError):
+                await run_in_threadpool(s3.delete_object, Bucket=S3_BUCKET, Key=key)
+        raise
+
+    # 一時ファイルを削除（2段目のキャッシュへの保存後に削除するものは残す）
+    _remove_files([Path(input_path)])
+    files = list(artifacts.values())
+    if cache is not None and not fetched:
+        # キャッシュの位置に書き出した場合は、残りの統計だけを保存する
+        stored = {ARTIFACT_STATS: stats_path} if cache_keys is not None else artifacts
+        await cache.store(cache_key, stored, on_done=lambda: _remove_files(files))
+    else:
+        _remove_files(files)
+
+    return S3Outputs(
+        output_id=output_id,
+        output_key=output_key,
+        input_norm_key=input_norm_key,
+        output_norm_key=output_norm_key,
+        stats=stats,
+        profile_url=await publish_profile(profiler),
+    )
+
+
+@router.post("/s3-process", response_model=S3ProcessResponse)
+async def process_s3_audio(request: S3ProcessRequest, http_request: Request):
+    """
+    S3上の音声ファイルを処理
+
+    同じ入力（キーと ETag）・チェーンを処理中のリクエストはその結果を共有し、
+    Idempotency-Key ヘッダーが同じ再試行には完了済みの応答を返す。クライアントの
+    切断・期限切れでは待つのをやめ、誰も待っていなければ処理を中断する。
+    """
+    if not S3_BUCKET:
+        raise HTTPException(status_code=500, detail="S3 bucket not configured")
+    idempotency = idempotency_key(http_request, "s3-process", request)
+    if (replayed := replay_response(idempotency)) is not None:
+        return replayed
+
+    chain = compile_request_chain(request.effect_chain)
+    normalization = request.normalization or DISPLAY_NORMALIZATION
+
+    s3 = get_s3_client()
+    input_key = request.s3_key
     try:
-        extra_args = {"ContentType": "audio/wav"}
-        s3.upload_file(output_path, S3_BUCKET, output_key, ExtraArgs=extra_args)
-        s3.upload_file(str(input_norm_path), S3_BUCKET, input_norm_key, ExtraArgs=extra_args)
-        s3.upload_file(str(output_norm_path), S3_BUCKET, output_norm_key, ExtraArgs=extra_args)
+        head = await run_in_threadpool(s3.head_object, Bucket=S3_BUCKET, Key=input_key)
     except ClientError as e:
-        raise HTTPException(status_code=500, detail=f"Failed to upload output to S3: {e}")
+        raise HTTPException(status_code=404, detail=f"Input file not found in S3: {e}")
+
+    profile = profiling_requested(http_request)
+    flight = ("s3-process", input_key, head.get("ETag"), chain.key, normalization)
+    # 2段目のキャッシュは入力の内容で引く（ETag はオブジェクトの内容から決まる）
+    etag = head.get("ETag")
+    cache = shared_cache if etag else None
+    cache_key = render_key(f"s3:{etag}", chain, normalization)
+    outputs = await until_abandoned(
+        http_request,
+        render_flights.run(
+            flight,
+            lambda cancel: _process_s3(
+                s3,
+                input_key,
+                head["ContentLength"],
+                chain,
+                normalization,
+                profile,
+                cache,
+                cache_key,
+                cancel,
+            ),
+        ),
+    )
 
     # ダウンロード用Presigned URLを生成（元のファイル名 + ランダム文字列）
     if request.original_filename:
         base_name = Path(request.original_filename).stem
     else:
         base_name = "output"
-    short_id = output_id[:8]
+    short_id = outputs.output_id[:8]
     download_filename = f"{base_name}_{short_id}.wav"
     # RFC 5987 形式で UTF-8 ファイル名をエンコード
     encoded_filename = quote(download_filename)
@@ -254,34 +1160,115 @@ async def process_s3_audio(request: S3ProcessRequest):
         "get_object",
         Params={
             "Bucket": S3_BUCKET,
-            "Key": output_key,
+            "Key": outputs.output_key,
             "ResponseContentDisposition": f"attachment; filename*=UTF-8''{encoded_filename}",
         },
         ExpiresIn=PRESIGNED_URL_EXPIRATION,
     )
     input_norm_url = s3.generate_presigned_url(
         "get_object",
-        Params={"Bucket": S3_BUCKET, "Key": input_norm_key},
+        Params={"Bucket": S3_BUCKET, "Key": outputs.input_norm_key},
         ExpiresIn=PRESIGNED_URL_EXPIRATION,
     )
     output_norm_url = s3.generate_presigned_url(
         "get_object",
-        Params={"Bucket": S3_BUCKET, "Key": output_norm_key},
+        Params={"Bucket": S3_BUCKET, "Key": outputs.output_norm_key},
         ExpiresIn=PRESIGNED_URL_EXPIRATION,
     )
 
-    # 一時ファイルを削除
-    os.remove(input_path)
-    os.remove(output_path)
-    os.remove(input_norm_path)
-    os.remove(output_norm_path)
-
-    return S3ProcessResponse(
-        output_key=output_key,
+    response = S3ProcessResponse(
+        output_key=outputs.output_key,
         download_url=download_url,
         effects_applied=[e.name for e in request.effect_chain],
         input_normalized_url=input_norm_url,
         output_normalized_url=output_norm_url,
+        input_stats=AudioStats(**outputs.stats["input"]),
+        output_stats=AudioStats(**outputs.stats["output"]),
+        profile_url=outputs.profile_url,
+    )
+    remember_response(idempotency, response)
+    return response
+
+
+@router.post("/s3-bulk-process", response_model=S3BulkProcessResponse)
+async def bulk_process_s3_audio(request: S3BulkProcessRequest):
+    """
+    S3上の複数の音声ファイルに同じエフェクトチェーンを適用
+
+    最大 BULK_MAX_WORKERS 件を並行に処理し、出力はジョブ毎のプレフィックス
+    （output/bulk/{job_id}/）の下に manifest.json と共に書き出す。
+    """
+    if not S3_BUCKET:
+        raise HTTPException(status_code=500, detail="S3 bucket not configured")
+
+    chain = compile_request_chain(request.effect_chain)
+    keys = _bulk_inputs(request.s3_keys)
+    s3 = get_s3_client()
+    job_prefix = f"{S3_OUTPUT_PREFIX}bulk/{uuid.uuid4().hex}/"
+    # 別のプレフィックスに同名のファイルがあっても衝突しないよう連番を付ける
+    output_keys = {key: f"{job_prefix}{i:04d}_{Path(key).stem}.wav" for i, key in enumerate(keys)}
+
+    async def render_one(input_key: str) -> str:
+        file_id = uuid.uuid4().hex
+        input_path = Path(f"/tmp/input_{file_id}.wav")
+        output_path = Path(f"/tmp/output_{file_id}.wav")
+        try:
+            try:
+                await run_in_threadpool(s3.download_file, S3_BUCKET, input_key, str(input_path))
+            except ClientError as e:
+                raise HTTPException(status_code=404, detail=f"Input file not found in S3: {e}")
+            async with admit_render(input_path, chain) as memory:
+                await run_in_threadpool(
+                    render_file, input_path, output_path, chain.build(), memory.block_frames, memory
+                )
+            await run_in_threadpool(
+                s3.upload_file,
+                str(output_path),
+                S3_BUCKET,
+                output_keys[input_key],
+                ExtraArgs=S3_OUTPUT_EXTRA_ARGS,
+            )
+            return output_keys[input_key]
+        finally:
+            input_path.unlink(missing_ok=True)
+            output_path.unlink(missing_ok=True)
+
+    results = {}
+    async for input_key, result in map_bounded(keys, render_one, BULK_MAX_WORKERS):
+        if isinstance(result, BaseException):
+            results[input_key] = BulkFileResult(input=input_key, error=_error_detail(result))
+        else:
+            download_url = s3.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": S3_BUCKET, "Key": result},
+                ExpiresIn=PRESIGNED_URL_EXPIRATION,
+            )
+            results[input_key] = BulkFileResult(
+                input=input_key, output_key=result, download_url=download_url
+            )
+
+    files = [results[key] for key in keys]
+    effects_applied = [e.name for e in request.effect_chain]
+    manifest_key = f"{job_prefix}manifest.json"
+    manifest = {
+        "effects_applied": effects_applied,
+        "files": [f.model_dump(exclude={"download_url"}, exclude_none=True) for f in files],
+    }
+    try:
+        s3.put_object(
+            Bucket=S3_BUCKET,
+            Key=manifest_key,
+            Body=json.dumps(manifest, indent=2).encode(),
+            ContentType="application/json",
+        )
+    except ClientError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload manifest to S3: {e}")
+
+    return S3BulkProcessResponse(
+        job_prefix=job_prefix,
+        manifest_key=manifest_key,
+        effects_applied=effects_applied,
+        files=files,
     )
 
 
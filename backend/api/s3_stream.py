@@ -0,0 +1,125 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+from pedalboard import Pedalboard
+
+from lib import (
+    BackgroundConsumer,
+    CancelToken,
+    MemoryTracker,
+    RenderResult,
+    WavFormat,
+    prefetch,
+    render_wav_stream,
+)
+
+
+def read_range(s3, bucket: str, key: str, start: int, end: int) -> bytes:
+    """オブジェクトの [start, end) のバイト列を取得"""
+    response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")
+    return response["Body"].read()
+
+
+def ranged_parts(
+    s3, bucket: str, key: str, size: int, part_bytes: int, first_part: bytes = b""
+) -> Iterator[bytes]:
+    """オブジェクトを先頭から part_bytes ずつ範囲指定で取得（取得済みの first_part に続ける）"""
+    if first_part:
+        yield first_part
+    start = len(first_part)
+    while start < size:
+        end = min(start + part_bytes, size)
+        yield read_range(s3, bucket, key, start, end)
+        start = end
+
+
+def upload_parts(
+    s3, bucket: str, key: str, chunks: Iterator[bytes], part_bytes: int, extra_args: dict
+) -> int:
+    """
+    chunks を part_bytes 以上ずつにまとめてマルチパートアップロードし、総バイト数を返す
+
+    途中で失敗した（chunks が例外を送出した場合を含む）ときはアップロードを中止し、
+    未完了のパートを残さない。
+    """
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **extra_args)["UploadId"]
+    parts: list[dict] = []
+    buffer = bytearray()
+    total = 0
+
+    def flush() -> None:
+        number = len(parts) + 1
+        response = s3.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=bytes(buffer)
+        )
+        parts.append({"ETag": response["ETag"], "PartNumber": number})
+        buffer.clear()
+
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            total += len(chunk)
+            if len(buffer) >= part_bytes:
+                flush()
+        if buffer or not parts:
+            flush()
+        s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return total
+
+
+def render_s3_stream(
+    s3,
+    bucket: str,
+    input_key: str,
+    output_key: str,
+    size: int,
+    fmt: WavFormat,
+    first_part: bytes,
+    board: Pedalboard,
+    memory: MemoryTracker,
+    input_copy: Path,
+    output_copy: Path,
+    part_bytes: int,
+    queue_depth: int,
+    extra_args: dict,
+    cancel: CancelToken | None = None,
+) -> RenderResult:
+    """
+    範囲指定のダウンロード → デコード・レンダリング・エンコード → マルチパートアップロード
+
+    ダウンロードとアップロードは別スレッドで行い、各段を最大 queue_depth 件の待ち行列で
+    つなぐため、ネットワークと DSP が重なり、所要時間は両者の和ではなく大きい方に近づく。
+    表示用の正規化に使うため、入出力のバイト列はローカルにも書き出す。中断された場合は
+    マルチパートアップロードを中止する。
+    """
+    block_frames = memory.block_frames or max(1, part_bytes // fmt.block_align)
+    uploader: BackgroundConsumer[bytes, int] = BackgroundConsumer(
+        lambda chunks: upload_parts(s3, bucket, output_key, chunks, part_bytes, extra_args),
+        queue_depth,
+    )
+    try:
+        with open(input_copy, "wb") as input_file, open(output_copy, "wb") as output_file:
+
+            def downloaded() -> Iterator[bytes]:
+                parts = ranged_parts(s3, bucket, input_key, size, part_bytes, first_part)
+                for part in prefetch(parts, queue_depth):
+                    input_file.write(part)
+                    yield part
+
+            def write(data: bytes) -> None:
+                output_file.write(data)
+                uploader.put(data)
+
+            result = render_wav_stream(
+                downloaded(), fmt, board, write, block_frames, memory, cancel
+            )
+    except BaseException as e:
+        uploader.abort(e)
+        raise
+    uploader.close()
+    return result
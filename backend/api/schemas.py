@@ -1,4 +1,9 @@
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+NormalizationMode = Literal["peak", "loudness"]
+DirectRenderMode = Literal["audio", "peaks"]
 
 
 class EffectConfig(BaseModel):
@@ -8,11 +13,21 @@ class EffectConfig(BaseModel):
     params: dict | None = None
 
 
+class AudioStats(BaseModel):
+    """音声のピーク・ラウドネス統計（無音の場合は None）"""
+
+    sample_peak_db: float | None
+    true_peak_db: float | None
+    rms_db: float | None
+    integrated_lufs: float | None
+
+
 class ProcessRequest(BaseModel):
     """音声処理リクエスト"""
 
     input_file: str
     effect_chain: list[EffectConfig]
+    normalization: NormalizationMode | None = None
 
 
 class ProcessResponse(BaseModel):
@@ -23,6 +38,52 @@ class ProcessResponse(BaseModel):
     effects_applied: list[str]
     input_normalized: str
     output_normalized: str
+    input_stats: AudioStats | None = None
+    output_stats: AudioStats | None = None
+    profile_url: str | None = None
+
+
+class BulkProcessRequest(BaseModel):
+    """一括処理リクエスト（input_files を省略すると入力ディレクトリの全 WAV）"""
+
+    input_files: list[str] | None = None
+    effect_chain: list[EffectConfig]
+
+
+class DirectRenderResponse(BaseModel):
+    """直接処理のレスポンス（response=peaks の場合、音声の代わりに波形を返す）"""
+
+    effects_applied: list[str]
+    samplerate: float
+    frames: int
+    input_peaks: list[float]
+    output_peaks: list[float]
+    input_stats: AudioStats
+    output_stats: AudioStats
+    profile_url: str | None = None
+
+
+class EstimateRequest(BaseModel):
+    """レンダリング時間見積もりリクエスト（input_file か duration_seconds を指定）"""
+
+    effect_chain: list[EffectConfig]
+    input_file: str | None = None
+    # 範囲外（負・0・巨大な値）は 422 にする（フレーム数の計算で溢れないよう上限も設ける）
+    duration_seconds: float | None = Field(default=None, gt=0, le=24 * 3600)
+    num_channels: int = Field(default=2, ge=1, le=64)
+    samplerate: float = Field(default=44100, gt=0, le=768000)
+
+
+class EstimateResponse(BaseModel):
+    """レンダリング時間見積もりレスポンス"""
+
+    estimated_seconds: float
+    base_seconds: float
+    stage_seconds: dict[str, float]
+    tail_seconds: float
+    frames: int
+    num_channels: int
+    samplerate: float
 
 
 # S3 Upload schemas
@@ -46,6 +107,7 @@ class S3ProcessRequest(BaseModel):
     s3_key: str
     effect_chain: list[EffectConfig]
     original_filename: str | None = None
+    normalization: NormalizationMode | None = None
 
 
 class S3ProcessResponse(BaseModel):
@@ -56,3 +118,31 @@ class S3ProcessResponse(BaseModel):
     effects_applied: list[str]
     input_normalized_url: str
     output_normalized_url: str
+    input_stats: AudioStats | None = None
+    output_stats: AudioStats | None = None
+    profile_url: str | None = None
+
+
+class S3BulkProcessRequest(BaseModel):
+    """S3一括処理リクエスト"""
+
+    s3_keys: list[str]
+    effect_chain: list[EffectConfig]
+
+
+class BulkFileResult(BaseModel):
+    """一括処理のファイル毎の結果（失敗時は error のみ）"""
+
+    input: str
+    output_key: str | None = None
+    download_url: str | None = None
+    error: str | None = None
+
+
+class S3BulkProcessResponse(BaseModel):
+    """S3一括処理レスポンス"""
+
+    job_prefix: str
+    manifest_key: str
+    effects_applied: list[str]
+    files: list[BulkFileResult]
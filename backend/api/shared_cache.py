@@ -0,0 +1,100 @@
+import logging
+from collections.abc import Callable, Mapping
+from pathlib import Path
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+
+from lib import DirectoryRenderCache, RenderCache, S3RenderCache, WriteBehind
+
+from .config import (
+    RENDER_CACHE_BACKEND,
+    RENDER_CACHE_DIR,
+    RENDER_CACHE_MAX_BYTES,
+    RENDER_CACHE_MAX_PENDING,
+    RENDER_CACHE_PREFIX,
+    S3_BUCKET,
+)
+from .http_cache import IMMUTABLE_CACHE_CONTROL
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRenderCache:
+    """
+    2段目のキャッシュの参照と保存
+
+    キャッシュの障害でリクエストを失敗させないよう、参照の失敗はログに残して
+    キャッシュミスとして扱う。write_behind なら保存はレスポンス後に別スレッドで行い、
+    そうでなければ（Lambda ではスレッドが呼び出しの合間に止まるため）保存を待つ。
+    """
+
+    def __init__(
+        self,
+        cache: RenderCache,
+        max_pending: int = RENDER_CACHE_MAX_PENDING,
+        write_behind: bool = True,
+    ):
+        self.cache = cache
+        self.writer = WriteBehind(cache, max_pending)
+        self.write_behind = write_behind
+
+    async def load_stats(self, key: str) -> dict | None:
+        """レンダリング前の存在確認（揃っていれば統計を返す）"""
+        try:
+            return await run_in_threadpool(self.cache.load_stats, key)
+        except Exception:
+            logger.warning("render cache lookup failed: %s", key, exc_info=True)
+            return None
+
+    async def fetch(self, key: str, files: Mapping[str, Path]) -> bool:
+        """揃っていれば成果物を files のパスに取り出す"""
+        if await self.load_stats(key) is None:
+            return False
+        try:
+            return await run_in_threadpool(self.cache.fetch, key, files)
+        except Exception:
+            logger.warning("render cache fetch failed: %s", key, exc_info=True)
+            return False
+
+    def location(self, key: str, name: str) -> tuple[str, str] | None:
+        return self.cache.location(key, name)
+
+    async def store(
+        self, key: str, files: Mapping[str, Path], on_done: Callable[[], None] | None = None
+    ) -> None:
+        """成果物を保存（write_behind なら予約だけ行う。保存後に on_done を呼ぶ）"""
+        if not self.write_behind:
+            if not await run_in_threadpool(self.writer.store_now, key, files, on_done):
+                logger.warning("render cache write failed: %s", key)
+        elif not self.writer.submit(key, files, on_done):
+            logger.warning("render cache write-back queue is full; skipped %s", key)
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": RENDER_CACHE_BACKEND,
+            "write_behind": self.write_behind,
+            **self.writer.snapshot(),
+        }
+
+
+def create_shared_cache(client_factory: Callable[[], Any]) -> SharedRenderCache | None:
+    """RENDER_CACHE_BACKEND に応じた2段目のキャッシュ（未設定なら None）"""
+    if not RENDER_CACHE_BACKEND:
+        return None
+    if RENDER_CACHE_BACKEND == "directory":
+        return SharedRenderCache(DirectoryRenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES))
+    if RENDER_CACHE_BACKEND == "s3":
+        if not S3_BUCKET:
+            logger.warning("RENDER_CACHE_BACKEND=s3 requires AUDIO_BUCKET; render cache disabled")
+            return None
+        return SharedRenderCache(
+            S3RenderCache(
+                S3_BUCKET,
+                RENDER_CACHE_PREFIX,
+                client_factory,
+                {"ContentType": "audio/wav", "CacheControl": IMMUTABLE_CACHE_CONTROL},
+            ),
+            write_behind=False,
+        )
+    raise ValueError(f"Unknown RENDER_CACHE_BACKEND: {RENDER_CACHE_BACKEND}")
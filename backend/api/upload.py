@@ -0,0 +1,85 @@
+import io
+from dataclasses import dataclass, field
+from typing import BinaryIO
+
+from fastapi import HTTPException, Request
+from python_multipart import create_form_parser
+from python_multipart.multipart import Field, File
+
+# multipart で音声を受け取るフィールド名
+AUDIO_FIELD = "file"
+
+
+@dataclass
+class DirectUpload:
+    """リクエストボディから受け取った音声とフォームフィールド"""
+
+    audio: BinaryIO
+    size: int
+    filename: str | None = None
+    fields: dict[str, str] = field(default_factory=dict)
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    # 大きなファイルは Presigned URL で S3 に直接アップロードしてもらう
+    return HTTPException(
+        status_code=413,
+        detail=(
+            f"Upload exceeds {max_bytes} bytes; "
+            "use /api/upload-url and /api/s3-process for large files"
+        ),
+        headers={"Link": '</api/upload-url>; rel="alternate"'},
+    )
+
+
+async def read_upload(request: Request, max_bytes: int) -> DirectUpload:
+    """
+    multipart/form-data（音声は file フィールド）または生のボディを受信しながら解析
+
+    受信したチャンクは到着順にパーサーへ渡し、音声はメモリ上のバッファに書き込む。
+    Content-Length が max_bytes を超える場合は受信前に、ない場合（chunked）は
+    受信量が超えた時点で 413 を返す。
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+        raise _too_large(max_bytes)
+
+    content_type = request.headers.get("content-type", "")
+    upload = DirectUpload(audio=io.BytesIO(), size=0)
+    parser = None
+    if content_type.startswith("multipart/form-data"):
+
+        def on_field(form_field: Field) -> None:
+            name = form_field.field_name.decode() if form_field.field_name else ""
+            upload.fields[name] = (form_field.value or b"").decode()
+
+        def on_file(form_file: File) -> None:
+            if form_file.field_name != AUDIO_FIELD.encode():
+                return
+            upload.audio = form_file.file_object
+            if form_file.file_name:
+                upload.filename = form_file.file_name.decode()
+
+        # ファイルはディスクに書き出さずメモリ上に保持する（上限は max_bytes）
+        parser = create_form_parser(
+            {"Content-Type": content_type.encode()},
+            on_field,
+            on_file,
+            config={"MAX_MEMORY_FILE_SIZE": max_bytes + 1},
+        )
+
+    async for chunk in request.stream():
+        upload.size += len(chunk)
+        if upload.size > max_bytes:
+            raise _too_large(max_bytes)
+        if parser is not None:
+            parser.write(chunk)
+        else:
+            upload.audio.write(chunk)
+
+    if parser is not None:
+        parser.finalize()
+    if upload.audio.seek(0, io.SEEK_END) == 0:
+        raise HTTPException(status_code=400, detail="No audio data in request body")
+    upload.audio.seek(0)
+    return upload
@@ -1,6 +1,19 @@
+import logging
+
 from mangum import Mangum
 
+from api.config import COST_MODEL_CALIBRATE, COST_MODEL_PATH, WARMUP_ON_STARTUP
+from lib import load_cost_model, warm_up
 from main import app
 
+# Lambda ではライフスパンを使わないため、初期化フェーズでコストモデルの読み込みと
+# ウォームアップを行う（プロビジョニング済み同時実行ではリクエスト前に済む）
+load_cost_model(COST_MODEL_PATH, COST_MODEL_CALIBRATE)
+if WARMUP_ON_STARTUP:
+    warm_up()
+
+# レンダリングのメモリ使用量・プロファイルのログを CloudWatch に出す
+logging.getLogger("api").setLevel(logging.INFO)
+
 # Lambda handler using Mangum to wrap FastAPI
 handler = Mangum(app, lifespan="off")
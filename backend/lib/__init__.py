@@ -1,9 +1,104 @@
+from .admission import AdmissionController, Overloaded, RenderCost, estimate_render_cost
+from .analysis import LoudnessMeter, LoudnessStats, display_gains, waveform_peaks
 from .audio import normalize_audio_for_display
+from .bulk import ZipStream, map_bounded
+from .cancellation import CancellationMetrics, Cancelled, CancelToken
+from .chain import CompiledChain, EffectChainError, EffectStage, compile_effect_chain
+from .coalesce import IdempotencyStore, SingleFlight, StoredResponse
+from .costs import (
+    CostModel,
+    EffectCost,
+    RenderEstimate,
+    calibrate,
+    current_cost_model,
+    estimate_render,
+    load_cost_model,
+)
 from .effects import EFFECT_MAPPING, build_effect_chain, get_default_effect_chain
+from .janitor import OutputJanitor, SweepResult
+from .memory import MemoryMetrics, MemoryTracker, StageMemory, plan_block_frames
+from .prerender import Prerenderer, PrerenderJob, PrerenderResult, RequestPopularity
+from .profiling import SamplingProfiler
+from .render import RenderResult, render_file, write_display_versions
+from .render_cache import (
+    ARTIFACT_INPUT_NORM,
+    ARTIFACT_OUTPUT,
+    ARTIFACT_OUTPUT_NORM,
+    ARTIFACT_STATS,
+    DirectoryRenderCache,
+    RenderCache,
+    S3RenderCache,
+    WriteBehind,
+)
+from .streaming import (
+    BackgroundConsumer,
+    WavFormat,
+    parse_wav_header,
+    prefetch,
+    render_wav_stream,
+)
+from .warmup import WarmupReport, last_warmup, warm_up
 
 __all__ = [
+    "ARTIFACT_INPUT_NORM",
+    "ARTIFACT_OUTPUT",
+    "ARTIFACT_OUTPUT_NORM",
+    "ARTIFACT_STATS",
+    "AdmissionController",
+    "BackgroundConsumer",
+    "CancelToken",
+    "CancellationMetrics",
+    "Cancelled",
     "EFFECT_MAPPING",
+    "CompiledChain",
+    "CostModel",
+    "DirectoryRenderCache",
+    "EffectCost",
+    "EffectChainError",
+    "EffectStage",
+    "IdempotencyStore",
+    "LoudnessMeter",
+    "LoudnessStats",
+    "MemoryMetrics",
+    "MemoryTracker",
+    "OutputJanitor",
+    "Overloaded",
+    "PrerenderJob",
+    "PrerenderResult",
+    "Prerenderer",
+    "RenderCache",
+    "RenderCost",
+    "RenderEstimate",
+    "RenderResult",
+    "RequestPopularity",
+    "S3RenderCache",
+    "SamplingProfiler",
+    "SingleFlight",
+    "StageMemory",
+    "StoredResponse",
+    "SweepResult",
+    "WarmupReport",
+    "WavFormat",
+    "WriteBehind",
+    "ZipStream",
     "build_effect_chain",
+    "calibrate",
+    "compile_effect_chain",
+    "current_cost_model",
+    "display_gains",
+    "estimate_render",
+    "estimate_render_cost",
     "get_default_effect_chain",
+    "last_warmup",
+    "load_cost_model",
+    "map_bounded",
     "normalize_audio_for_display",
+    "parse_wav_header",
+    "plan_block_frames",
+    "prefetch",
+    "render_file",
+    "render_wav_stream",
+    "warm_up",
+    "waveform_peaks",
+    "write_display_versions",
 ]
@@ -0,0 +1,223 @@
+import asyncio
+import math
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+from pedalboard import Chorus, Compressor, Delay, Distortion, Gain, Reverb
+
+from .chain import CompiledChain
+from .costs import CostModel, estimate_render
+from .memory import render_working_set
+
+# 1サンプル・1チャンネルあたりの処理時間の目安（ナノ秒、コストモデル未計測時に使用）
+EFFECT_NS_PER_SAMPLE = {
+    Gain: 2.0,
+    Distortion: 10.0,
+    Chorus: 30.0,
+    Delay: 15.0,
+    Compressor: 20.0,
+    Reverb: 60.0,
+}
+# デコード・エンコード・解析・表示用正規化の分
+BASE_NS_PER_SAMPLE = 40.0
+
+
+@dataclass(frozen=True)
+class RenderCost:
+    """レンダリング1件の推定コスト"""
+
+    cpu_seconds: float
+    memory_bytes: int
+
+
+def estimate_render_cost(
+    frames: int,
+    num_channels: int,
+    chain: CompiledChain,
+    samplerate: float = 44100,
+    model: CostModel | None = None,
+    block_frames: int | None = None,
+) -> RenderCost:
+    """
+    フレーム数・チャンネル数・エフェクトチェーンからコストを推定（計測済みのモデルを優先）
+
+    block_frames を指定すると、分割処理した場合のメモリ量で見積もる。
+    """
+    samples = frames * num_channels
+    if model is not None:
+        cpu_seconds = estimate_render(chain, frames, num_channels, samplerate, model).seconds
+    else:
+        ns_per_sample = BASE_NS_PER_SAMPLE + sum(
+            EFFECT_NS_PER_SAMPLE.get(stage.effect_class, BASE_NS_PER_SAMPLE)
+            for stage in chain.stages
+        )
+        cpu_seconds = samples * ns_per_sample * 1e-9
+    return RenderCost(
+        cpu_seconds=cpu_seconds,
+        memory_bytes=render_working_set(frames, num_channels, block_frames),
+    )
+
+
+class Overloaded(Exception):
+    """受け付け上限を超えた"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    cost: RenderCost
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future
+
+
+class AdmissionController:
+    """
+    コストに応じたレンダリングの受け付け制御
+
+    実行中のレンダリングの同時数・推定 CPU 秒・推定メモリの合計が予算内に収まる間は
+    受け付け、超える場合は最大 max_queue 件まで FIFO で待たせる。待ち行列が一杯の場合や
+    max_wait_seconds 以内に受け付けられない場合は Overloaded を送出する。
+    何も実行していないときは予算を超える1件でも受け付ける（飢餓を防ぐ）。
+
+    Lambda ではリクエスト毎にイベントループが変わるため、状態はスレッドロックで守り、
+    待機中のリクエストは各自のループ上の Future で起こす。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        cpu_budget_seconds: float,
+        memory_budget_bytes: int,
+        max_queue: int,
+        max_wait_seconds: float,
+    ):
+        self.max_concurrency = max_concurrency
+        self.cpu_budget_seconds = cpu_budget_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self._waiters: deque[_Waiter] = deque()
+        self._running = 0
+        self._cpu_seconds = 0.0
+        self._memory_bytes = 0
+        self._admitted_total = 0
+        self._rejected_total = 0
+
+    def _fits(self, cost: RenderCost) -> bool:
+        if self._running == 0:
+            return True
+        return (
+            self._running < self.max_concurrency
+            and self._cpu_seconds + cost.cpu_seconds <= self.cpu_budget_seconds
+            and self._memory_bytes + cost.memory_bytes <= self.memory_budget_bytes
+        )
+
+    def _acquire(self, cost: RenderCost) -> None:
+        self._running += 1
+        self._cpu_seconds += cost.cpu_seconds
+        self._memory_bytes += cost.memory_bytes
+        self._admitted_total += 1
+
+    def _retry_after(self) -> int:
+        # 実行中の処理が並列に捌けるまでの目安
+        return max(1, math.ceil(self._cpu_seconds / max(1, self.max_concurrency)))
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._fits(self._waiters[0].cost):
+            waiter = self._waiters.popleft()
+            self._acquire(waiter.cost)
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def _release(self, cost: RenderCost) -> None:
+        with self._lock:
+            self._running -= 1
+            self._cpu_seconds = max(0.0, self._cpu_seconds - cost.cpu_seconds)
+            self._memory_bytes = max(0, self._memory_bytes - cost.memory_bytes)
+            self._wake_waiters()
+
+    @asynccontextmanager
+    async def admit(self, cost: RenderCost):
+        """予算内に収まるまで待ってから処理を実行"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._fits(cost):
+                self._acquire(cost)
+                waiter = None
+            elif len(self._waiters) >= self.max_queue:
+                self._rejected_total += 1
+                raise Overloaded("Render queue is full", self._retry_after())
+            else:
+                waiter = _Waiter(cost=cost, loop=loop, future=loop.create_future())
+                self._waiters.append(waiter)
+
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait_seconds)
+            except asyncio.TimeoutError as e:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                        self._rejected_total += 1
+                        self._wake_waiters()
+                        raise Overloaded(
+                            "Timed out waiting for render capacity", self._retry_after()
+                        ) from e
+                # タイムアウトと同時に受け付けられた場合はそのまま処理する
+            except asyncio.CancelledError:
+                with self._lock:
+                    admitted = waiter not in self._waiters
+                    if not admitted:
+                        self._waiters.remove(waiter)
+                        self._wake_waiters()
+                if admitted:
+                    self._release(cost)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(cost)
+
+    @contextmanager
+    def reserve(self, cost: RenderCost):
+        """
+        待たずに受け付けられる場合だけ処理を実行（空いていなければ Overloaded）
+
+        事前レンダリングなどのバックグラウンド処理用。ライブのリクエストと同じ予算に
+        計上するが、待ち行列には並ばず、待っているリクエストがあれば譲る。
+        """
+        with self._lock:
+            if self._waiters or not self._fits(cost):
+                raise Overloaded("No spare render capacity", self._retry_after())
+            self._acquire(cost)
+        try:
+            yield
+        finally:
+            self._release(cost)
+
+    def snapshot(self) -> dict:
+        """現在の負荷"""
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": len(self._waiters),
+                "max_concurrency": self.max_concurrency,
+                "cpu_seconds_in_flight": round(self._cpu_seconds, 3),
+                "cpu_budget_seconds": self.cpu_budget_seconds,
+                "memory_bytes_in_flight": self._memory_bytes,
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "admitted_total": self._admitted_total,
+                "rejected_total": self._rejected_total,
+            }
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,250 @@
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+from pedalboard import HighpassFilter, HighShelfFilter, Pedalboard
+from pedalboard.io import AudioFile
+
+# 1回の解析で扱う最大フレーム数（一時配列のサイズを抑える）
+ANALYSIS_CHUNK_FRAMES = 65536
+
+# ITU-R BS.1770 のゲーティング（100ms ステップ、400ms ブロック = 75% オーバーラップ）
+_STEP_SECONDS = 0.1
+_STEPS_PER_BLOCK = 4
+_ABSOLUTE_GATE_LUFS = -70.0
+_RELATIVE_GATE_LU = -10.0
+_LUFS_OFFSET = -0.691
+
+# True peak 用のオーバーサンプリング倍率と補間フィルタのタップ数
+TRUE_PEAK_OVERSAMPLING = 4
+_TRUE_PEAK_TAPS = 48
+
+
+def _true_peak_phases() -> np.ndarray:
+    """
+    4倍オーバーサンプリング用のポリフェーズ補間フィルタ（位相数 x 位相あたりのタップ数）
+
+    BS.1770 と同じく 48 タップの窓付き sinc を使う。各位相の DC ゲインを 1 に揃える。
+    """
+    n = np.arange(_TRUE_PEAK_TAPS) - (_TRUE_PEAK_TAPS - 1) / 2
+    taps = np.sinc(n / TRUE_PEAK_OVERSAMPLING) * np.kaiser(_TRUE_PEAK_TAPS, 4.0)
+    phases = taps.reshape(-1, TRUE_PEAK_OVERSAMPLING).T
+    return (phases / phases.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+_PHASES = _true_peak_phases()
+
+
+def _k_weighting() -> Pedalboard:
+    """
+    K 特性フィルタ
+
+    BS.1770 の高域シェルフを JUCE のシェルフで近似（48kHz の規格係数に対して誤差 0.05dB 以内）し、
+    RLB ハイパス（Q≈0.5）を同一周波数の1次ハイパス2段で構成する。
+    """
+    return Pedalboard(
+        [
+            HighShelfFilter(cutoff_frequency_hz=1475.0, gain_db=4.0, q=0.7),
+            HighpassFilter(cutoff_frequency_hz=38.135),
+            HighpassFilter(cutoff_frequency_hz=38.135),
+        ]
+    )
+
+
+def _to_db(value: float) -> float | None:
+    return 20 * math.log10(value) if value > 0 else None
+
+
+@dataclass(frozen=True)
+class LoudnessStats:
+    """音声のピーク・ラウドネス統計"""
+
+    sample_peak: float
+    true_peak: float
+    rms: float
+    integrated_lufs: float | None
+
+    def to_dict(self) -> dict:
+        """dBFS / LUFS 表記の辞書（無音の場合は None）"""
+        return {
+            "sample_peak_db": _to_db(self.sample_peak),
+            "true_peak_db": _to_db(self.true_peak),
+            "rms_db": _to_db(self.rms),
+            "integrated_lufs": self.integrated_lufs,
+        }
+
+
+def _interpolated_peak(padded: np.ndarray) -> float:
+    """補間フィルタを通したサンプルの最大絶対値"""
+    peak = 0.0
+    for channel in padded:
+        for phase in _PHASES:
+            interpolated = np.convolve(channel, phase, mode="valid")
+            peak = max(peak, float(np.max(np.abs(interpolated))))
+    return peak
+
+
+class LoudnessMeter:
+    """
+    チャンク単位で音声を受け取り、1パスでピーク・RMS・ラウドネスを計測
+
+    update() は (channels, frames) の float32 配列を順に受け取り、内部状態のみを更新する。
+    """
+
+    def __init__(self, samplerate: float, num_channels: int):
+        self.samplerate = samplerate
+        self.num_channels = num_channels
+        self._k_filter = _k_weighting()
+        # 補間フィルタに渡す直前のサンプル（チャンク境界をまたいで保持）
+        self._history = np.zeros((num_channels, _PHASES.shape[1] - 1), dtype=np.float32)
+        self._step_frames = max(1, round(samplerate * _STEP_SECONDS))
+        self._step_energies: list[float] = []
+        self._pending_energy = 0.0
+        self._pending_frames = 0
+        self._first = True
+        self._frames = 0
+        self._sum_squares = 0.0
+        self._sample_peak = 0.0
+        self._true_peak = 0.0
+
+    def update(self, audio: np.ndarray) -> None:
+        """音声チャンクを計測に追加"""
+        for start in range(0, audio.shape[1], ANALYSIS_CHUNK_FRAMES):
+            self._update_chunk(audio[:, start : start + ANALYSIS_CHUNK_FRAMES])
+
+    def _update_chunk(self, chunk: np.ndarray) -> None:
+        if chunk.shape[1] == 0:
+            return
+        chunk = np.ascontiguousarray(chunk, dtype=np.float32)
+        self._frames += chunk.shape[1]
+        self._sample_peak = max(self._sample_peak, float(np.max(np.abs(chunk))))
+        self._sum_squares += float(np.sum(np.square(chunk, dtype=np.float64)))
+
+        self._update_true_peak(chunk)
+
+        weighted = self._k_filter(chunk, self.samplerate, reset=self._first)
+        self._first = False
+        self._add_energy(np.sum(np.square(weighted, dtype=np.float64), axis=0))
+
+    def _update_true_peak(self, chunk: np.ndarray) -> None:
+        padded = np.concatenate([self._history, chunk], axis=1)
+        self._history = padded[:, padded.shape[1] - self._history.shape[1] :]
+        self._true_peak = max(self._true_peak, _interpolated_peak(padded))
+
+    def _add_energy(self, energy: np.ndarray) -> None:
+        # 前回の端数ステップを埋める
+        need = self._step_frames - self._pending_frames
+        head = energy[:need]
+        self._pending_energy += float(head.sum())
+        self._pending_frames += head.shape[0]
+        if self._pending_frames < self._step_frames:
+            return
+        self._step_energies.append(self._pending_energy)
+
+        # 残りを完全なステップ単位で集計し、端数を次回に持ち越す
+        rest = energy[need:]
+        full = rest.shape[0] // self._step_frames * self._step_frames
+        if full:
+            steps = rest[:full].reshape(-1, self._step_frames).sum(axis=1)
+            self._step_energies.extend(steps.tolist())
+        tail = rest[full:]
+        self._pending_energy = float(tail.sum())
+        self._pending_frames = tail.shape[0]
+
+    def _integrated_lufs(self) -> float | None:
+        steps = np.asarray(self._step_energies, dtype=np.float64)
+        if steps.size >= _STEPS_PER_BLOCK:
+            windows = np.lib.stride_tricks.sliding_window_view(steps, _STEPS_PER_BLOCK)
+            blocks = windows.sum(axis=1) / (_STEPS_PER_BLOCK * self._step_frames)
+        else:
+            # ゲーティングブロック（400ms）に満たない短い音声は全体の平均を使う
+            frames = steps.size * self._step_frames + self._pending_frames
+            total = steps.sum() + self._pending_energy
+            blocks = np.asarray([total / frames]) if frames else np.zeros(0)
+
+        with np.errstate(divide="ignore"):
+            loudness = _LUFS_OFFSET + 10 * np.log10(blocks)
+        gated = blocks[loudness > _ABSOLUTE_GATE_LUFS]
+        if gated.size == 0:
+            return None
+        relative_gate = _LUFS_OFFSET + 10 * math.log10(gated.mean()) + _RELATIVE_GATE_LU
+        with np.errstate(divide="ignore"):
+            gated_loudness = _LUFS_OFFSET + 10 * np.log10(gated)
+        gated = gated[gated_loudness > relative_gate]
+        return _LUFS_OFFSET + 10 * math.log10(gated.mean())
+
+    def result(self) -> LoudnessStats:
+        """計測結果を確定（状態は変えないため、続けて update() や result() を呼べる）"""
+        # 最後のサンプル付近の補間値を得るため、無音で補間フィルタを押し出す
+        flushed = np.concatenate([self._history, np.zeros_like(self._history)], axis=1)
+        true_peak = max(self._true_peak, _interpolated_peak(flushed))
+        samples = self._frames * self.num_channels
+        rms = math.sqrt(self._sum_squares / samples) if samples else 0.0
+        return LoudnessStats(
+            sample_peak=self._sample_peak,
+            true_peak=max(true_peak, self._sample_peak),
+            rms=rms,
+            integrated_lufs=self._integrated_lufs(),
+        )
+
+
+def display_gains(
+    input_stats: LoudnessStats,
+    output_stats: LoudnessStats,
+    mode: str = "peak",
+    target_peak: float = 0.7,
+    target_lufs: float = -18.0,
+) -> tuple[float, float]:
+    """
+    表示用正規化のゲイン（入力, 出力）を計算
+
+    mode="peak": それぞれのピークを target_peak に揃える
+    mode="loudness": 両方を同じラウドネスに揃える（A/B 比較用）。どちらかの true peak が
+    target_peak を超える場合は、両方の目標ラウドネスを同じだけ下げる。
+    """
+    if mode == "peak":
+
+        def peak_gain(stats: LoudnessStats) -> float:
+            return target_peak / stats.sample_peak if stats.sample_peak > 0 else 1.0
+
+        return peak_gain(input_stats), peak_gain(output_stats)
+    if mode != "loudness":
+        raise ValueError(f"Unknown normalization mode: {mode}")
+
+    target = target_lufs
+    for stats in (input_stats, output_stats):
+        if stats.integrated_lufs is not None and stats.true_peak > 0:
+            # この音声のピークが上限に達するラウドネス
+            ceiling = stats.integrated_lufs + 20 * math.log10(target_peak / stats.true_peak)
+            target = min(target, ceiling)
+
+    def gain(stats: LoudnessStats) -> float:
+        if stats.integrated_lufs is None:
+            return 1.0
+        return 10 ** ((target - stats.integrated_lufs) / 20)
+
+    return gain(input_stats), gain(output_stats)
+
+
+def waveform_peaks(source: Path | BinaryIO, buckets: int) -> list[float]:
+    """波形表示用に、全体を buckets 個に分けた区間毎の絶対値の最大（全チャンネル）"""
+    with AudioFile(str(source) if isinstance(source, Path) else source) as f:
+        frames = f.frames
+        if frames == 0 or buckets <= 0:
+            return []
+        bucket_frames = math.ceil(frames / buckets)
+        peaks = np.zeros(math.ceil(frames / bucket_frames), dtype=np.float32)
+        # バケット境界に揃えて読み込む
+        chunk_frames = max(1, ANALYSIS_CHUNK_FRAMES // bucket_frames) * bucket_frames
+        position = 0
+        while f.tell() < frames:
+            chunk = np.abs(f.read(chunk_frames)).max(axis=0)
+            start = position // bucket_frames
+            padded = np.zeros(math.ceil(len(chunk) / bucket_frames) * bucket_frames, chunk.dtype)
+            padded[: len(chunk)] = chunk
+            block = padded.reshape(-1, bucket_frames).max(axis=1)
+            peaks[start : start + len(block)] = block
+            position += len(chunk)
+    return [round(float(peak), 4) for peak in peaks]
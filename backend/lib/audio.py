@@ -3,21 +3,36 @@ from pathlib import Path
 import numpy as np
 from pedalboard.io import AudioFile
 
+from .analysis import ANALYSIS_CHUNK_FRAMES
+
+
+def _read_chunks(f, chunk_frames: int = ANALYSIS_CHUNK_FRAMES):
+    f.seek(0)
+    while f.tell() < f.frames:
+        yield f.read(chunk_frames)
+
 
 def normalize_audio_for_display(
     input_path: Path,
     output_path: Path,
     target_peak: float = 0.7,
+    gain: float | None = None,
 ) -> None:
-    """表示用に音声を正規化"""
+    """
+    表示用に音声を正規化
+
+    gain を指定した場合はそのゲインを適用する（解析済みの統計を使い、ピーク探索を省く）。
+    未指定の場合は先にピークを求め、ピークが target_peak になるように正規化する。
+    """
     with AudioFile(str(input_path)) as f:
-        audio = f.read(f.frames)
         samplerate = f.samplerate
+        num_channels = f.num_channels
 
-    peak = np.max(np.abs(audio))
-    if peak > 0:
-        audio = audio * (target_peak / peak)
+        if gain is None:
+            peak = max((float(np.max(np.abs(chunk))) for chunk in _read_chunks(f)), default=0.0)
+            gain = target_peak / peak if peak > 0 else 1.0
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with AudioFile(str(output_path), "w", samplerate, audio.shape[0]) as f:
-        f.write(audio)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with AudioFile(str(output_path), "w", samplerate, num_channels) as out:
+            for chunk in _read_chunks(f):
+                out.write(chunk * np.float32(gain))
@@ -0,0 +1,109 @@
+import asyncio
+import time
+import zipfile
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator
+from pathlib import Path
+from typing import TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+ZIP_CHUNK_BYTES = 1024 * 1024
+
+
+class _ZipSink:
+    """ZipFile の書き込み先（シーク不可）。書かれたバイト列を溜めておき、都度取り出す"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """
+    ZIP アーカイブを逐次生成する
+
+    書き込み先がシーク不可のため zipfile はデータディスクリプタ形式で書き出し、
+    アーカイブ全体をディスクやメモリに保持しない。WAV はほとんど圧縮できないので
+    無圧縮（ZIP_STORED）で格納する。
+    """
+
+    def __init__(self):
+        self._sink = _ZipSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_STORED)
+
+    def _entry(self, name: str) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        return info
+
+    def add_file(
+        self, name: str, path: Path, chunk_bytes: int = ZIP_CHUNK_BYTES
+    ) -> Iterator[bytes]:
+        """ファイルを chunk_bytes ずつ読みながら格納し、生成されたバイト列を返す"""
+        force_zip64 = path.stat().st_size >= zipfile.ZIP64_LIMIT
+        entry = self._entry(name)
+        with open(path, "rb") as src, self._zip.open(entry, "w", force_zip64=force_zip64) as dst:
+            while chunk := src.read(chunk_bytes):
+                dst.write(chunk)
+                yield self._sink.drain()
+        yield self._sink.drain()
+
+    def add_bytes(self, name: str, data: bytes) -> bytes:
+        """メモリ上のデータを格納し、生成されたバイト列を返す"""
+        self._zip.writestr(self._entry(name), data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """セントラルディレクトリを書き出して終了"""
+        self._zip.close()
+        return self._sink.drain()
+
+
+async def map_bounded(
+    items: Iterable[T],
+    func: Callable[[T], Awaitable[R]],
+    limit: int,
+) -> AsyncIterator[tuple[T, R | BaseException]]:
+    """
+    items を最大 limit 件ずつ並行に処理し、終わった順に (item, 結果または例外) を返す
+
+    呼び出し側が結果を取り出すまで次の処理を始めないため、処理中と未消費の結果は
+    合わせて limit 件を超えない。
+    """
+    pending: dict[asyncio.Task, T] = {}
+    iterator = iter(items)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < limit:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(func(item))] = item
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                error = task.exception()
+                yield item, error if error is not None else task.result()
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,95 @@
+import threading
+from collections import Counter
+
+
+class Cancelled(Exception):
+    """レンダリングが中断された（結果を待つリクエストがいなくなった）"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Render cancelled ({reason})")
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    レンダリングの中断の合図
+
+    処理側はブロック毎に check() を呼び、中断されていれば Cancelled で抜ける。
+    同じ処理を複数のリクエストが待つ場合に備え、待つ側は join() で登録し、待つのを
+    やめたら leave() する。最後の1件が leave() した時点で中断する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = 0
+        self._reason: str | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._reason is not None
+
+    def cancel(self, reason: str) -> None:
+        with self._lock:
+            if self._reason is None:
+                self._reason = reason
+
+    def check(self) -> None:
+        """中断されていれば Cancelled を送出"""
+        if self._reason is not None:
+            raise Cancelled(self._reason)
+
+    def join(self) -> None:
+        with self._lock:
+            self._waiters += 1
+
+    def leave(self) -> bool:
+        """待つのをやめる（最後の1件なら中断して True を返す）"""
+        with self._lock:
+            self._waiters -= 1
+            if self._waiters > 0:
+                return False
+            if self._reason is None:
+                self._reason = "abandoned"
+            return True
+
+
+class CancellationMetrics:
+    """
+    結果を受け取られなかった処理の集計
+
+    待つのをやめたリクエスト数（理由毎）と、中断したレンダリングの件数・中断までに
+    使った時間、待つ側がいなくなった後に完了したレンダリングの件数・時間を数える。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._abandoned: Counter[str] = Counter()
+        self._cancelled = 0
+        self._cancelled_seconds = 0.0
+        self._unclaimed = 0
+        self._unclaimed_seconds = 0.0
+
+    def record_abandoned(self, reason: str) -> None:
+        with self._lock:
+            self._abandoned[reason] += 1
+
+    def record_cancelled(self, seconds: float) -> None:
+        with self._lock:
+            self._cancelled += 1
+            self._cancelled_seconds += seconds
+
+    def record_unclaimed(self, seconds: float) -> None:
+        with self._lock:
+            self._unclaimed += 1
+            self._unclaimed_seconds += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "abandoned_requests": dict(self._abandoned),
+                "cancelled_renders_total": self._cancelled,
+                "unclaimed_renders_total": self._unclaimed,
+                "wasted_render_seconds": round(
+                    self._cancelled_seconds + self._unclaimed_seconds, 3
+                ),
+            }
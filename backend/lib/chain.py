@@ -0,0 +1,151 @@
+import hashlib
+import json
+import math
+from dataclasses import dataclass
+from functools import cached_property
+
+from pedalboard import Chorus, Delay, Gain, Pedalboard
+
+from .effects import EFFECT_MAPPING
+
+# 大文字小文字・前後空白を無視したエフェクト名の索引
+_NAME_INDEX = {name.strip().casefold(): name for name in EFFECT_MAPPING}
+
+# プラグイン共通のプロパティ（パラメータではない）
+_NON_PARAM_PROPERTIES = {"is_effect", "is_instrument"}
+
+
+class EffectChainError(ValueError):
+    """エフェクトチェーンの検証エラー"""
+
+
+@dataclass(frozen=True)
+class EffectStage:
+    """正規化済みのエフェクト段"""
+
+    name: str
+    class_name: str
+    params: tuple[tuple[str, float], ...]
+
+    @property
+    def effect_class(self) -> type:
+        return EFFECT_MAPPING[self.name]["class"]
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "class_name": self.class_name, "params": dict(self.params)}
+
+    def instantiate(self):
+        return self.effect_class(**dict(self.params))
+
+
+@dataclass(frozen=True)
+class CompiledChain:
+    """コンパイル済みエフェクトチェーン（ハッシュ可能な正規形）"""
+
+    stages: tuple[EffectStage, ...]
+
+    @cached_property
+    def key(self) -> str:
+        """キャッシュ用の安定したキー"""
+        payload = json.dumps([stage.to_dict() for stage in self.stages], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def build(self) -> Pedalboard:
+        """Pedalboardを新規に構築（Pedalboardは状態を持つためリクエスト毎に作る）"""
+        return Pedalboard([stage.instantiate() for stage in self.stages])
+
+    def __len__(self) -> int:
+        return len(self.stages)
+
+
+def plugin_param_names(effect_class: type) -> set[str]:
+    """プラグインクラスが受け付けるパラメータ名"""
+    return {
+        attr
+        for attr in dir(effect_class)
+        if isinstance(getattr(effect_class, attr, None), property)
+        and attr not in _NON_PARAM_PROPERTIES
+    }
+
+
+def resolve_effect_name(name: str | None) -> str:
+    """エフェクト名を EFFECT_MAPPING のキーに正規化"""
+    canonical = _NAME_INDEX.get((name or "").strip().casefold())
+    if canonical is None:
+        raise EffectChainError(f"Unknown effect: {name!r}")
+    return canonical
+
+
+def _compile_stage(position: int, effect_config: dict) -> EffectStage:
+    name = resolve_effect_name(effect_config.get("name"))
+    mapping = EFFECT_MAPPING[name]
+    effect_class = mapping["class"]
+    custom_params = effect_config.get("params") or {}
+
+    allowed = plugin_param_names(effect_class)
+    unknown = sorted(set(custom_params) - allowed)
+    if unknown:
+        raise EffectChainError(
+            f"Unknown parameter(s) for {name} at position {position}: {', '.join(unknown)}"
+        )
+    for key, value in custom_params.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise EffectChainError(f"Parameter {key} of {name} must be a number")
+        if not math.isfinite(value):
+            raise EffectChainError(f"Parameter {key} of {name} must be finite")
+
+    params = {**mapping["params"], **custom_params}
+    try:
+        plugin = effect_class(**params)
+    except (TypeError, ValueError) as e:
+        raise EffectChainError(f"Invalid parameters for {name}: {e}") from e
+
+    # プラグインが保持する値を読み戻し、省略されたパラメータも含めた正規形にする
+    resolved = tuple(sorted((attr, float(getattr(plugin, attr))) for attr in allowed))
+    return EffectStage(name=name, class_name=effect_class.__name__, params=resolved)
+
+
+def _is_noop(stage: EffectStage) -> bool:
+    params = dict(stage.params)
+    if stage.effect_class is Gain:
+        return params["gain_db"] == 0.0
+    if stage.effect_class is Chorus:
+        return params["mix"] == 0.0
+    if stage.effect_class is Delay:
+        return params["mix"] == 0.0 and params["feedback"] == 0.0
+    return False
+
+
+def _fold_gains(stages: list[EffectStage]) -> list[EffectStage]:
+    folded: list[EffectStage] = []
+    for stage in stages:
+        previous = folded[-1] if folded else None
+        if previous is not None and previous.effect_class is Gain and stage.effect_class is Gain:
+            gain_db = dict(previous.params)["gain_db"] + dict(stage.params)["gain_db"]
+            folded[-1] = EffectStage(
+                name=previous.name,
+                class_name=previous.class_name,
+                params=(("gain_db", gain_db),),
+            )
+        else:
+            folded.append(stage)
+    return folded
+
+
+def compile_effect_chain(effect_list: list) -> CompiledChain:
+    """
+    エフェクトリストを検証・最適化して正規形にコンパイル
+
+    Args:
+        effect_list: [{"name": "Blues Driver", "params": {"drive_db": 20}}, ...]
+
+    Returns:
+        CompiledChain: 連続する Gain を畳み込み、無効な段を除いたチェーン
+
+    Raises:
+        EffectChainError: 未知のエフェクト名やパラメータを含む場合
+    """
+    stages = [_compile_stage(i, config) for i, config in enumerate(effect_list)]
+    stages = [stage for stage in stages if not _is_noop(stage)]
+    stages = [stage for stage in _fold_gains(stages) if not _is_noop(stage)]
+    return CompiledChain(stages=tuple(stages))
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import partial
+from typing import TypeVar
+
+from .cancellation import CancelToken
+
+R = TypeVar("R")
+
+
+def _discard_result(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+class _Flight:
+    def __init__(self):
+        self.future: Future = Future()
+        self.token = CancelToken()
+        self.task: asyncio.Future | None = None
+
+
+class SingleFlight:
+    """
+    同じキーの処理を同時に1回だけ実行し、待っている全員に同じ結果（または例外）を返す
+
+    最初の呼び出しが func(token) で処理を始め、完了までに同じキーで呼ばれたものは
+    その結果を待つ。呼び出し元がキャンセルされても他に待っている呼び出し元がいれば
+    処理は続け、全員がキャンセルされたら token で処理に中断を伝えて処理のタスクも
+    キャンセルする（受け付け待ちの枠を手放させる）。Lambda のように
+    リクエスト毎にイベントループが変わる環境でも共有できるよう、結果は
+    concurrent.futures.Future で受け渡す。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[Hashable, _Flight] = {}
+        self._started_total = 0
+        self._coalesced_total = 0
+
+    def _finish(self, key: Hashable, flight: _Flight, task: asyncio.Future) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if task.cancelled():
+            flight.future.set_exception(RuntimeError("Coalesced request was cancelled"))
+        elif (error := task.exception()) is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(task.result())
+
+    async def run(self, key: Hashable, func: Callable[[CancelToken], Awaitable[R]]) -> R:
+        """key の処理が実行中ならその結果を待ち、なければ func(token) を実行する"""
+        with self._lock:
+            flight = self._flights.get(key)
+            # 中断が決まった処理には相乗りせず、新しく始める
+            leader = flight is None or flight.token.cancelled
+            if leader or flight is None:
+                flight = self._flights[key] = _Flight()
+                self._started_total += 1
+            else:
+                self._coalesced_total += 1
+            flight.token.join()
+            if leader:
+                # 待つ側が抜けたときに取り消せるよう、ロック内でタスクを登録する
+                flight.task = asyncio.ensure_future(func(flight.token))
+        if leader and flight.task is not None:
+            flight.task.add_done_callback(partial(self._finish, key, flight))
+        waiter = asyncio.wrap_future(flight.future)
+        try:
+            return await asyncio.shield(waiter)
+        except asyncio.CancelledError:
+            # 待つのをやめた後の結果（中断による例外など）は受け取ったことにする
+            waiter.add_done_callback(_discard_result)
+            if flight.token.leave() and flight.task is not None:
+                # 処理のタスクは他のイベントループにあることもある
+                flight.task.get_loop().call_soon_threadsafe(flight.task.cancel)
+            raise
+
+    def snapshot(self) -> dict:
+        """実行中の処理数と、開始・相乗りした件数"""
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "started_total": self._started_total,
+                "coalesced_total": self._coalesced_total,
+            }
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """Idempotency-Key に対して保存した応答"""
+
+    fingerprint: str
+    body: dict
+    stored_at: float
+
+
+class IdempotencyStore:
+    """
+    Idempotency-Key 毎に完了したリクエストの応答を保持する
+
+    同じキーの再試行には保存した応答を返す。キーを別の内容のリクエストに使い回した
+    場合を検出できるよう、リクエストの指紋も保存する。ttl_seconds を過ぎたものと、
+    max_entries を超えた分は古いものから捨てる。
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, StoredResponse] = OrderedDict()
+        self._hits_total = 0
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.stored_at < self.ttl_seconds and len(self._entries) <= self.max_entries:
+                return
+            del self._entries[key]
+
+    def get(self, key: str) -> StoredResponse | None:
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._hits_total += 1
+            return entry
+
+    def put(self, key: str, fingerprint: str, body: dict) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = StoredResponse(fingerprint, body, now)
+            self._expire(now)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits_total": self._hits_total}
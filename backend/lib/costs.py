@@ -0,0 +1,248 @@
+import io
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+import pedalboard
+from pedalboard import Delay, Reverb
+from pedalboard.io import AudioFile
+
+from .analysis import LoudnessMeter
+from .chain import CompiledChain
+from .effects import EFFECT_MAPPING
+
+# 計測するサンプルレート
+CALIBRATION_SAMPLE_RATES = (44100, 48000)
+_CALIBRATION_SECONDS = 0.5
+_CALIBRATION_CHANNELS = 2
+_CALIBRATION_REPEATS = 3
+
+# 残響（テール）を計測する最大長と、テールの終わりとみなすレベル（ピーク比 -60dB）
+_MAX_TAIL_SECONDS = 10.0
+_TAIL_THRESHOLD = 1e-3
+_TAIL_EFFECT_CLASSES = (Delay, Reverb)
+
+
+@dataclass(frozen=True)
+class EffectCost:
+    """エフェクト1種の計測コスト"""
+
+    ns_per_sample: dict[int, float]
+    latency_seconds: float
+    tail_seconds: float
+
+    def at(self, samplerate: float) -> float:
+        """最も近いサンプルレートで計測した 1サンプル・1チャンネルあたりのナノ秒"""
+        return _nearest(self.ns_per_sample, samplerate)
+
+
+@dataclass(frozen=True)
+class CostModel:
+    """全エフェクトの計測コストと、デコード・エンコード・解析の基本コスト"""
+
+    pedalboard_version: str
+    effects_fingerprint: str
+    base_ns_per_sample: dict[int, float]
+    effects: dict[str, EffectCost]
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CostModel":
+        return cls(
+            pedalboard_version=data["pedalboard_version"],
+            effects_fingerprint=data["effects_fingerprint"],
+            base_ns_per_sample=_int_keys(data["base_ns_per_sample"]),
+            effects={
+                name: EffectCost(
+                    ns_per_sample=_int_keys(cost["ns_per_sample"]),
+                    latency_seconds=cost["latency_seconds"],
+                    tail_seconds=cost["tail_seconds"],
+                )
+                for name, cost in data["effects"].items()
+            },
+        )
+
+
+@dataclass(frozen=True)
+class RenderEstimate:
+    """レンダリング時間の見積もり"""
+
+    seconds: float
+    base_seconds: float
+    stage_seconds: dict[str, float]
+    tail_seconds: float
+
+
+def _int_keys(values: dict) -> dict[int, float]:
+    return {int(key): float(value) for key, value in values.items()}
+
+
+def _nearest(values: dict[int, float], samplerate: float) -> float:
+    return values[min(values, key=lambda rate: abs(rate - samplerate))]
+
+
+def effects_fingerprint() -> str:
+    """EFFECT_MAPPING の内容が変わったらキャッシュを無効にするための識別子"""
+    return json.dumps(
+        {
+            name: [config["class"].__name__, config["params"]]
+            for name, config in EFFECT_MAPPING.items()
+        },
+        sort_keys=True,
+    )
+
+
+def _test_signal(samplerate: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    frames = int(samplerate * _CALIBRATION_SECONDS)
+    return (0.25 * rng.standard_normal((_CALIBRATION_CHANNELS, frames))).astype(np.float32)
+
+
+def _best_ns_per_sample(run, audio: np.ndarray) -> float:
+    best = float("inf")
+    for _ in range(_CALIBRATION_REPEATS):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e9 / audio.size
+
+
+def _measure_base(samplerate: int, audio: np.ndarray) -> float:
+    def run() -> None:
+        # 入出力の解析・WAV 書き込み・読み戻し・表示用書き込みの分
+        for _ in range(2):
+            meter = LoudnessMeter(samplerate, audio.shape[0])
+            meter.update(audio)
+            meter.result()
+        buffer = io.BytesIO()
+        with AudioFile(buffer, "w", samplerate, audio.shape[0], format="wav") as f:
+            f.write(audio)
+        buffer.seek(0)
+        with AudioFile(buffer) as f:
+            f.read(f.frames)
+
+    return _best_ns_per_sample(run, audio)
+
+
+def _measure_impulse(effect_class: type, params: dict, samplerate: int) -> tuple[float, float]:
+    """インパルス応答から遅延とテール長（秒）を計測"""
+    plugin = effect_class(**params)
+    max_tail = _MAX_TAIL_SECONDS if effect_class in _TAIL_EFFECT_CLASSES else 1.0
+    impulse = np.zeros((1, int(samplerate * max_tail)), dtype=np.float32)
+    impulse[0, 0] = 1.0
+    response = np.abs(plugin(impulse, samplerate)[0])
+    peak = float(response.max())
+    if peak == 0:
+        return 0.0, 0.0
+    above = np.flatnonzero(response > peak * _TAIL_THRESHOLD)
+    latency = float(above[0]) / samplerate
+    tail = float(above[-1]) / samplerate if effect_class in _TAIL_EFFECT_CLASSES else 0.0
+    return latency, tail
+
+
+def calibrate(samplerates: tuple[int, ...] = CALIBRATION_SAMPLE_RATES) -> CostModel:
+    """全エフェクトの処理コストを実測"""
+    base = {}
+    per_effect: dict[str, dict[int, float]] = {name: {} for name in EFFECT_MAPPING}
+    for samplerate in samplerates:
+        audio = _test_signal(samplerate)
+        base[samplerate] = _measure_base(samplerate, audio)
+        for name, config in EFFECT_MAPPING.items():
+            plugin = config["class"](**config["params"])
+            per_effect[name][samplerate] = _best_ns_per_sample(
+                lambda plugin=plugin: plugin(audio, samplerate), audio
+            )
+
+    effects = {}
+    for name, config in EFFECT_MAPPING.items():
+        latency, tail = _measure_impulse(config["class"], config["params"], max(samplerates))
+        effects[name] = EffectCost(
+            ns_per_sample=per_effect[name], latency_seconds=latency, tail_seconds=tail
+        )
+    return CostModel(
+        pedalboard_version=pedalboard.__version__,
+        effects_fingerprint=effects_fingerprint(),
+        base_ns_per_sample=base,
+        effects=effects,
+    )
+
+
+_model: CostModel | None = None
+_model_lock = threading.Lock()
+
+
+def current_cost_model() -> CostModel | None:
+    """読み込み済みのコストモデル（未計測なら None）"""
+    return _model
+
+
+def load_cost_model(path: Path, calibrate_if_missing: bool = True) -> CostModel | None:
+    """
+    ディスクのキャッシュからコストモデルを読み込む
+
+    キャッシュがない、または pedalboard のバージョンや EFFECT_MAPPING が変わっている場合は
+    calibrate_if_missing が真なら計測し直してキャッシュに書き込む（書き込めなくても続行）。
+    """
+    global _model
+    with _model_lock:
+        try:
+            model = CostModel.from_dict(json.loads(path.read_text()))
+            if (
+                model.pedalboard_version != pedalboard.__version__
+                or model.effects_fingerprint != effects_fingerprint()
+                or set(model.effects) != set(EFFECT_MAPPING)
+            ):
+                model = None
+        except (OSError, ValueError, KeyError):
+            model = None
+
+        if model is None and calibrate_if_missing:
+            model = calibrate()
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(json.dumps(model.to_dict(), indent=2))
+            except OSError:
+                pass
+
+        if model is not None:
+            _model = model
+        return model
+
+
+def estimate_render(
+    chain: CompiledChain,
+    frames: int,
+    num_channels: int,
+    samplerate: float,
+    model: CostModel,
+) -> RenderEstimate:
+    """計測コストからレンダリング時間を見積もる"""
+    samples = frames * num_channels
+    base_seconds = samples * _nearest(model.base_ns_per_sample, samplerate) * 1e-9
+    stage_seconds = {}
+    tail_seconds = 0.0
+    for i, stage in enumerate(chain.stages):
+        cost = model.effects[stage.name]
+        stage_seconds[f"{i}:{stage.name}"] = samples * cost.at(samplerate) * 1e-9
+        tail_seconds = max(tail_seconds, cost.tail_seconds)
+    return RenderEstimate(
+        seconds=base_seconds + sum(stage_seconds.values()),
+        base_seconds=base_seconds,
+        stage_seconds=stage_seconds,
+        tail_seconds=tail_seconds,
+    )
+
+
+if __name__ == "__main__":
+    # ビルド時の計測: python -m lib.costs [出力パス]
+    import sys
+
+    output = Path(sys.argv[1] if len(sys.argv) > 1 else "effect_costs.json")
+    output.unlink(missing_ok=True)
+    result = load_cost_model(output)
+    print(json.dumps(result.to_dict() if result else None, indent=2))
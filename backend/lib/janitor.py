@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class SweepResult:
+    """掃除1回分の結果"""
+
+    removed: int
+    freed_bytes: int
+    remaining_bytes: int
+
+
+class OutputJanitor:
+    """
+    出力ディレクトリの掃除役
+
+    最終アクセスから TTL を過ぎたファイルを削除し、合計サイズが予算を超えた場合は
+    最終アクセスが古い順に削除する。最終アクセスから min_age_seconds 以内のファイルは
+    予算超過時も削除しないため、他のユーザーのダウンロード中にファイルが消えない。
+    """
+
+    def __init__(
+        self,
+        directories: list[Path],
+        ttl_seconds: float,
+        max_bytes: int,
+        min_age_seconds: float,
+        interval_seconds: float,
+        patterns: tuple[str, ...] = ("*.wav",),
+    ):
+        self.directories = directories
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.min_age_seconds = min_age_seconds
+        self.interval_seconds = interval_seconds
+        self.patterns = patterns
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def touch(self, path: Path) -> None:
+        """アクセスを記録（atime のみ更新し、mtime は作成時刻のまま残す）"""
+        try:
+            stat = path.stat()
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            pass
+
+    def _scan(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for directory in self.directories:
+            if not directory.exists():
+                continue
+            for pattern in self.patterns:
+                for path in directory.glob(pattern):
+                    try:
+                        stat = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    last_access = max(stat.st_atime, stat.st_mtime)
+                    entries.append((last_access, stat.st_size, path))
+        return entries
+
+    def sweep(self, now: float | None = None) -> SweepResult:
+        """TTL 切れと予算超過分を削除"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = sorted(self._scan(), key=lambda entry: entry[0])
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            freed = 0
+            for last_access, size, path in entries:
+                age = now - last_access
+                expired = age > self.ttl_seconds
+                over_budget = total > self.max_bytes and age > self.min_age_seconds
+                if not (expired or over_budget):
+                    continue
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+                freed += size
+            return SweepResult(removed=removed, freed_bytes=freed, remaining_bytes=total)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.sweep()
+            self._stop.wait(self.interval_seconds)
+
+    def start(self) -> None:
+        """バックグラウンドで定期的に掃除を開始"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="output-janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """バックグラウンドの掃除を停止"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,145 @@
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+# レンダリング中に同時に保持する float32 バッファ（入力チャンク・処理後チャンク）
+BYTES_PER_SAMPLE = 4
+RENDER_BUFFERS = 2
+# 解析・書き込みの一時配列やプラグインの内部状態など、バッファ以外の固定分
+RENDER_OVERHEAD_BYTES = 16 * 1024 * 1024
+# 分割処理する場合の最小ブロック（小さすぎると呼び出しのオーバーヘッドが増える）
+MIN_BLOCK_FRAMES = 16384
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_bytes() -> int | None:
+    """プロセスの現在の RSS（取得できない環境では None）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes() -> int:
+    """プロセス起動からの最大 RSS"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト、Linux は KiB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def render_working_set(frames: int, num_channels: int, block_frames: int | None = None) -> int:
+    """レンダリング1件が同時に保持するバイト数の見積もり"""
+    block = min(frames, block_frames) if block_frames else frames
+    return block * num_channels * BYTES_PER_SAMPLE * RENDER_BUFFERS + RENDER_OVERHEAD_BYTES
+
+
+def plan_block_frames(frames: int, num_channels: int, budget_bytes: int) -> int | None:
+    """
+    メモリ予算に収まる処理ブロックのフレーム数
+
+    ファイル全体を一度に処理しても予算内なら None（分割しない）を返す。
+    """
+    if render_working_set(frames, num_channels) <= budget_bytes:
+        return None
+    available = max(0, budget_bytes - RENDER_OVERHEAD_BYTES)
+    per_frame = num_channels * BYTES_PER_SAMPLE * RENDER_BUFFERS
+    return max(MIN_BLOCK_FRAMES, available // per_frame)
+
+
+@dataclass(frozen=True)
+class StageMemory:
+    """処理段階1つ分の所要時間と RSS"""
+
+    name: str
+    seconds: float
+    rss_before_bytes: int | None
+    rss_after_bytes: int | None
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "seconds": round(self.seconds, 4),
+            "rss_before_bytes": self.rss_before_bytes,
+            "rss_after_bytes": self.rss_after_bytes,
+        }
+
+
+@dataclass
+class MemoryTracker:
+    """
+    リクエスト1件のメモリ使用量の記録
+
+    段階毎のプロセス RSS と、パイプラインが保持した音声バッファの最大バイト数
+    （render_file が実際の配列サイズから報告する）を記録する。
+    """
+
+    budget_bytes: int
+    block_frames: int | None = None
+    peak_buffer_bytes: int = 0
+    stages: list[StageMemory] = field(default_factory=list)
+
+    @contextmanager
+    def stage(self, name: str):
+        """with ブロックを1段階として記録"""
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append(
+                StageMemory(
+                    name=name,
+                    seconds=time.perf_counter() - start,
+                    rss_before_bytes=rss_before,
+                    rss_after_bytes=current_rss_bytes(),
+                )
+            )
+
+    def record_buffers(self, nbytes: int) -> None:
+        """保持中のバッファのバイト数を報告（最大値を残す）"""
+        self.peak_buffer_bytes = max(self.peak_buffer_bytes, nbytes)
+
+    def to_dict(self) -> dict:
+        return {
+            "budget_bytes": self.budget_bytes,
+            "chunked": self.block_frames is not None,
+            "block_frames": self.block_frames,
+            "peak_buffer_bytes": self.peak_buffer_bytes,
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+
+class MemoryMetrics:
+    """全リクエストのメモリ使用量の集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._renders = 0
+        self._chunked = 0
+        self._max_peak_buffer_bytes = 0
+
+    def record(self, tracker: MemoryTracker) -> None:
+        with self._lock:
+            self._renders += 1
+            if tracker.block_frames is not None:
+                self._chunked += 1
+            self._max_peak_buffer_bytes = max(
+                self._max_peak_buffer_bytes, tracker.peak_buffer_bytes
+            )
+
+    def snapshot(self) -> dict:
+        """現在の RSS と集計値"""
+        with self._lock:
+            return {
+                "rss_bytes": current_rss_bytes(),
+                "peak_rss_bytes": peak_rss_bytes(),
+                "renders_total": self._renders,
+                "chunked_renders_total": self._chunked,
+                "max_peak_buffer_bytes": self._max_peak_buffer_bytes,
+            }
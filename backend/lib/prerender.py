@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+
+from .admission import Overloaded
+from .chain import CompiledChain
+
+logger = logging.getLogger(__name__)
+
+# バックグラウンドスレッドの優先度（Linux ではスレッド単位で nice 値を設定できる）
+_BACKGROUND_NICENESS = 19
+
+
+@dataclass(frozen=True)
+class PrerenderJob:
+    """事前レンダリング1件（入力ファイル名とリクエスト形式のエフェクトチェーン）"""
+
+    input_file: str
+    effect_chain: tuple[tuple[str, tuple[tuple[str, float], ...]], ...]
+
+    @classmethod
+    def from_chain(cls, input_file: str, chain: CompiledChain) -> "PrerenderJob":
+        return cls(
+            input_file=input_file,
+            effect_chain=tuple((stage.name, stage.params) for stage in chain.stages),
+        )
+
+    def chain_dicts(self) -> list[dict]:
+        return [{"name": name, "params": dict(params)} for name, params in self.effect_chain]
+
+
+class RequestPopularity:
+    """入力×チェーンの組み合わせ毎のリクエスト数（上位を事前レンダリングの対象にする）"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._counts: Counter[PrerenderJob] = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, input_file: str, chain: CompiledChain) -> None:
+        job = PrerenderJob.from_chain(input_file, chain)
+        with self._lock:
+            self._counts[job] += 1
+            if len(self._counts) > self.max_entries:
+                # 件数の少ない半分を捨てて上限を保つ
+                self._counts = Counter(dict(self._counts.most_common(self.max_entries // 2)))
+
+    def top(self, n: int) -> list[PrerenderJob]:
+        with self._lock:
+            return [job for job, _ in self._counts.most_common(n)]
+
+
+@dataclass
+class PrerenderResult:
+    """事前レンダリング1回分の結果"""
+
+    rendered: int = 0
+    cached: int = 0
+    failed: int = 0
+    deferred: int = 0
+    cpu_seconds: float = 0.0
+    # 対象を列挙できなかった場合のエラー
+    error: str | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "rendered": self.rendered,
+            "cached": self.cached,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "error": self.error,
+        }
+
+
+def _lower_thread_priority() -> None:
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), _BACKGROUND_NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+
+class Prerenderer:
+    """
+    人気の入力×チェーンを空き時間に事前レンダリングする
+
+    render(job) は出力を作った場合に True、既にあった場合に False を返し、受け付けの
+    予算に空きがなければ Overloaded を送出する。
+    ライブのリクエストと競合しないよう、is_idle() が偽の間は待ち、1件毎に
+    使った CPU 時間に応じて休む（CPU の使用率を cpu_fraction 以下に抑える）。
+    1回の実行で使う CPU 時間が cpu_budget_seconds を超えたら残りは次回に回す。
+    """
+
+    def __init__(
+        self,
+        render: Callable[[PrerenderJob], bool],
+        jobs: Callable[[], Iterable[PrerenderJob]],
+        is_idle: Callable[[], bool],
+        cpu_budget_seconds: float,
+        cpu_fraction: float,
+        interval_seconds: float,
+        idle_poll_seconds: float = 1.0,
+    ):
+        self.render = render
+        self.jobs = jobs
+        self.is_idle = is_idle
+        self.cpu_budget_seconds = cpu_budget_seconds
+        self.cpu_fraction = cpu_fraction
+        self.interval_seconds = interval_seconds
+        self.idle_poll_seconds = idle_poll_seconds
+        self.last_result: PrerenderResult | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def run_once(self) -> PrerenderResult:
+        """対象を1巡して事前レンダリング"""
+        result = PrerenderResult()
+        try:
+            pending = list(self.jobs())
+        except Exception as e:
+            # 列挙の失敗でバックグラウンドのスレッドを止めず、次回に再試行する
+            logger.exception("Failed to list prerender jobs")
+            result.error = f"{type(e).__name__}: {e}"
+            self.last_result = result
+            return result
+        for i, job in enumerate(pending):
+            if result.cpu_seconds >= self.cpu_budget_seconds:
+                result.deferred = len(pending) - i
+                break
+            while not self.is_idle():
+                if self._stop.wait(self.idle_poll_seconds):
+                    result.deferred = len(pending) - i
+                    self.last_result = result
+                    return result
+
+            start = time.thread_time()
+            try:
+                rendered = self.render(job)
+            except Overloaded:
+                # 待つ間にライブのリクエストが来た。残りは次回に回す
+                result.deferred = len(pending) - i
+                break
+            except Exception:
+                result.failed += 1
+                continue
+            finally:
+                used = time.thread_time() - start
+                result.cpu_seconds += used
+            if not rendered:
+                result.cached += 1
+                continue
+            result.rendered += 1
+            # 使った CPU 時間に対して休み、平均の使用率を cpu_fraction に抑える
+            if 0 < self.cpu_fraction < 1 and self._stop.wait(
+                used * (1 - self.cpu_fraction) / self.cpu_fraction
+            ):
+                result.deferred = len(pending) - i - 1
+                break
+        self.last_result = result
+        return result
+
+    def _run(self) -> None:
+        _lower_thread_priority()
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval_seconds)
+
+    def start(self) -> None:
+        """バックグラウンドで定期的に事前レンダリングを開始"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="prerenderer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """バックグラウンドの事前レンダリングを停止"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,87 @@
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from pathlib import Path
+from types import FrameType
+from typing import TypeVar
+
+R = TypeVar("R")
+
+# サンプリング間隔（秒）
+DEFAULT_INTERVAL_SECONDS = 0.002
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    指定した処理を実行するスレッドのスタックを一定間隔で記録するプロファイラ
+
+    with ブロックの間だけサンプリング用のスレッドを動かし、run() で実行した関数の
+    スレッドのみを記録する（同時に動く他のリクエストは含まない）。結果は
+    collapsed stack 形式（"a;b;c 件数"）で、flamegraph.pl や speedscope で表示できる。
+    C 拡張（pedalboard）の中の時間は、呼び出し元の Python フレームに計上される。
+    """
+
+    def __init__(self, interval_seconds: float = DEFAULT_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.samples: Counter[str] = Counter()
+        self.duration_seconds = 0.0
+        self._threads: set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+
+    def __enter__(self) -> "SamplingProfiler":
+        self._stop.clear()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration_seconds = time.perf_counter() - self._started
+
+    def run(self, func: Callable[..., R], *args, **kwargs) -> R:
+        """現在のスレッドを記録対象にして func を実行"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads.add(ident)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._threads.discard(ident)
+
+    def _stack(self, frame: FrameType | None) -> str:
+        labels = []
+        while frame is not None and frame.f_code is not SamplingProfiler.run.__code__:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            with self._lock:
+                threads = set(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident in threads:
+                stack = self._stack(frames.get(ident))
+                if stack:
+                    self.samples[stack] += 1
+
+    def collapsed(self) -> str:
+        """collapsed stack 形式のプロファイル"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
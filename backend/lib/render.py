@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO
+
+from pedalboard import Pedalboard
+from pedalboard.io import AudioFile
+
+from .analysis import LoudnessMeter, LoudnessStats, display_gains
+from .audio import normalize_audio_for_display
+from .cancellation import CancelToken
+from .memory import MemoryTracker
+
+
+@dataclass(frozen=True)
+class RenderResult:
+    """レンダリング結果"""
+
+    samplerate: float
+    num_channels: int
+    frames: int
+    input_stats: LoudnessStats
+    output_stats: LoudnessStats
+
+
+def _audio_source(source: Path | BinaryIO) -> str | BinaryIO:
+    return str(source) if isinstance(source, Path) else source
+
+
+def render_file(
+    input_path: Path | BinaryIO,
+    output_path: Path | BinaryIO,
+    board: Pedalboard,
+    block_frames: int | None = None,
+    memory: MemoryTracker | None = None,
+    cancel: CancelToken | None = None,
+) -> RenderResult:
+    """
+    入力ファイルにエフェクトを適用して書き出し、同じパスで入出力を解析
+
+    block_frames を指定するとその単位で読み込み・処理・書き込みを行う（Pedalboard は
+    reset=False で状態を引き継ぐ）。未指定の場合はファイル全体を1ブロックで処理する。
+    入出力にはパスの代わりにファイルライクオブジェクトも指定できる（出力は WAV）。
+    memory を指定すると、同時に保持したバッファの最大バイト数を記録する。
+    cancel を指定すると、ブロック毎に中断されていないか確認する。
+    """
+    with AudioFile(_audio_source(input_path)) as src:
+        samplerate = src.samplerate
+        num_channels = src.num_channels
+        frames = src.frames
+        block = block_frames or max(frames, 1)
+
+        input_meter = LoudnessMeter(samplerate, num_channels)
+        output_meter = LoudnessMeter(samplerate, num_channels)
+
+        if isinstance(output_path, Path):
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            destination = AudioFile(str(output_path), "w", samplerate, num_channels)
+        else:
+            destination = AudioFile(output_path, "w", samplerate, num_channels, format="wav")
+        with destination as dst:
+            first = True
+            while src.tell() < frames:
+                if cancel is not None:
+                    cancel.check()
+                chunk = src.read(block)
+                input_meter.update(chunk)
+                effected = board(chunk, samplerate, reset=first)
+                first = False
+                output_meter.update(effected)
+                dst.write(effected)
+                if memory is not None:
+                    memory.record_buffers(chunk.nbytes + effected.nbytes)
+
+    return RenderResult(
+        samplerate=samplerate,
+        num_channels=num_channels,
+        frames=frames,
+        input_stats=input_meter.result(),
+        output_stats=output_meter.result(),
+    )
+
+
+def write_display_versions(
+    input_path: Path,
+    output_path: Path,
+    input_norm_path: Path,
+    output_norm_path: Path,
+    result: RenderResult,
+    mode: str = "peak",
+) -> None:
+    """解析済みの統計から表示用の正規化ファイルを書き出す（再解析はしない）"""
+    input_gain, output_gain = display_gains(result.input_stats, result.output_stats, mode=mode)
+    normalize_audio_for_display(input_path, input_norm_path, gain=input_gain)
+    normalize_audio_for_display(output_path, output_norm_path, gain=output_gain)
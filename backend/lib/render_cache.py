@@ -0,0 +1,318 @@
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Protocol
+
+from botocore.exceptions import ClientError
+
+# キャッシュする成果物の名前。統計は最後に書き、あれば一式が揃っている目印にする
+ARTIFACT_OUTPUT = "output.wav"
+ARTIFACT_INPUT_NORM = "input_norm.wav"
+ARTIFACT_OUTPUT_NORM = "output_norm.wav"
+ARTIFACT_STATS = "stats.json"
+ARTIFACTS = (ARTIFACT_OUTPUT, ARTIFACT_INPUT_NORM, ARTIFACT_OUTPUT_NORM, ARTIFACT_STATS)
+
+_NOT_FOUND_CODES = {"NoSuchKey", "404", "NotFound"}
+
+
+def _stats_last(files: Mapping[str, Path]) -> list[tuple[str, Path]]:
+    return sorted(files.items(), key=lambda item: item[0] == ARTIFACT_STATS)
+
+
+def _replace_from(copy: Callable[[Path], object], destination: Path) -> None:
+    """一時ファイルに書いてから差し替える（読み手が書き途中のファイルを見ない）"""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destination.with_name(f".{destination.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        copy(tmp)
+        os.replace(tmp, destination)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class RenderCache(Protocol):
+    """
+    レンダリング結果の2段目のキャッシュ（ワーカーやインスタンスをまたいで共有する）
+
+    キーは入力内容のハッシュ・正規化したチェーン・正規化方式から決めた render_key で、
+    成果物は ARTIFACTS の名前で保存する。
+    """
+
+    def load_stats(self, key: str) -> dict | None:
+        """統計を返す（一式が揃っていなければ None）。レンダリング前の存在確認に使う"""
+        ...
+
+    def fetch(self, key: str, files: Mapping[str, Path]) -> bool:
+        """成果物を files のパスに取り出す（揃っていなければ False）"""
+        ...
+
+    def store(self, key: str, files: Mapping[str, Path]) -> None:
+        """files の成果物を保存"""
+        ...
+
+    def location(self, key: str, name: str) -> tuple[str, str] | None:
+        """成果物を直接参照できる S3 の (バケット, キー)。ローカルのキャッシュは None"""
+        ...
+
+
+class DirectoryRenderCache:
+    """
+    ディレクトリに置くキャッシュ（同一ホストのワーカー間で共有するディスクや NFS）
+
+    成果物は root/<キーの先頭2文字>/<キー>/ に置き、存在確認は SQLite の索引で行う
+    （ディレクトリを走査しない）。一時ディレクトリに揃えてから rename で公開するため、
+    他のワーカーが書き途中の一式を読むことはない。合計が max_bytes を超えたら
+    古く保存したものから削除する。
+    """
+
+    def __init__(self, root: Path, max_bytes: int | None = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        root.mkdir(parents=True, exist_ok=True)
+        self._index_path = root / "index.sqlite3"
+        with self._index() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, stats TEXT NOT NULL, "
+                "bytes INTEGER NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _index(self) -> Iterator[sqlite3.Connection]:
+        # 接続はスレッド・プロセス間で共有しない（呼び出し毎に開く）
+        db = sqlite3.connect(self._index_path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _directory(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _forget(self, key: str) -> None:
+        with self._index() as db:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        shutil.rmtree(self._directory(key), ignore_errors=True)
+
+    def load_stats(self, key: str) -> dict | None:
+        with self._index() as db:
+            row = db.execute("SELECT stats FROM entries WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def fetch(self, key: str, files: Mapping[str, Path]) -> bool:
+        if self.load_stats(key) is None:
+            return False
+        directory = self._directory(key)
+        try:
+            for name, destination in _stats_last(files):
+                source = directory / name
+                _replace_from(lambda tmp, source=source: shutil.copyfile(source, tmp), destination)
+        except FileNotFoundError:
+            # 索引だけ残っている（ディレクトリが消された）場合は索引も消す
+            self._forget(key)
+            return False
+        return True
+
+    def store(self, key: str, files: Mapping[str, Path]) -> None:
+        directory = self._directory(key)
+        if self.load_stats(key) is not None:
+            return
+        # 索引に載る前に中断された一式は作り直す
+        shutil.rmtree(directory, ignore_errors=True)
+        staging = self.root / f".staging-{uuid.uuid4().hex}"
+        staging.mkdir()
+        try:
+            size = 0
+            for name, source in files.items():
+                shutil.copyfile(source, staging / name)
+                size += (staging / name).stat().st_size
+            directory.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                staging.rename(directory)
+            except OSError:
+                # 他のワーカーが同じキーを先に保存した
+                return
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        with self._index() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, (directory / ARTIFACT_STATS).read_text(), size, time.time()),
+            )
+        self._prune()
+
+    def _prune(self) -> None:
+        if self.max_bytes is None:
+            return
+        with self._index() as db:
+            total = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = db.execute("SELECT key, bytes FROM entries ORDER BY stored_at").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._forget(key)
+            total -= size
+
+    def location(self, key: str, name: str) -> tuple[str, str] | None:
+        return None
+
+
+class S3RenderCache:
+    """
+    S3 のプレフィックスに置くキャッシュ（Lambda のインスタンス間で共有する）
+
+    成果物は {prefix}{キー}/{名前} に置く。存在確認は小さな stats.json の取得と成果物の
+    HEAD で行い（ライフサイクルの期限切れなどで成果物だけが消えている場合はミス）、
+    同じバケットの成果物は取り出さずに Presigned URL で直接返せる。
+    クライアントは他の S3 処理と同様に client_factory() で都度取得する。
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str,
+        client_factory: Callable[[], Any],
+        extra_args: Mapping[str, str] | None = None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client_factory = client_factory
+        self.extra_args = dict(extra_args or {})
+
+    def object_key(self, key: str, name: str) -> str:
+        return f"{self.prefix}{key}/{name}"
+
+    def load_stats(self, key: str) -> dict | None:
+        s3 = self.client_factory()
+        try:
+            response = s3.get_object(Bucket=self.bucket, Key=self.object_key(key, ARTIFACT_STATS))
+            for name in ARTIFACTS:
+                if name != ARTIFACT_STATS:
+                    s3.head_object(Bucket=self.bucket, Key=self.object_key(key, name))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in _NOT_FOUND_CODES:
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def fetch(self, key: str, files: Mapping[str, Path]) -> bool:
+        s3 = self.client_factory()
+        try:
+            for name, destination in _stats_last(files):
+                object_key = self.object_key(key, name)
+                _replace_from(
+                    lambda tmp, object_key=object_key: s3.download_file(
+                        self.bucket, object_key, str(tmp)
+                    ),
+                    destination,
+                )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in _NOT_FOUND_CODES:
+                return False
+            raise
+        return True
+
+    def store(self, key: str, files: Mapping[str, Path]) -> None:
+        s3 = self.client_factory()
+        for name, source in _stats_last(files):
+            extra_args = (
+                {"ContentType": "application/json"}
+                if name == ARTIFACT_STATS
+                else dict(self.extra_args)
+            )
+            s3.upload_file(
+                str(source), self.bucket, self.object_key(key, name), ExtraArgs=extra_args
+            )
+
+    def location(self, key: str, name: str) -> tuple[str, str] | None:
+        return self.bucket, self.object_key(key, name)
+
+
+class WriteBehind:
+    """
+    キャッシュへの保存を別スレッドで行う（レスポンスを保存の完了まで待たせない）
+
+    待ちが max_pending 件を超えた分は保存せずに捨てる（キャッシュなので保存できなくても
+    結果は変わらない）。保存後は成否に関わらず on_done を呼ぶ（一時ファイルの削除など）。
+    スレッドが呼び出しの合間に止まる環境（Lambda）では store_now() で呼び出し元が保存する。
+    """
+
+    def __init__(self, cache: RenderCache, max_pending: int):
+        self.cache = cache
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stored = 0
+        self._failed = 0
+        self._dropped = 0
+        self._last_error: str | None = None
+
+    def _run(self) -> None:
+        while True:
+            key, files, on_done = self._queue.get()
+            try:
+                self.store_now(key, files, on_done)
+            finally:
+                self._queue.task_done()
+
+    def store_now(
+        self, key: str, files: Mapping[str, Path], on_done: Callable[[], None] | None = None
+    ) -> bool:
+        """呼び出したスレッドで保存（失敗は集計に残して False を返す）"""
+        try:
+            self.cache.store(key, files)
+            with self._lock:
+                self._stored += 1
+            return True
+        except Exception as e:
+            with self._lock:
+                self._failed += 1
+                self._last_error = f"{type(e).__name__}: {e}"
+            return False
+        finally:
+            if on_done is not None:
+                on_done()
+
+    def submit(
+        self, key: str, files: Mapping[str, Path], on_done: Callable[[], None] | None = None
+    ) -> bool:
+        """保存を予約（待ちが一杯なら on_done だけ呼んで False を返す）"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cache-writer", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((key, dict(files), on_done))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            if on_done is not None:
+                on_done()
+            return False
+        return True
+
+    def flush(self) -> None:
+        """予約済みの保存が終わるまで待つ"""
+        self._queue.join()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "stored_total": self._stored,
+                "failed_total": self._failed,
+                "dropped_total": self._dropped,
+                "last_error": self._last_error,
+            }
@@ -0,0 +1,349 @@
+import queue
+import struct
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Generic, TypeVar, cast
+
+import numpy as np
+from pedalboard import Pedalboard
+
+from .analysis import LoudnessMeter
+from .cancellation import CancelToken
+from .memory import MemoryTracker
+from .render import RenderResult
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# 出力は render_file（pedalboard の WAV の既定）と同じ 16bit PCM
+OUTPUT_BITS_PER_SAMPLE = 16
+
+# 待ち行列の出し入れで停止を確認する間隔
+_POLL_SECONDS = 0.1
+
+
+# 整数 PCM の変換は pedalboard（JUCE）に合わせる: 読み込みは正の最大値で割り、
+# 書き込みは 2^(bits-1) 倍して範囲内に丸める
+def _pcm8(data: bytes) -> np.ndarray:
+    return (np.frombuffer(data, np.uint8).astype(np.float32) - 128) / 127
+
+
+def _pcm16(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, "<i2").astype(np.float32) / 32767
+
+
+def _pcm24(data: bytes) -> np.ndarray:
+    raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+    values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+    return ((values ^ 0x800000) - 0x800000).astype(np.float32) / 8388607
+
+
+def _pcm32(data: bytes) -> np.ndarray:
+    return (np.frombuffer(data, "<i4") / 2147483647).astype(np.float32)
+
+
+def _float32(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, "<f4").astype(np.float32)
+
+
+def _float64(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, "<f8").astype(np.float32)
+
+
+# (フォーマットタグ, ビット数) 毎のサンプルのデコーダ（インターリーブされた1次元配列を返す）
+_DECODERS: dict[tuple[int, int], Callable[[bytes], np.ndarray]] = {
+    (WAVE_FORMAT_PCM, 8): _pcm8,
+    (WAVE_FORMAT_PCM, 16): _pcm16,
+    (WAVE_FORMAT_PCM, 24): _pcm24,
+    (WAVE_FORMAT_PCM, 32): _pcm32,
+    (WAVE_FORMAT_IEEE_FLOAT, 32): _float32,
+    (WAVE_FORMAT_IEEE_FLOAT, 64): _float64,
+}
+
+
+@dataclass(frozen=True)
+class WavFormat:
+    """WAV のサンプル形式と data チャンクの位置"""
+
+    samplerate: int
+    num_channels: int
+    format_tag: int
+    bits_per_sample: int
+    data_offset: int
+    data_bytes: int
+
+    @property
+    def block_align(self) -> int:
+        return self.num_channels * self.bits_per_sample // 8
+
+    @property
+    def frames(self) -> int:
+        return self.data_bytes // self.block_align
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """data チャンクのバイト列を (チャンネル, フレーム) の float32 に変換"""
+        samples = _DECODERS[(self.format_tag, self.bits_per_sample)](data)
+        return np.ascontiguousarray(samples.reshape(-1, self.num_channels).T)
+
+
+def parse_wav_header(data: bytes, total_bytes: int | None = None) -> WavFormat | None:
+    """
+    ファイル先頭のバイト列から WAV のフォーマットと data チャンクの位置を読む
+
+    WAV 以外、対応外のサンプル形式、data チャンクの開始が data に含まれない場合は
+    None を返す（呼び出し側は通常の経路で処理する）。total_bytes を渡すと、ヘッダーの
+    サイズが実際より大きい（ストリーミングで書かれた WAV など）場合に切り詰める。
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = data[pos : pos + 4]
+        size = struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            if body + 16 > len(data):
+                return None
+            tag, channels, samplerate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if tag == WAVE_FORMAT_EXTENSIBLE and size >= 26 and body + 26 <= len(data):
+                # サブフォーマット GUID の先頭2バイトが実際のフォーマットタグ
+                tag = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = (tag, channels, samplerate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            tag, channels, samplerate, bits = fmt
+            if (tag, bits) not in _DECODERS or channels == 0 or samplerate == 0:
+                return None
+            data_bytes = size if total_bytes is None else min(size, total_bytes - body)
+            return WavFormat(samplerate, channels, tag, bits, body, data_bytes)
+        pos = body + size + (size & 1)
+    return None
+
+
+def wav_header(samplerate: float, num_channels: int, frames: int) -> bytes:
+    """16bit PCM の WAV ヘッダー（出力のフレーム数が事前に分かるため先頭に書ける）"""
+    block_align = num_channels * OUTPUT_BITS_PER_SAMPLE // 8
+    data_bytes = frames * block_align
+    return (
+        b"RIFF"
+        + struct.pack("<I", 36 + data_bytes)
+        + b"WAVEfmt "
+        + struct.pack(
+            "<IHHIIHH",
+            16,
+            WAVE_FORMAT_PCM,
+            num_channels,
+            int(samplerate),
+            int(samplerate) * block_align,
+            block_align,
+            OUTPUT_BITS_PER_SAMPLE,
+        )
+        + b"data"
+        + struct.pack("<I", data_bytes)
+    )
+
+
+def encode_pcm16(samples: np.ndarray) -> bytes:
+    """(チャンネル, フレーム) の float32 をインターリーブした 16bit PCM に変換"""
+    scaled = np.clip(np.rint(samples * 32768), -32768, 32767)
+    return scaled.T.astype("<i2").tobytes()
+
+
+def decode_wav_stream(
+    chunks: Iterable[bytes], fmt: WavFormat, block_frames: int
+) -> Iterator[np.ndarray]:
+    """
+    ファイル先頭から順に届くバイト列を block_frames ずつデコードして返す
+
+    data チャンクより前と後ろのバイト列は読み飛ばす。最後のブロックは短くなる。
+    """
+    block_bytes = block_frames * fmt.block_align
+    remaining = fmt.frames * fmt.block_align
+    skip = fmt.data_offset
+    buffer = bytearray()
+    for chunk in chunks:
+        if skip:
+            if len(chunk) <= skip:
+                skip -= len(chunk)
+                continue
+            chunk = chunk[skip:]
+            skip = 0
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        buffer += chunk
+        while len(buffer) >= block_bytes:
+            yield fmt.decode(bytes(buffer[:block_bytes]))
+            del buffer[:block_bytes]
+        if remaining == 0:
+            break
+    if remaining:
+        raise ValueError(f"WAV data is truncated ({remaining} bytes missing)")
+    if buffer:
+        yield fmt.decode(bytes(buffer))
+
+
+def _fit_frames(samples: np.ndarray, frames: int) -> np.ndarray:
+    # ヘッダーに書いたフレーム数と一致させる（プラグインが長さを変えた場合の保険）
+    if samples.shape[1] == frames:
+        return samples
+    if samples.shape[1] > frames:
+        return samples[:, :frames]
+    return np.pad(samples, ((0, 0), (0, frames - samples.shape[1])))
+
+
+def render_wav_stream(
+    chunks: Iterable[bytes],
+    fmt: WavFormat,
+    board: Pedalboard,
+    write: Callable[[bytes], None],
+    block_frames: int,
+    memory: MemoryTracker | None = None,
+    cancel: CancelToken | None = None,
+) -> RenderResult:
+    """
+    届いた順に WAV をデコード・レンダリング・エンコードし、write に渡す
+
+    render_file のストリーミング版で、ファイル全体を待たずにブロック単位で処理する
+    （Pedalboard は reset=False で状態を引き継ぐ）。出力は 16bit PCM の WAV で、
+    ヘッダーを最初に書く。入出力の解析も同じパスで行う。cancel を指定すると、
+    ブロック毎に中断されていないか確認する。
+    """
+    input_meter = LoudnessMeter(fmt.samplerate, fmt.num_channels)
+    output_meter = LoudnessMeter(fmt.samplerate, fmt.num_channels)
+    write(wav_header(fmt.samplerate, fmt.num_channels, fmt.frames))
+    first = True
+    for chunk in decode_wav_stream(chunks, fmt, block_frames):
+        if cancel is not None:
+            cancel.check()
+        input_meter.update(chunk)
+        effected = _fit_frames(board(chunk, fmt.samplerate, reset=first), chunk.shape[1])
+        first = False
+        output_meter.update(effected)
+        write(encode_pcm16(effected))
+        if memory is not None:
+            memory.record_buffers(chunk.nbytes + effected.nbytes)
+
+    return RenderResult(
+        samplerate=fmt.samplerate,
+        num_channels=fmt.num_channels,
+        frames=fmt.frames,
+        input_stats=input_meter.result(),
+        output_stats=output_meter.result(),
+    )
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """stop が立つまで item を入れようとする（入れられたら True）"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(items: Iterable[T], depth: int) -> Iterator[T]:
+    """
+    items を別スレッドで先読みして順に返す
+
+    待ち行列は最大 depth 件で、消費が追いつかない間は先読みも止まる。items の例外は
+    取り出した側で送出し、途中で閉じられた場合は先読みを打ち切る。
+    """
+    q: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not _put(q, item, stop):
+                    return
+            _put(q, _END, stop)
+        except BaseException as e:
+            _put(q, _Failure(e), stop)
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class BackgroundConsumer(Generic[T, R]):
+    """
+    put() した値を別スレッドの consume(値のイテレータ) で処理する
+
+    待ち行列は最大 depth 件で、consume が追いつかない間は put() が待つ。consume の
+    例外は次の put() または close() で送出する。abort() で consume 側のイテレータに
+    例外を送り、後始末（マルチパートアップロードの中止など）をさせる。
+    """
+
+    def __init__(self, consume: Callable[[Iterator[T]], R], depth: int):
+        self._consume = consume
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._done = threading.Event()
+        self._result: R | None = None
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name="consumer", daemon=True)
+        self._thread.start()
+
+    def _items(self) -> Iterator[T]:
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    def _run(self) -> None:
+        try:
+            self._result = self._consume(self._items())
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def put(self, item: T) -> None:
+        if not _put(self._queue, item, self._done):
+            self._raise_error()
+            raise RuntimeError("Consumer stopped before the end of input")
+
+    def close(self) -> R:
+        """入力の終わりを伝え、consume の結果を返す"""
+        _put(self._queue, _END, self._done)
+        self._thread.join()
+        self._raise_error()
+        return cast(R, self._result)
+
+    def abort(self, error: BaseException) -> None:
+        """consume に error を送って終了を待つ（consume の例外は送出しない）"""
+        _put(self._queue, _Failure(error), self._done)
+        self._thread.join()
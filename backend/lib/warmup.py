@@ -0,0 +1,103 @@
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from pedalboard.io import AudioFile
+
+from .chain import compile_effect_chain
+from .effects import EFFECT_MAPPING
+from .render import render_file, write_display_versions
+
+# ウォームアップに使う合成音声（短いサイン波）
+_WARMUP_SAMPLE_RATE = 44100
+_WARMUP_SECONDS = 0.25
+# 代表的なチェーン（歪み・モジュレーション・空間系を一通り通す）
+_WARMUP_CHAIN = [
+    {"name": "Blues Driver"},
+    {"name": "Chorus"},
+    {"name": "Delay"},
+    {"name": "Reverb"},
+]
+
+
+@dataclass(frozen=True)
+class WarmupReport:
+    """ウォームアップの所要時間（秒）"""
+
+    total_seconds: float
+    steps: dict[str, float]
+
+    def to_dict(self) -> dict:
+        return {
+            "total_seconds": round(self.total_seconds, 4),
+            "steps": {name: round(seconds, 4) for name, seconds in self.steps.items()},
+        }
+
+
+_report: WarmupReport | None = None
+_lock = threading.Lock()
+
+
+def last_warmup() -> WarmupReport | None:
+    """直近のウォームアップ結果（未実行なら None）"""
+    return _report
+
+
+def _synthetic_audio() -> np.ndarray:
+    t = np.arange(int(_WARMUP_SAMPLE_RATE * _WARMUP_SECONDS)) / _WARMUP_SAMPLE_RATE
+    tone = 0.5 * np.sin(2 * np.pi * 220.0 * t)
+    return np.stack([tone, tone]).astype(np.float32)
+
+
+def warm_up(force: bool = False) -> WarmupReport:
+    """
+    初回リクエストの遅延を避けるため、遅延初期化される処理を事前に一通り実行
+
+    全エフェクトのインスタンス化と短い音声の処理、代表的なチェーンでのレンダリング
+    （WAV のデコード・エンコード、解析、表示用正規化を含む）を行う。2回目以降は
+    force を指定しない限り前回の結果を返す。
+    """
+    global _report
+    with _lock:
+        if _report is not None and not force:
+            return _report
+
+        steps = {}
+        start = time.perf_counter()
+        audio = _synthetic_audio()
+
+        step_start = time.perf_counter()
+        for config in EFFECT_MAPPING.values():
+            plugin = config["class"](**config["params"])
+            plugin(audio, _WARMUP_SAMPLE_RATE)
+        steps["plugins"] = time.perf_counter() - step_start
+
+        with tempfile.TemporaryDirectory(prefix="warmup-") as workdir:
+            directory = Path(workdir)
+            input_path = directory / "input.wav"
+
+            step_start = time.perf_counter()
+            with AudioFile(str(input_path), "w", _WARMUP_SAMPLE_RATE, audio.shape[0]) as f:
+                f.write(audio)
+            steps["encode"] = time.perf_counter() - step_start
+
+            step_start = time.perf_counter()
+            board = compile_effect_chain(_WARMUP_CHAIN).build()
+            result = render_file(input_path, directory / "output.wav", board)
+            steps["render"] = time.perf_counter() - step_start
+
+            step_start = time.perf_counter()
+            write_display_versions(
+                input_path,
+                directory / "output.wav",
+                directory / "input_norm.wav",
+                directory / "output_norm.wav",
+                result,
+            )
+            steps["normalize"] = time.perf_counter() - step_start
+
+        _report = WarmupReport(total_seconds=time.perf_counter() - start, steps=steps)
+        return _report
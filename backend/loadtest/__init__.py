@@ -0,0 +1,4 @@
+from .runner import SCENARIOS, Scenario, ScenarioReport, run
+from .s3_stub import InMemoryS3
+
+__all__ = ["SCENARIOS", "InMemoryS3", "Scenario", "ScenarioReport", "run"]
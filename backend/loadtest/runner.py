@@ -0,0 +1,525 @@
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+import numpy as np
+from pedalboard.io import AudioFile
+
+from .s3_stub import InMemoryS3
+
+ENDPOINTS = ("process", "s3-process", "upload-url", "effects")
+
+# 定義済みのトラフィック構成（エンドポイント → 重み）
+SCENARIOS = {
+    "effects": {"effects": 1},
+    "process": {"process": 1},
+    "s3": {"upload-url": 1, "s3-process": 1},
+    "mixed": {"process": 4, "s3-process": 2, "upload-url": 1, "effects": 3},
+}
+
+DEFAULT_CHAIN = [{"name": "Blues Driver"}, {"name": "Chorus"}, {"name": "Delay"}]
+INPUT_FILENAME = "loadtest.wav"
+LOADTEST_BUCKET = "loadtest-bucket"
+S3_INPUT_KEY = "input/loadtest.wav"
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """負荷シナリオ"""
+
+    name: str
+    mix: dict[str, int]
+    concurrency: int
+    requests: int
+
+
+@dataclass
+class LatencySummary:
+    """レイテンシ・エラー率の集計"""
+
+    requests: int
+    errors: int
+    error_rate: float
+    p50_ms: float | None
+    p90_ms: float | None
+    p99_ms: float | None
+    max_ms: float | None
+
+
+@dataclass
+class ScenarioReport:
+    """シナリオ1件分の結果"""
+
+    name: str
+    target: str
+    concurrency: int
+    duration_seconds: float
+    requests_per_second: float
+    peak_rss_bytes: int | None
+    overall: LatencySummary
+    endpoints: dict[str, LatencySummary] = field(default_factory=dict)
+    # 最初に送ったリクエストのレイテンシ（コールドスタートの影響を見る）
+    first_request_ms: float | None = None
+    # サーバー側のウォームアップ所要時間（/api/health から取得、未実行なら None）
+    warmup_seconds: float | None = None
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(np.ceil(p / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(samples: list[tuple[float, bool]]) -> LatencySummary:
+    """(レイテンシ秒, 成功) の列を集計"""
+    latencies_ms = [latency * 1000 for latency, _ in samples]
+    errors = sum(1 for _, ok in samples if not ok)
+    return LatencySummary(
+        requests=len(samples),
+        errors=errors,
+        error_rate=errors / len(samples) if samples else 0.0,
+        p50_ms=percentile(latencies_ms, 50),
+        p90_ms=percentile(latencies_ms, 90),
+        p99_ms=percentile(latencies_ms, 99),
+        max_ms=max(latencies_ms) if latencies_ms else None,
+    )
+
+
+def parse_mix(text: str) -> dict[str, int]:
+    """トラフィック構成（例: process=4,effects=1）を解析"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+class RssSampler:
+    """プロセスの RSS を定期的に読み取りピークを記録"""
+
+    def __init__(self, pid: int | None = None, interval_seconds: float = 0.02):
+        self.pid = pid or os.getpid()
+        self.interval_seconds = interval_seconds
+        self.peak_bytes: int | None = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _read(self) -> int | None:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        if self.pid == os.getpid():
+            # /proc がない環境ではプロセス起動以来の最大値で代用
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            rss = self._read()
+            if rss is not None:
+                self.peak_bytes = max(self.peak_bytes or 0, rss)
+            self._stop.wait(self.interval_seconds)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class AsgiTarget:
+    """FastAPI アプリをプロセス内で直接呼び出す"""
+
+    name = "asgi"
+
+    def __init__(self, app):
+        self.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=None
+        )
+
+    async def send(self, method: str, path: str, body: dict | None) -> tuple[int, bytes]:
+        response = await self.client.request(method, path, json=body)
+        return response.status_code, response.content
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class HttpTarget:
+    """起動済みのサーバー（uvicorn など）に HTTP で送信"""
+
+    name = "http"
+
+    def __init__(self, base_url: str):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=None)
+
+    async def send(self, method: str, path: str, body: dict | None) -> tuple[int, bytes]:
+        response = await self.client.request(method, path, json=body)
+        return response.status_code, response.content
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+@dataclass
+class _LambdaContext:
+    function_name: str = "loadtest"
+    memory_limit_in_mb: int = 1024
+    aws_request_id: str = "loadtest"
+    deadline: float = 0.0
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+class LambdaTarget:
+    """
+    lambda_function.handler に API Gateway (HTTP API) 形式のイベントを渡す
+
+    Lambda の1インスタンスは1リクエストずつ処理するため、並列数分のスレッドを
+    それぞれ独立したインスタンスとして扱う。
+    """
+
+    name = "lambda"
+
+    def __init__(self, handler, concurrency: int, timeout_seconds: float = 30.0):
+        self.handler = handler
+        self.timeout_seconds = timeout_seconds
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency,
+            thread_name_prefix="lambda",
+            initializer=lambda: asyncio.set_event_loop(asyncio.new_event_loop()),
+        )
+
+    def _event(self, method: str, path: str, body: dict | None) -> dict:
+        return {
+            "version": "2.0",
+            "routeKey": "$default",
+            "rawPath": path,
+            "rawQueryString": "",
+            "headers": {"host": "localhost", "content-type": "application/json"},
+            "requestContext": {
+                "http": {
+                    "method": method,
+                    "path": path,
+                    "protocol": "HTTP/1.1",
+                    "sourceIp": "127.0.0.1",
+                    "userAgent": "loadtest",
+                },
+                "requestId": "loadtest",
+                "routeKey": "$default",
+                "stage": "$default",
+                "timeEpoch": int(time.time() * 1000),
+            },
+            "body": json.dumps(body) if body is not None else None,
+            "isBase64Encoded": False,
+        }
+
+    def _invoke(self, method: str, path: str, body: dict | None) -> tuple[int, bytes]:
+        context = _LambdaContext(deadline=time.monotonic() + self.timeout_seconds)
+        result = self.handler(self._event(method, path, body), context)
+        payload = result.get("body") or ""
+        if result.get("isBase64Encoded"):
+            return result["statusCode"], base64.b64decode(payload)
+        return result["statusCode"], payload.encode()
+
+    async def send(self, method: str, path: str, body: dict | None) -> tuple[int, bytes]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._invoke, method, path, body)
+
+    async def close(self) -> None:
+        self.executor.shutdown()
+
+
+def write_input_audio(path: Path, seconds: float, sample_rate: int = 44100) -> None:
+    """負荷試験用の入力音声（ノイズ混じりの和音）を生成"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    tone = sum(np.sin(2 * np.pi * f * t) for f in (110.0, 220.0, 330.0)) / 3
+    audio = 0.5 * tone + 0.05 * rng.standard_normal(t.shape)
+    stereo = np.vstack([audio, audio]).astype(np.float32)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with AudioFile(str(path), "w", sample_rate, 2) as f:
+        f.write(stereo)
+
+
+class RequestFactory:
+    """エンドポイント名からリクエストを組み立てる"""
+
+    def __init__(self, chain: list[dict], cache_hits: bool, seed: int):
+        self.chain = chain
+        self.cache_hits = cache_hits
+        self.rng = random.Random(seed)
+
+    def _chain(self) -> list[dict]:
+        if self.cache_hits:
+            return self.chain
+        # 毎回異なるゲインを足して出力キャッシュを無効化する
+        gain = round(self.rng.uniform(0.01, 1.0), 6)
+        return [*self.chain, {"name": "Booster_Preamp", "params": {"gain_db": gain}}]
+
+    def build(self, endpoint: str) -> tuple[str, str, dict | None]:
+        if endpoint == "effects":
+            return "GET", "/api/effects", None
+        if endpoint == "upload-url":
+            return "POST", "/api/upload-url", {"filename": INPUT_FILENAME}
+        if endpoint == "process":
+            return (
+                "POST",
+                "/api/process",
+                {"input_file": INPUT_FILENAME, "effect_chain": self._chain()},
+            )
+        if endpoint == "s3-process":
+            return (
+                "POST",
+                "/api/s3-process",
+                {"s3_key": S3_INPUT_KEY, "effect_chain": self._chain()},
+            )
+        raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+async def run_scenario(
+    target, scenario: Scenario, factory: RequestFactory, server_pid: int | None = None
+) -> ScenarioReport:
+    """シナリオを実行して結果を集計"""
+    sequence = [name for name, weight in scenario.mix.items() for _ in range(weight)]
+    schedule = itertools.islice(itertools.cycle(sequence), scenario.requests)
+    queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue()
+    for index, endpoint in enumerate(schedule):
+        queue.put_nowait((index, endpoint))
+
+    samples: dict[str, list[tuple[float, bool]]] = {name: [] for name in scenario.mix}
+    first_request: list[float] = []
+
+    async def worker() -> None:
+        while True:
+            try:
+                index, endpoint = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            method, path, body = factory.build(endpoint)
+            start = time.perf_counter()
+            try:
+                status, _ = await target.send(method, path, body)
+                ok = status < 400
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            samples[endpoint].append((elapsed, ok))
+            if index == 0:
+                first_request.append(elapsed)
+
+    with RssSampler(server_pid) as sampler:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(scenario.concurrency)))
+        duration = time.perf_counter() - start
+
+    all_samples = [sample for values in samples.values() for sample in values]
+    return ScenarioReport(
+        name=scenario.name,
+        target=target.name,
+        concurrency=scenario.concurrency,
+        duration_seconds=duration,
+        requests_per_second=len(all_samples) / duration if duration > 0 else 0.0,
+        peak_rss_bytes=sampler.peak_bytes,
+        overall=summarize(all_samples),
+        endpoints={name: summarize(values) for name, values in samples.items()},
+        first_request_ms=first_request[0] * 1000 if first_request else None,
+        warmup_seconds=await _warmup_seconds(target),
+    )
+
+
+async def _warmup_seconds(target) -> float | None:
+    try:
+        status, body = await target.send("GET", "/api/health", None)
+        warmup = json.loads(body).get("warmup") if status == 200 else None
+    except Exception:
+        return None
+    return warmup["total_seconds"] if warmup else None
+
+
+def _in_process_environment(
+    stack: ExitStack, workdir: Path, audio_seconds: float, warmup: bool
+) -> InMemoryS3:
+    """
+    プロセス内ターゲット用に入出力ディレクトリと S3 の代替を設定
+
+    ウォームアップは lambda_function の読み込み時ではなくここで明示的に行い、
+    warmup が偽なら行わない（コールドスタートの比較は別プロセスで実行する）。
+    """
+    from api import config, routes
+    from lib import warm_up
+
+    input_dir = workdir / "input"
+    output_dir = workdir / "output"
+    write_input_audio(input_dir / INPUT_FILENAME, audio_seconds)
+
+    s3 = InMemoryS3()
+    s3.put_object(
+        Bucket=LOADTEST_BUCKET, Key=S3_INPUT_KEY, Body=(input_dir / INPUT_FILENAME).read_bytes()
+    )
+
+    stack.enter_context(patch.object(routes, "AUDIO_INPUT_DIR", input_dir))
+    stack.enter_context(patch.object(routes, "AUDIO_OUTPUT_DIR", output_dir))
+    stack.enter_context(patch.object(routes, "AUDIO_NORMALIZED_DIR", output_dir / "normalized"))
+    stack.enter_context(patch.object(routes, "S3_BUCKET", LOADTEST_BUCKET))
+    stack.enter_context(patch.object(routes, "get_s3_client", lambda: s3))
+    stack.enter_context(patch.object(config, "WARMUP_ON_STARTUP", False))
+    if warmup:
+        warm_up()
+    return s3
+
+
+def make_target(kind: str, concurrency: int, url: str | None):
+    if kind == "asgi":
+        from main import app
+
+        return AsgiTarget(app)
+    if kind == "lambda":
+        from lambda_function import handler
+
+        return LambdaTarget(handler, concurrency)
+    if kind == "http":
+        if not url:
+            raise ValueError("--url is required for the http target")
+        return HttpTarget(url)
+    raise ValueError(f"Unknown target: {kind}")
+
+
+async def run(
+    scenarios: list[Scenario],
+    target_kind: str = "asgi",
+    url: str | None = None,
+    audio_seconds: float = 5.0,
+    chain: list[dict] | None = None,
+    cache_hits: bool = False,
+    seed: int = 0,
+    server_pid: int | None = None,
+    warmup: bool = True,
+) -> list[ScenarioReport]:
+    """
+    シナリオを順に実行
+
+    asgi / lambda ターゲットではアプリをこのプロセス内で動かし、入力音声の生成と
+    S3 の代替（InMemoryS3）を自動で設定するため、オフラインで全経路を計測できる。
+    http ターゲットではサーバー側に loadtest.wav と S3 が用意されている必要がある。
+    warmup が偽の場合、プロセス内ターゲットは起動時のウォームアップを行わない。
+    """
+    reports = []
+    with ExitStack() as stack, tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        if target_kind != "http":
+            _in_process_environment(stack, Path(workdir), audio_seconds, warmup)
+        for scenario in scenarios:
+            target = make_target(target_kind, scenario.concurrency, url)
+            factory = RequestFactory(chain or DEFAULT_CHAIN, cache_hits, seed)
+            try:
+                reports.append(await run_scenario(target, scenario, factory, server_pid))
+            finally:
+                await target.close()
+    return reports
+
+
+def _format_ms(value: float | None) -> str:
+    return f"{value:8.1f}" if value is not None else "       -"
+
+
+def format_report(report: ScenarioReport) -> str:
+    """結果を表形式の文字列に整形"""
+    rss = f"{report.peak_rss_bytes / 1024**2:.1f} MiB" if report.peak_rss_bytes else "-"
+    warmup = f"{report.warmup_seconds * 1000:.1f} ms" if report.warmup_seconds else "off"
+    lines = [
+        f"== {report.name} (target={report.target}, concurrency={report.concurrency})",
+        f"   {report.overall.requests} requests in {report.duration_seconds:.2f}s"
+        f" = {report.requests_per_second:.1f} req/s, peak RSS {rss}",
+        f"   warm-up {warmup}, first request {_format_ms(report.first_request_ms).strip()} ms",
+        f"   {'endpoint':<12} {'count':>6} {'errors':>7} {'p50 ms':>8} {'p90 ms':>8}"
+        f" {'p99 ms':>8} {'max ms':>8}",
+    ]
+    rows = [*report.endpoints.items(), ("(all)", report.overall)]
+    for name, summary in rows:
+        lines.append(
+            f"   {name:<12} {summary.requests:>6} {summary.error_rate:>6.1%}"
+            f" {_format_ms(summary.p50_ms)} {_format_ms(summary.p90_ms)}"
+            f" {_format_ms(summary.p99_ms)} {_format_ms(summary.max_ms)}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Pedalboard API の負荷試験")
+    parser.add_argument("--target", choices=["asgi", "lambda", "http"], default="asgi")
+    parser.add_argument("--url", help="http ターゲットのベース URL")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="定義済みシナリオ（複数指定可）",
+    )
+    parser.add_argument("--mix", help='独自のトラフィック構成（例: "process=4,effects=1"）')
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    parser.add_argument("--chain", help="エフェクトチェーンの JSON")
+    parser.add_argument("--cache-hits", action="store_true", help="出力キャッシュを無効化しない")
+    parser.add_argument(
+        "--server-pid", type=int, help="http ターゲットの RSS を計測するプロセス ID"
+    )
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="プロセス内ターゲットで起動時のウォームアップを行わない",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="結果を JSON で書き出すパス")
+    args = parser.parse_args(argv)
+
+    scenarios = [
+        Scenario(name, SCENARIOS[name], args.concurrency, args.requests)
+        for name in args.scenario or ([] if args.mix else ["mixed"])
+    ]
+    if args.mix:
+        scenarios.append(Scenario("custom", parse_mix(args.mix), args.concurrency, args.requests))
+
+    reports = asyncio.run(
+        run(
+            scenarios,
+            target_kind=args.target,
+            url=args.url,
+            audio_seconds=args.audio_seconds,
+            chain=json.loads(args.chain) if args.chain else None,
+            cache_hits=args.cache_hits,
+            seed=args.seed,
+            server_pid=args.server_pid,
+            warmup=not args.no_warmup,
+        )
+    )
+    for report in reports:
+        print(format_report(report))
+    if args.json:
+        args.json.write_text(json.dumps([asdict(report) for report in reports], indent=2))
@@ -0,0 +1,161 @@
+import hashlib
+import io
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import BinaryIO
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
+
+
+def _not_found(operation: str, key: str) -> ClientError:
+    return ClientError(
+        {"Error": {"Code": "NoSuchKey", "Message": f"Not found: {key}"}},
+        operation,
+    )
+
+
+class InMemoryS3:
+    """
+    プロセス内で動作する S3 クライアントの代替
+
+    API が使う boto3 クライアントのメソッドだけを実装し、オブジェクトはメモリ上に保持する。
+    Presigned URL は memory:// 形式の文字列を返す。
+    """
+
+    def __init__(self):
+        self._objects: dict[tuple[str, str], dict] = {}
+        self._uploads: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _put(self, bucket: str, key: str, body: bytes, **metadata) -> None:
+        with self._lock:
+            self._objects[(bucket, key)] = {"Body": body, **metadata}
+
+    def _get(self, operation: str, bucket: str, key: str) -> dict:
+        with self._lock:
+            obj = self._objects.get((bucket, key))
+        if obj is None:
+            raise _not_found(operation, key)
+        return obj
+
+    def keys(self, bucket: str, prefix: str = "") -> list[str]:
+        """バケット内のキー一覧（検証用）"""
+        with self._lock:
+            return sorted(k for b, k in self._objects if b == bucket and k.startswith(prefix))
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600):
+        params = Params or {}
+        return f"memory://{params['Bucket']}/{quote(params['Key'])}?op={ClientMethod}"
+
+    def put_object(
+        self,
+        Bucket,
+        Key,
+        Body: bytes | BinaryIO = b"",
+        ContentType=None,
+        CacheControl=None,
+        **kwargs,
+    ):
+        body = Body if isinstance(Body, bytes) else Body.read()
+        self._put(Bucket, Key, body, ContentType=ContentType, CacheControl=CacheControl)
+        return {"ETag": f'"{hashlib.md5(body).hexdigest()}"'}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        obj = self._get("GetObject", Bucket, Key)
+        body = obj["Body"]
+        if Range:
+            start_text, end_text = Range.removeprefix("bytes=").split("-")
+            start = int(start_text)
+            end = int(end_text) + 1 if end_text else len(body)
+            body = body[start:end]
+        return {"Body": io.BytesIO(body), "ContentLength": len(body)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        obj = self._get("HeadObject", Bucket, Key)
+        return {
+            "ContentLength": len(obj["Body"]),
+            "ContentType": obj.get("ContentType"),
+            "ETag": f'"{hashlib.md5(obj["Body"]).hexdigest()}"',
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        # S3 と同様に、存在しないキーの削除も成功として扱う
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        obj = self._get("HeadObject", Bucket, Key)
+        Path(Filename).write_bytes(obj["Body"])
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, **kwargs):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket, Key, f, **(ExtraArgs or {}))
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, CacheControl=None, **kwargs):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {
+                "Bucket": Bucket,
+                "Key": Key,
+                "Parts": {},
+                "ContentType": ContentType,
+                "CacheControl": CacheControl,
+            }
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _upload(self, operation: str, upload_id: str) -> dict:
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise ClientError(
+                {"Error": {"Code": "NoSuchUpload", "Message": f"Not found: {upload_id}"}},
+                operation,
+            )
+        return upload
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body: bytes | BinaryIO, **kwargs):
+        body = Body if isinstance(Body, bytes) else Body.read()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        upload = self._upload("UploadPart", UploadId)
+        with self._lock:
+            upload["Parts"][PartNumber] = (etag, body)
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        upload = self._upload("CompleteMultipartUpload", UploadId)
+        body = b""
+        for part in MultipartUpload["Parts"]:
+            etag, data = upload["Parts"][part["PartNumber"]]
+            if etag != part["ETag"]:
+                raise ClientError(
+                    {"Error": {"Code": "InvalidPart", "Message": f"ETag mismatch: {etag}"}},
+                    "CompleteMultipartUpload",
+                )
+            body += data
+        with self._lock:
+            del self._uploads[UploadId]
+        self._put(
+            Bucket,
+            Key,
+            body,
+            ContentType=upload["ContentType"],
+            CacheControl=upload["CacheControl"],
+        )
+        return {"Bucket": Bucket, "Key": Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def pending_uploads(self) -> list[str]:
+        """完了・中止していないマルチパートアップロードのキー（検証用）"""
+        with self._lock:
+            return sorted(upload["Key"] for upload in self._uploads.values())
+
+    def download_fileobj(self, Bucket, Key, Fileobj, **kwargs):
+        shutil.copyfileobj(io.BytesIO(self._get("HeadObject", Bucket, Key)["Body"]), Fileobj)
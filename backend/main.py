@@ -1,13 +1,43 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+
+from api.config import (
+    CORS_ORIGINS,
+    COST_MODEL_CALIBRATE,
+    COST_MODEL_PATH,
+    PRERENDER_ENABLED,
+    WARMUP_ON_STARTUP,
+)
+from api.prerender import prerenderer
+from api.routes import janitor, router
+from lib import load_cost_model, warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    起動時にコストモデルの読み込みとウォームアップを行い、出力ファイルの掃除と
+    （有効なら）事前レンダリングを開始
+    """
+    await run_in_threadpool(load_cost_model, COST_MODEL_PATH, COST_MODEL_CALIBRATE)
+    if WARMUP_ON_STARTUP:
+        await run_in_threadpool(warm_up)
+    janitor.start()
+    if PRERENDER_ENABLED:
+        prerenderer.start()
+    yield
+    prerenderer.stop()
+    janitor.stop()
 
-from api.config import CORS_ORIGINS
-from api.routes import router
 
 app = FastAPI(
     title="Pedalboard API",
     description="ギターエフェクト処理API",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -16,6 +46,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "Content-Disposition",
+        "X-Input-Stats",
+        "X-Output-Stats",
+        "X-Profile-Url",
+        "Idempotent-Replayed",
+    ],
 )
 
 app.include_router(router)
@@ -1,6 +1,64 @@
+import asyncio
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pytest
 from pedalboard import Pedalboard
+from pedalboard.io import AudioFile
+
+from lib import (
+    ARTIFACT_INPUT_NORM,
+    ARTIFACT_OUTPUT,
+    ARTIFACT_OUTPUT_NORM,
+    ARTIFACT_STATS,
+    EFFECT_MAPPING,
+    AdmissionController,
+    BackgroundConsumer,
+    CancellationMetrics,
+    Cancelled,
+    CancelToken,
+    DirectoryRenderCache,
+    EffectChainError,
+    IdempotencyStore,
+    LoudnessMeter,
+    MemoryTracker,
+    OutputJanitor,
+    Overloaded,
+    Prerenderer,
+    PrerenderJob,
+    RenderCost,
+    RequestPopularity,
+    S3RenderCache,
+    SamplingProfiler,
+    SingleFlight,
+    WriteBehind,
+    ZipStream,
+    build_effect_chain,
+    calibrate,
+    compile_effect_chain,
+    display_gains,
+    estimate_render,
+    estimate_render_cost,
+    get_default_effect_chain,
+    load_cost_model,
+    map_bounded,
+    normalize_audio_for_display,
+    parse_wav_header,
+    plan_block_frames,
+    prefetch,
+    render_file,
+    render_wav_stream,
+    warm_up,
+    waveform_peaks,
+)
+
 
-from lib import EFFECT_MAPPING, build_effect_chain, get_default_effect_chain
+def _sine(frequency, seconds=2.0, amplitude=1.0, sample_rate=48000, phase=0.0):
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t + phase)).astype(np.float32)[None]
 
 
 class TestEffects:
@@ -26,3 +84,995 @@ class TestEffects:
         ]
         board = build_effect_chain(effects)
         assert len(board) == 3
+
+
+class TestCompileEffectChain:
+    """lib/chain.py のテスト"""
+
+    def test_name_is_canonicalized(self):
+        """エフェクト名は大文字小文字を無視して正規化される"""
+        chain = compile_effect_chain([{"name": "reverb"}])
+        assert [stage.name for stage in chain.stages] == ["Reverb"]
+
+    def test_unknown_effect_raises(self):
+        """未知のエフェクトはエラーになる"""
+        with pytest.raises(EffectChainError):
+            compile_effect_chain([{"name": "Unknown Effect"}])
+
+    def test_unknown_param_raises(self):
+        """未知のパラメータはエラーになる"""
+        with pytest.raises(EffectChainError):
+            compile_effect_chain([{"name": "Chorus", "params": {"drive_db": 10}}])
+
+    def test_out_of_range_param_raises(self):
+        """範囲外のパラメータはエラーになる"""
+        with pytest.raises(EffectChainError):
+            compile_effect_chain([{"name": "Chorus", "params": {"mix": 5}}])
+
+    def test_consecutive_gains_are_folded(self):
+        """連続する Gain は1段に畳み込まれる"""
+        chain = compile_effect_chain(
+            [
+                {"name": "Booster_Preamp"},
+                {"name": "Booster_Preamp", "params": {"gain_db": 3}},
+                {"name": "Chorus"},
+            ]
+        )
+        assert len(chain) == 2
+        assert dict(chain.stages[0].params)["gain_db"] == 9
+
+    def test_noop_stages_are_dropped(self):
+        """効果のない段は除去される"""
+        chain = compile_effect_chain(
+            [
+                {"name": "Booster_Preamp", "params": {"gain_db": 0}},
+                {"name": "Chorus", "params": {"mix": 0}},
+                {"name": "Delay", "params": {"feedback": 0, "mix": 0}},
+                {"name": "Reverb"},
+            ]
+        )
+        assert [stage.name for stage in chain.stages] == ["Reverb"]
+
+    def test_cancelling_gains_are_dropped(self):
+        """打ち消し合う Gain は畳み込み後に除去される"""
+        chain = compile_effect_chain(
+            [
+                {"name": "Booster_Preamp", "params": {"gain_db": 6}},
+                {"name": "Chorus", "params": {"mix": 0}},
+                {"name": "Booster_Preamp", "params": {"gain_db": -6}},
+            ]
+        )
+        assert len(chain) == 0
+
+    def test_equivalent_chains_share_key(self):
+        """等価なチェーンは同じキーとハッシュを持つ"""
+        a = compile_effect_chain([{"name": "Chorus"}])
+        b = compile_effect_chain([{"name": "chorus", "params": {"rate_hz": 1.0}}])
+        assert a == b
+        assert hash(a) == hash(b)
+        assert a.key == b.key
+        assert a.key != compile_effect_chain([{"name": "Dimension"}]).key
+
+    def test_build_returns_pedalboard(self):
+        """コンパイル済みチェーンから Pedalboard を構築できる"""
+        board = compile_effect_chain([{"name": "Blues Driver"}, {"name": "Delay"}]).build()
+        assert isinstance(board, Pedalboard)
+        assert len(board) == 2
+
+
+class TestOutputJanitor:
+    """lib/janitor.py のテスト"""
+
+    def _write(self, path, size, last_access):
+        path.write_bytes(b"0" * size)
+        os.utime(path, (last_access, last_access))
+
+    def _janitor(self, directory, min_age_seconds=60):
+        return OutputJanitor(
+            directories=[directory],
+            ttl_seconds=3600,
+            max_bytes=1000,
+            min_age_seconds=min_age_seconds,
+            interval_seconds=60,
+        )
+
+    def test_expired_files_are_removed(self, tmp_path):
+        """TTL を過ぎたファイルは削除される"""
+        now = 10_000.0
+        self._write(tmp_path / "old.wav", 10, now - 4000)
+        self._write(tmp_path / "new.wav", 10, now - 10)
+        result = self._janitor(tmp_path).sweep(now=now)
+        assert result.removed == 1
+        assert not (tmp_path / "old.wav").exists()
+        assert (tmp_path / "new.wav").exists()
+
+    def test_budget_evicts_least_recently_accessed(self, tmp_path):
+        """予算超過時は最終アクセスが古いファイルから削除される"""
+        now = 10_000.0
+        self._write(tmp_path / "a.wav", 400, now - 300)
+        self._write(tmp_path / "b.wav", 400, now - 200)
+        self._write(tmp_path / "c.wav", 400, now - 100)
+        result = self._janitor(tmp_path).sweep(now=now)
+        assert result.removed == 1
+        assert result.remaining_bytes == 800
+        assert not (tmp_path / "a.wav").exists()
+        assert (tmp_path / "b.wav").exists()
+
+    def test_recently_accessed_files_are_protected(self, tmp_path):
+        """最終アクセス直後のファイルは予算超過でも削除されない"""
+        now = 10_000.0
+        self._write(tmp_path / "a.wav", 800, now - 10)
+        self._write(tmp_path / "b.wav", 800, now - 5)
+        result = self._janitor(tmp_path).sweep(now=now)
+        assert result.removed == 0
+
+    def test_touch_refreshes_last_access(self, tmp_path):
+        """touch で最終アクセスが更新され、LRU 順が変わる"""
+        janitor = self._janitor(tmp_path, min_age_seconds=0)
+        self._write(tmp_path / "a.wav", 600, 1000)
+        self._write(tmp_path / "b.wav", 600, 2000)
+        janitor.touch(tmp_path / "a.wav")
+        janitor.sweep()
+        assert (tmp_path / "a.wav").exists()
+        assert not (tmp_path / "b.wav").exists()
+
+
+class TestLoudnessMeter:
+    """lib/analysis.py のテスト"""
+
+    def test_full_scale_sine_is_minus_3_lufs(self):
+        """0dBFS の 997Hz 正弦波（モノラル）は約 -3.01 LUFS"""
+        meter = LoudnessMeter(48000, 1)
+        meter.update(_sine(997))
+        stats = meter.result()
+        assert stats.integrated_lufs == pytest.approx(-3.01, abs=0.1)
+        assert stats.sample_peak == pytest.approx(1.0, abs=1e-3)
+        assert stats.rms == pytest.approx(1 / math.sqrt(2), abs=1e-3)
+
+    def test_chunked_updates_match_single_update(self):
+        """チャンク分割しても結果が変わらない"""
+        audio = _sine(440, amplitude=0.5)
+        whole = LoudnessMeter(48000, 1)
+        whole.update(audio)
+        chunked = LoudnessMeter(48000, 1)
+        for start in range(0, audio.shape[1], 7000):
+            chunked.update(audio[:, start : start + 7000])
+        a, b = whole.result(), chunked.result()
+        assert a.sample_peak == b.sample_peak
+        assert a.integrated_lufs == pytest.approx(b.integrated_lufs, abs=1e-6)
+
+    def test_true_peak_detects_intersample_peaks(self):
+        """サンプル間のピークを true peak として検出する"""
+        meter = LoudnessMeter(48000, 1)
+        meter.update(_sine(12000, phase=math.pi / 4))
+        stats = meter.result()
+        assert stats.sample_peak == pytest.approx(0.707, abs=1e-3)
+        assert stats.true_peak > 0.95
+
+    def test_result_does_not_change_state(self):
+        """result() を途中で・何度呼んでも、最終結果が変わらない"""
+        audio = _sine(12000, phase=math.pi / 4)
+        once, repeated = LoudnessMeter(48000, 1), LoudnessMeter(48000, 1)
+        for start in range(0, audio.shape[1], 4001):
+            once.update(audio[:, start : start + 4001])
+            repeated.update(audio[:, start : start + 4001])
+            repeated.result()
+        assert repeated.result() == repeated.result() == once.result()
+
+    def test_silence_has_no_loudness(self):
+        """無音のラウドネスは None"""
+        meter = LoudnessMeter(48000, 2)
+        meter.update(np.zeros((2, 48000), dtype=np.float32))
+        stats = meter.result()
+        assert stats.integrated_lufs is None
+        assert stats.to_dict()["sample_peak_db"] is None
+
+    def test_loudness_mode_matches_loudness(self):
+        """loudness モードでは入出力が同じラウドネスになる"""
+        quiet, loud = LoudnessMeter(48000, 1), LoudnessMeter(48000, 1)
+        quiet.update(_sine(997, amplitude=0.05))
+        loud.update(_sine(997, amplitude=0.5))
+        quiet_stats, loud_stats = quiet.result(), loud.result()
+        quiet_gain, loud_gain = display_gains(quiet_stats, loud_stats, mode="loudness")
+        assert quiet_stats.integrated_lufs is not None
+        assert loud_stats.integrated_lufs is not None
+        assert quiet_stats.integrated_lufs + 20 * math.log10(quiet_gain) == pytest.approx(
+            loud_stats.integrated_lufs + 20 * math.log10(loud_gain)
+        )
+        # ピークは上限を超えない
+        assert loud_stats.true_peak * loud_gain <= 0.7 + 1e-6
+
+
+class TestWaveformPeaks:
+    """waveform_peaks のテスト"""
+
+    def test_peaks_follow_envelope(self, tmp_path):
+        """区間毎の最大振幅を返す"""
+        audio = _sine(440, seconds=1.0, sample_rate=48000)
+        audio[:, 24000:] *= 0.25
+        path = tmp_path / "in.wav"
+        with AudioFile(str(path), "w", 48000, 1, bit_depth=32) as f:
+            f.write(audio)
+        peaks = waveform_peaks(path, 10)
+        assert len(peaks) == 10
+        assert peaks[:5] == pytest.approx([1.0] * 5, abs=1e-3)
+        assert peaks[5:] == pytest.approx([0.25] * 5, abs=1e-3)
+
+
+class TestRenderFile:
+    """lib/render.py のテスト"""
+
+    def _write(self, path, audio, sample_rate=48000):
+        with AudioFile(str(path), "w", sample_rate, audio.shape[0]) as f:
+            f.write(audio)
+
+    def test_block_rendering_matches_whole_file(self, tmp_path):
+        """ブロック単位の処理はファイル全体の処理と同じ結果になる"""
+        self._write(tmp_path / "in.wav", _sine(220, amplitude=0.5))
+        chain = compile_effect_chain([{"name": "Blues Driver"}, {"name": "Delay"}])
+        whole = render_file(tmp_path / "in.wav", tmp_path / "whole.wav", chain.build())
+        blocks = render_file(
+            tmp_path / "in.wav", tmp_path / "blocks.wav", chain.build(), block_frames=4096
+        )
+        with (
+            AudioFile(str(tmp_path / "whole.wav")) as a,
+            AudioFile(str(tmp_path / "blocks.wav")) as b,
+        ):
+            np.testing.assert_allclose(a.read(a.frames), b.read(b.frames), atol=1e-4)
+        assert whole.frames == blocks.frames == 96000
+        assert whole.output_stats.integrated_lufs == pytest.approx(
+            blocks.output_stats.integrated_lufs, abs=0.01
+        )
+
+    def test_normalize_without_gain_uses_peak(self, tmp_path):
+        """gain 未指定ならピークを target_peak に揃える"""
+        self._write(tmp_path / "in.wav", _sine(440, amplitude=0.2))
+        normalize_audio_for_display(tmp_path / "in.wav", tmp_path / "norm.wav")
+        with AudioFile(str(tmp_path / "norm.wav")) as f:
+            assert np.max(np.abs(f.read(f.frames))) == pytest.approx(0.7, abs=1e-3)
+
+
+class TestAdmissionController:
+    """lib/admission.py のテスト"""
+
+    def _controller(self, memory_budget_bytes=1000, max_queue=1, max_wait_seconds=0.05):
+        return AdmissionController(
+            max_concurrency=2,
+            cpu_budget_seconds=10.0,
+            memory_budget_bytes=memory_budget_bytes,
+            max_queue=max_queue,
+            max_wait_seconds=max_wait_seconds,
+        )
+
+    def test_heavier_chain_costs_more(self):
+        """重いチェーンほど推定コストが大きい"""
+        light = compile_effect_chain([{"name": "Booster_Preamp"}])
+        heavy = compile_effect_chain(
+            [{"name": "Heavy Metal"}, {"name": "Delay"}, {"name": "Reverb"}]
+        )
+        assert (
+            estimate_render_cost(44100, 2, heavy).cpu_seconds
+            > estimate_render_cost(44100, 2, light).cpu_seconds
+        )
+        assert (
+            estimate_render_cost(88200, 2, light).memory_bytes
+            > estimate_render_cost(44100, 2, light).memory_bytes
+        )
+
+    def test_queued_request_runs_after_release(self):
+        """予算超過分は待たされ、枠が空くと実行される"""
+        controller = self._controller(max_wait_seconds=1.0)
+        order = []
+
+        async def job(name, delay):
+            async with controller.admit(RenderCost(cpu_seconds=6.0, memory_bytes=100)):
+                order.append(f"start {name}")
+                await asyncio.sleep(delay)
+            order.append(f"end {name}")
+
+        async def main():
+            await asyncio.gather(job("a", 0.05), job("b", 0))
+
+        asyncio.run(main())
+        assert order == ["start a", "end a", "start b", "end b"]
+
+    def test_rejects_when_queue_is_full(self):
+        """待ち行列が一杯なら Overloaded を送出する"""
+        controller = self._controller(max_queue=0)
+        cost = RenderCost(cpu_seconds=6.0, memory_bytes=100)
+
+        async def main():
+            async with controller.admit(cost):
+                with pytest.raises(Overloaded) as excinfo:
+                    async with controller.admit(cost):
+                        pass
+                assert excinfo.value.retry_after >= 1
+
+        asyncio.run(main())
+        assert controller.snapshot()["rejected_total"] == 1
+
+    def test_reserve_shares_budget_without_queueing(self):
+        """reserve() は同じ予算に計上し、空きがなければ待たずに Overloaded を送出する"""
+        controller = self._controller()
+        cost = RenderCost(cpu_seconds=6.0, memory_bytes=100)
+
+        with controller.reserve(cost):
+            assert controller.snapshot()["running"] == 1
+            with pytest.raises(Overloaded):
+                with controller.reserve(cost):
+                    pass
+        assert controller.snapshot()["running"] == 0
+        assert controller.snapshot()["rejected_total"] == 0
+
+    def test_rejects_after_max_wait(self):
+        """待ち時間の上限を超えると Overloaded を送出する"""
+        controller = self._controller(memory_budget_bytes=150)
+        cost = RenderCost(cpu_seconds=1.0, memory_bytes=100)
+
+        async def main():
+            async with controller.admit(cost):
+                with pytest.raises(Overloaded):
+                    async with controller.admit(cost):
+                        pass
+                assert controller.snapshot()["queued"] == 0
+
+        asyncio.run(main())
+
+    def test_oversized_request_is_admitted_when_idle(self):
+        """何も実行していなければ予算を超える1件も受け付ける"""
+        controller = self._controller()
+
+        async def main():
+            async with controller.admit(RenderCost(cpu_seconds=100.0, memory_bytes=10_000)):
+                assert controller.snapshot()["running"] == 1
+
+        asyncio.run(main())
+        assert controller.snapshot()["running"] == 0
+
+
+@pytest.fixture(scope="module")
+def model():
+    """44.1kHz のみで計測したコストモデル"""
+    return calibrate(samplerates=(44100,))
+
+
+class TestCostModel:
+    """lib/costs.py のテスト"""
+
+    def test_calibration_measures_every_effect(self, model):
+        """全エフェクトの処理コストとリバーブのテールを計測する"""
+        assert set(model.effects) == set(EFFECT_MAPPING)
+        assert all(cost.at(44100) > 0 for cost in model.effects.values())
+        assert model.effects["Reverb"].tail_seconds > model.effects["Heavy Metal"].tail_seconds
+
+    def test_load_uses_cache_until_it_is_stale(self, tmp_path, model):
+        """キャッシュが有効なら計測せずに読み込み、不整合なら計測し直す"""
+        path = tmp_path / "costs.json"
+        path.write_text(json.dumps(model.to_dict()))
+        assert load_cost_model(path, calibrate_if_missing=False) == model
+
+        stale = model.to_dict() | {"pedalboard_version": "0.0.0"}
+        path.write_text(json.dumps(stale))
+        assert load_cost_model(path, calibrate_if_missing=False) is None
+
+    def test_estimate_grows_with_chain_and_length(self, model):
+        """チェーンが重く、入力が長いほど見積もりが大きい"""
+        light = compile_effect_chain([{"name": "Booster_Preamp"}])
+        heavy = compile_effect_chain([{"name": "Heavy Metal"}, {"name": "Reverb"}])
+        short = estimate_render(light, 44100, 2, 44100, model)
+        assert estimate_render(heavy, 44100, 2, 44100, model).seconds > short.seconds
+        assert estimate_render(light, 88200, 2, 44100, model).seconds > short.seconds
+        assert list(estimate_render(heavy, 44100, 2, 44100, model).stage_seconds) == [
+            "0:Heavy Metal",
+            "1:Reverb",
+        ]
+        assert (
+            estimate_render_cost(44100, 2, heavy, 44100, model).cpu_seconds
+            == estimate_render(heavy, 44100, 2, 44100, model).seconds
+        )
+
+
+class TestWarmUp:
+    """lib/warmup.py のテスト"""
+
+    def test_reports_each_step_and_is_memoised(self):
+        """各段階の所要時間を返し、2回目以降は前回の結果を返す"""
+        report = warm_up()
+        assert set(report.steps) == {"plugins", "encode", "render", "normalize"}
+        assert report.total_seconds >= sum(report.steps.values())
+        assert warm_up() is report
+        assert warm_up(force=True) is not report
+
+
+class TestBulk:
+    """lib/bulk.py のテスト"""
+
+    def test_zip_stream_builds_valid_archive(self, tmp_path):
+        """逐次生成したバイト列が正しい ZIP になる"""
+        import io
+        import zipfile
+
+        payload = os.urandom(300_000)
+        (tmp_path / "a.bin").write_bytes(payload)
+        archive = ZipStream()
+        chunks = list(archive.add_file("a.bin", tmp_path / "a.bin", chunk_bytes=65536))
+        chunks.append(archive.add_bytes("note.txt", b"hello"))
+        chunks.append(archive.close())
+        assert len(chunks) > 2
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+            assert zf.testzip() is None
+            assert zf.read("a.bin") == payload
+            assert zf.read("note.txt") == b"hello"
+
+    def test_map_bounded_limits_in_flight_and_captures_errors(self):
+        """同時実行数を制限し、失敗は例外として返す"""
+        running = 0
+        peak = 0
+
+        async def work(i):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.001 * (i % 3))
+            running -= 1
+            if i == 4:
+                raise ValueError("boom")
+            return i * 2
+
+        async def main():
+            return [pair async for pair in map_bounded(range(10), work, limit=3)]
+
+        results = dict(asyncio.run(main()))
+        assert peak == 3
+        assert isinstance(results.pop(4), ValueError)
+        assert results == {i: i * 2 for i in range(10) if i != 4}
+
+
+class TestSamplingProfiler:
+    """lib/profiling.py のテスト"""
+
+    def test_records_only_the_profiled_call(self):
+        """run() で実行した関数のスタックを collapsed 形式で記録する"""
+
+        def busy_loop():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+            return "done"
+
+        with SamplingProfiler(interval_seconds=0.001) as profiler:
+            assert profiler.run(busy_loop) == "done"
+
+        lines = profiler.collapsed().splitlines()
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        assert stack.startswith("busy_loop (test_lib.py:")
+        assert int(count) > 0
+        assert profiler.duration_seconds >= 0.05
+
+
+class TestMemory:
+    """lib/memory.py のテスト"""
+
+    def test_plan_splits_only_inputs_over_budget(self):
+        """予算を超える入力だけを、予算に収まるブロックに分割する"""
+        budget = 64 * 1024 * 1024
+        assert plan_block_frames(44100 * 10, 2, budget) is None
+        block = plan_block_frames(44100 * 600, 2, budget)
+        assert block is not None and block < 44100 * 600
+        chain = compile_effect_chain([{"name": "Reverb"}])
+        assert (
+            estimate_render_cost(44100 * 600, 2, chain, block_frames=block).memory_bytes <= budget
+        )
+
+    def test_tracker_records_stages_and_buffer_peak(self, tmp_path):
+        """段階毎の RSS と、レンダリング中に保持したバッファの最大を記録する"""
+        with AudioFile(str(tmp_path / "in.wav"), "w", 48000, 1) as f:
+            f.write(_sine(440, seconds=1.0))
+        memory = MemoryTracker(budget_bytes=0, block_frames=4096)
+        chain = compile_effect_chain([{"name": "Delay"}])
+        with memory.stage("render"):
+            render_file(tmp_path / "in.wav", tmp_path / "out.wav", chain.build(), 4096, memory)
+        report = memory.to_dict()
+        assert report["chunked"] is True
+        assert report["peak_buffer_bytes"] == 2 * 4096 * 4
+        assert [stage["name"] for stage in report["stages"]] == ["render"]
+
+
+class TestPrerender:
+    """lib/prerender.py のテスト"""
+
+    def _jobs(self, n):
+        chain = compile_effect_chain([{"name": "Reverb"}])
+        return [PrerenderJob.from_chain(f"{i}.wav", chain) for i in range(n)]
+
+    def _prerenderer(self, render, jobs, is_idle=lambda: True, cpu_budget_seconds=10.0):
+        return Prerenderer(
+            render=render,
+            jobs=lambda: jobs,
+            is_idle=is_idle,
+            cpu_budget_seconds=cpu_budget_seconds,
+            cpu_fraction=1.0,
+            interval_seconds=0,
+            idle_poll_seconds=0.001,
+        )
+
+    def test_counts_rendered_cached_and_failed(self):
+        """レンダリング・キャッシュ済み・失敗を数える"""
+        outcomes = iter([True, False, ValueError("boom")])
+
+        def render(job):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        result = self._prerenderer(render, self._jobs(3)).run_once()
+        assert (result.rendered, result.cached, result.failed) == (1, 1, 1)
+
+    def test_defers_jobs_over_cpu_budget(self):
+        """CPU 時間の予算を使い切ったら残りは次回に回す"""
+
+        def render(job):
+            deadline = time.thread_time() + 0.01
+            while time.thread_time() < deadline:
+                pass
+            return True
+
+        result = self._prerenderer(render, self._jobs(5), cpu_budget_seconds=0.015).run_once()
+        assert result.rendered == 2
+        assert result.deferred == 3
+
+    def test_waits_until_idle(self):
+        """ライブのリクエストがある間は待つ"""
+        busy = iter([False, False, True])
+        rendered = []
+
+        def render(job):
+            rendered.append(job)
+            return True
+
+        self._prerenderer(render, self._jobs(1), is_idle=lambda: next(busy, True)).run_once()
+        assert len(rendered) == 1
+
+    def test_defers_remaining_jobs_when_overloaded(self):
+        """受け付けの予算に空きがなければ残りを次回に回す"""
+
+        def render(job):
+            raise Overloaded("No spare render capacity", 1)
+
+        result = self._prerenderer(render, self._jobs(3)).run_once()
+        assert (result.failed, result.deferred) == (0, 3)
+
+    def test_job_listing_failure_keeps_running(self):
+        """対象の列挙に失敗しても、記録して次回に再試行する"""
+        listings = iter([OSError("disk gone"), self._jobs(1)])
+
+        def jobs():
+            listing = next(listings)
+            if isinstance(listing, Exception):
+                raise listing
+            return listing
+
+        runner = Prerenderer(
+            render=lambda job: True,
+            jobs=jobs,
+            is_idle=lambda: True,
+            cpu_budget_seconds=10.0,
+            cpu_fraction=1.0,
+            interval_seconds=0,
+        )
+        assert runner.run_once().error == "OSError: disk gone"
+        assert runner.run_once().rendered == 1
+
+    def test_popularity_keeps_most_requested(self):
+        """リクエスト数の多い組み合わせから返す"""
+        popularity = RequestPopularity(max_entries=10)
+        reverb = compile_effect_chain([{"name": "Reverb"}])
+        delay = compile_effect_chain([{"name": "Delay"}])
+        popularity.record("a.wav", reverb)
+        popularity.record("b.wav", delay)
+        popularity.record("b.wav", delay)
+        top = popularity.top(1)
+        assert [job.input_file for job in top] == ["b.wav"]
+        assert top[0].chain_dicts()[0]["name"] == "Delay"
+
+
+class TestStreaming:
+    """lib/streaming.py のテスト"""
+
+    def _chunks(self, data, size):
+        return [data[i : i + size] for i in range(0, len(data), size)]
+
+    @pytest.mark.parametrize("bit_depth", [16, 24, 32])
+    def test_decodes_like_audio_file(self, tmp_path, bit_depth):
+        """ヘッダーの解析とデコードが AudioFile の読み込みと一致する"""
+        path = tmp_path / "in.wav"
+        audio = np.concatenate([_sine(220, 0.1, 0.5), _sine(330, 0.1, 0.25)])
+        with AudioFile(str(path), "w", 48000, 2, bit_depth=bit_depth) as f:
+            f.write(audio)
+        data = path.read_bytes()
+        fmt = parse_wav_header(data[:4096], len(data))
+        assert fmt is not None
+        with AudioFile(str(path)) as f:
+            expected = f.read(f.frames)
+        assert (fmt.samplerate, fmt.num_channels, fmt.frames) == (48000, 2, expected.shape[1])
+        decoded = fmt.decode(data[fmt.data_offset : fmt.data_offset + fmt.data_bytes])
+        np.testing.assert_allclose(decoded, expected, atol=1e-6)
+
+    def test_rejects_non_wav(self):
+        """WAV 以外は None（通常の経路で処理する）"""
+        assert parse_wav_header(b"ID3\x04" + bytes(100)) is None
+
+    def test_stream_matches_render_file(self, tmp_path):
+        """ストリーミングのレンダリングは render_file と同じ出力になる"""
+        path = tmp_path / "in.wav"
+        with AudioFile(str(path), "w", 48000, 1) as f:
+            f.write(_sine(220, amplitude=0.5))
+        chain = compile_effect_chain([{"name": "Blues Driver"}, {"name": "Delay"}])
+        expected = render_file(path, tmp_path / "whole.wav", chain.build(), block_frames=4096)
+
+        data = path.read_bytes()
+        fmt = parse_wav_header(data[:4096], len(data))
+        assert fmt is not None
+        output = bytearray()
+        result = render_wav_stream(
+            self._chunks(data, 5000), fmt, chain.build(), output.extend, block_frames=4096
+        )
+        (tmp_path / "stream.wav").write_bytes(output)
+        with (
+            AudioFile(str(tmp_path / "whole.wav")) as a,
+            AudioFile(str(tmp_path / "stream.wav")) as b,
+        ):
+            np.testing.assert_allclose(a.read(a.frames), b.read(b.frames), atol=1e-4)
+        assert result.frames == expected.frames
+        assert result.output_stats.integrated_lufs == pytest.approx(
+            expected.output_stats.integrated_lufs, abs=0.01
+        )
+
+    def test_truncated_input_raises(self, tmp_path):
+        """data チャンクが途中で終わる場合は ValueError"""
+        path = tmp_path / "in.wav"
+        with AudioFile(str(path), "w", 48000, 1) as f:
+            f.write(_sine(220, 0.1))
+        data = path.read_bytes()
+        fmt = parse_wav_header(data)
+        assert fmt is not None
+        with pytest.raises(ValueError, match="truncated"):
+            render_wav_stream([data[:-100]], fmt, Pedalboard([]), lambda _: None, 1024)
+
+    def test_prefetch_keeps_order_and_raises(self):
+        """先読みは順序を保ち、元の例外を取り出した側で送出する"""
+
+        def items():
+            yield from range(5)
+            raise RuntimeError("network")
+
+        received = []
+        with pytest.raises(RuntimeError, match="network"):
+            for item in prefetch(items(), depth=2):
+                received.append(item)
+        assert received == [0, 1, 2, 3, 4]
+
+    def test_consumer_returns_result_and_propagates_abort(self):
+        """consume の結果を返し、abort した場合は consume 側に例外を送る"""
+        consumer: BackgroundConsumer[int, int] = BackgroundConsumer(sum, depth=2)
+        for i in range(10):
+            consumer.put(i)
+        assert consumer.close() == 45
+
+        seen = []
+
+        def consume(items):
+            try:
+                for item in items:
+                    seen.append(item)
+            except ValueError:
+                seen.append("aborted")
+                raise
+
+        aborted = BackgroundConsumer(consume, depth=2)
+        aborted.put(1)
+        aborted.abort(ValueError("render failed"))
+        assert seen == [1, "aborted"]
+
+
+class TestCoalesce:
+    """lib/coalesce.py のテスト"""
+
+    def test_single_flight_runs_once_per_key(self):
+        """同じキーの同時実行は1回にまとめ、全員に同じ結果を返す"""
+        flights = SingleFlight()
+        calls = []
+
+        async def render(name):
+            calls.append(name)
+            await asyncio.sleep(0.01)
+            return f"{name}.wav"
+
+        async def main():
+            return await asyncio.gather(
+                *(flights.run(name, lambda _, name=name: render(name)) for name in "aaab")
+            )
+
+        assert asyncio.run(main()) == ["a.wav", "a.wav", "a.wav", "b.wav"]
+        assert sorted(calls) == ["a", "b"]
+        assert flights.snapshot() == {"in_flight": 0, "started_total": 2, "coalesced_total": 2}
+
+    def test_single_flight_survives_cancelled_leader(self):
+        """最初の呼び出し元がキャンセルされても、待っている呼び出し元は結果を受け取る"""
+        flights = SingleFlight()
+
+        async def render(token):
+            await asyncio.sleep(0.02)
+            return "done"
+
+        async def main():
+            leader = asyncio.ensure_future(flights.run("key", render))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flights.run("key", render))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        assert asyncio.run(main()) == "done"
+
+    def test_single_flight_shares_errors(self):
+        """失敗も待っている全員に返し、次の呼び出しは新しく実行する"""
+        flights = SingleFlight()
+
+        async def fail(token):
+            await asyncio.sleep(0.01)
+            raise ValueError("bad input")
+
+        async def main():
+            return await asyncio.gather(
+                flights.run("key", fail), flights.run("key", fail), return_exceptions=True
+            )
+
+        errors = asyncio.run(main())
+        assert all(isinstance(e, ValueError) for e in errors)
+        assert flights.snapshot()["in_flight"] == 0
+
+    def test_idempotency_store_expires_entries(self):
+        """TTL を過ぎた応答と上限を超えた古い応答は捨てる"""
+        store = IdempotencyStore(ttl_seconds=60, max_entries=2)
+        for key in "abc":
+            store.put(key, "fingerprint", {"key": key})
+        assert store.get("a") is None
+        stored = store.get("c")
+        assert stored is not None and stored.body == {"key": "c"}
+
+        expired = IdempotencyStore(ttl_seconds=0, max_entries=10)
+        expired.put("a", "fingerprint", {})
+        assert expired.get("a") is None
+
+
+class TestRenderCache:
+    """lib/render_cache.py のテスト"""
+
+    def _artifacts(self, directory, stats):
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "out.wav").write_bytes(b"RIFF-output")
+        (directory / "stats.json").write_text(json.dumps(stats))
+        return {
+            ARTIFACT_OUTPUT: directory / "out.wav",
+            ARTIFACT_STATS: directory / "stats.json",
+        }
+
+    def test_directory_cache_round_trip(self, tmp_path):
+        """保存した一式を別のインスタンス（別ワーカー）から取り出せる"""
+        stored = self._artifacts(tmp_path / "worker1", {"lufs": -14})
+        DirectoryRenderCache(tmp_path / "cache").store("k1", stored)
+
+        cache = DirectoryRenderCache(tmp_path / "cache")
+        assert cache.load_stats("missing") is None
+        assert cache.load_stats("k1") == {"lufs": -14}
+        destination = {
+            ARTIFACT_OUTPUT: tmp_path / "worker2" / "out.wav",
+            ARTIFACT_STATS: tmp_path / "worker2" / "stats.json",
+        }
+        assert cache.fetch("k1", destination)
+        assert destination[ARTIFACT_OUTPUT].read_bytes() == b"RIFF-output"
+        assert cache.location("k1", ARTIFACT_OUTPUT) is None
+
+    def test_directory_cache_prunes_oldest(self, tmp_path):
+        """合計が上限を超えたら古く保存したものから削除する"""
+        cache = DirectoryRenderCache(tmp_path / "cache", max_bytes=60)
+        for key in ["a", "b", "c"]:
+            cache.store(key, self._artifacts(tmp_path / key, {"key": key}))
+        assert cache.load_stats("a") is None
+        assert cache.load_stats("c") == {"key": "c"}
+        assert not (tmp_path / "cache" / "a" / "a").exists()
+
+    def test_directory_cache_forgets_missing_files(self, tmp_path):
+        """索引だけ残っている一式はキャッシュミスとして索引も消す"""
+        import shutil
+
+        cache = DirectoryRenderCache(tmp_path / "cache")
+        cache.store("k1", self._artifacts(tmp_path / "src", {}))
+        shutil.rmtree(tmp_path / "cache" / "k1")
+        assert not cache.fetch("k1", {ARTIFACT_OUTPUT: tmp_path / "out.wav"})
+        assert cache.load_stats("k1") is None
+
+    def _s3_artifacts(self, directory, stats):
+        artifacts = self._artifacts(directory, stats)
+        for name in [ARTIFACT_INPUT_NORM, ARTIFACT_OUTPUT_NORM]:
+            artifacts[name] = directory / name
+            artifacts[name].write_bytes(b"RIFF-normalized")
+        return artifacts
+
+    def test_s3_cache_round_trip(self, tmp_path):
+        """S3 のプレフィックスに保存し、統計の取得で存在を確認する"""
+        from loadtest import InMemoryS3
+
+        s3 = InMemoryS3()
+        cache = S3RenderCache("bucket", "cache/", lambda: s3, {"ContentType": "audio/wav"})
+        assert cache.load_stats("k1") is None
+        cache.store("k1", self._s3_artifacts(tmp_path / "src", {"lufs": -14}))
+
+        assert cache.load_stats("k1") == {"lufs": -14}
+        assert cache.location("k1", ARTIFACT_OUTPUT) == ("bucket", "cache/k1/output.wav")
+        destination = {ARTIFACT_OUTPUT: tmp_path / "dst" / "out.wav"}
+        assert cache.fetch("k1", destination)
+        assert destination[ARTIFACT_OUTPUT].read_bytes() == b"RIFF-output"
+
+    def test_s3_cache_misses_when_artifact_is_gone(self, tmp_path):
+        """統計が残っていても成果物が消えていればキャッシュミスにする"""
+        from loadtest import InMemoryS3
+
+        s3 = InMemoryS3()
+        cache = S3RenderCache("bucket", "cache/", lambda: s3)
+        cache.store("k1", self._s3_artifacts(tmp_path / "src", {"lufs": -14}))
+        s3.delete_object(Bucket="bucket", Key="cache/k1/output_norm.wav")
+        assert cache.load_stats("k1") is None
+
+    def test_write_behind_stores_and_drops(self, tmp_path):
+        """保存は別スレッドで行い、待ちが一杯の分は捨てて後始末だけ行う"""
+        import threading
+
+        release = threading.Event()
+        stored = []
+
+        class SlowCache:
+            def store(self, key, files):
+                release.wait(5)
+                stored.append(key)
+
+        done = []
+        writer = WriteBehind(SlowCache(), max_pending=1)  # type: ignore[arg-type]
+        assert writer.submit("a", {}, lambda: done.append("a"))
+        time.sleep(0.05)  # "a" が取り出されて保存中になるのを待つ
+        assert writer.submit("b", {}, lambda: done.append("b"))
+        assert not writer.submit("c", {}, lambda: done.append("c"))
+        assert done == ["c"]
+
+        release.set()
+        writer.flush()
+        assert stored == ["a", "b"]
+        assert sorted(done) == ["a", "b", "c"]
+        snapshot = writer.snapshot()
+        assert snapshot["stored_total"] == 2 and snapshot["dropped_total"] == 1
+
+    def test_write_behind_store_now_runs_in_caller(self):
+        """store_now() は呼び出したスレッドで保存し、失敗は集計に残す"""
+        import threading
+
+        threads = []
+
+        class Cache:
+            def store(self, key, files):
+                threads.append(threading.current_thread())
+                if key == "bad":
+                    raise OSError("disk full")
+
+        done = []
+        writer = WriteBehind(Cache(), max_pending=1)  # type: ignore[arg-type]
+        assert writer.store_now("a", {}, lambda: done.append("a"))
+        assert not writer.store_now("bad", {}, lambda: done.append("bad"))
+        assert threads == [threading.current_thread()] * 2
+        assert done == ["a", "bad"]
+        snapshot = writer.snapshot()
+        assert snapshot["stored_total"] == 1 and snapshot["failed_total"] == 1
+        assert snapshot["last_error"] == "OSError: disk full"
+
+
+class TestCancellation:
+    """lib/cancellation.py のテスト"""
+
+    def test_token_cancels_when_last_waiter_leaves(self):
+        """待つ側が全員いなくなった時点で中断する"""
+        token = CancelToken()
+        token.join()
+        token.join()
+        token.leave()
+        token.check()
+        token.leave()
+        assert token.cancelled
+        with pytest.raises(Cancelled, match="abandoned"):
+            token.check()
+
+    def test_render_file_stops_between_blocks(self, tmp_path):
+        """中断されたらブロックの境目で Cancelled を送出する"""
+        input_path = tmp_path / "input.wav"
+        with AudioFile(str(input_path), "w", 48000, 1) as f:
+            f.write(_sine(440, seconds=1.0))
+        token = CancelToken()
+        blocks = []
+
+        def board(chunk, samplerate, reset):
+            blocks.append(chunk.shape[1])
+            token.cancel("deadline")
+            return chunk
+
+        with pytest.raises(Cancelled, match="deadline"):
+            render_file(input_path, tmp_path / "out.wav", board, 4800, cancel=token)  # type: ignore[arg-type]
+        assert blocks == [4800]
+
+    def test_single_flight_cancels_only_when_all_waiters_leave(self):
+        """相乗りしたリクエストが残っている間は処理を続け、全員がやめたら中断する"""
+        flights = SingleFlight()
+        tokens = []
+
+        async def render(token):
+            tokens.append(token)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def main():
+            first = asyncio.ensure_future(flights.run("key", render))
+            second = asyncio.ensure_future(flights.run("key", render))
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)
+            assert not tokens[0].cancelled
+            second.cancel()
+            await asyncio.sleep(0)
+            assert tokens[0].cancelled
+            # 中断が決まった処理には相乗りせず、新しく始める
+            return await flights.run("key", render)
+
+        assert asyncio.run(main()) == "done"
+        assert len(tokens) == 2 and not tokens[1].cancelled
+
+    def test_abandoned_flight_leaves_admission_queue(self):
+        """全員が待つのをやめたら、受け付け待ちの処理も取り消して待ち行列を空ける"""
+        controller = AdmissionController(
+            max_concurrency=1,
+            cpu_budget_seconds=10.0,
+            memory_budget_bytes=1000,
+            max_queue=4,
+            max_wait_seconds=5.0,
+        )
+        flights = SingleFlight()
+        cost = RenderCost(cpu_seconds=1.0, memory_bytes=100)
+
+        async def render(token):
+            async with controller.admit(cost):
+                return "done"
+
+        async def main():
+            async with controller.admit(cost):
+                caller = asyncio.ensure_future(flights.run("key", render))
+                await asyncio.sleep(0.01)
+                assert controller.snapshot()["queued"] == 1
+                caller.cancel()
+                await asyncio.sleep(0.01)
+                return controller.snapshot(), flights.snapshot()
+
+        admission, coalescing = asyncio.run(main())
+        assert admission["queued"] == 0
+        assert coalescing["in_flight"] == 0
+        assert controller.snapshot()["running"] == 0
+
+    def test_metrics_sum_wasted_seconds(self):
+        metrics = CancellationMetrics()
+        metrics.record_abandoned("deadline")
+        metrics.record_cancelled(1.5)
+        metrics.record_unclaimed(0.5)
+        assert metrics.snapshot() == {
+            "abandoned_requests": {"deadline": 1},
+            "cancelled_renders_total": 1,
+            "unclaimed_renders_total": 1,
+            "wasted_render_seconds": 2.0,
+        }
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from loadtest import InMemoryS3, Scenario, run
+from loadtest.runner import parse_mix, percentile
+
+
+class TestInMemoryS3:
+    """loadtest/s3_stub.py のテスト"""
+
+    def test_upload_and_download_roundtrip(self, tmp_path):
+        """アップロードしたファイルをダウンロードできる"""
+        s3 = InMemoryS3()
+        source = tmp_path / "in.bin"
+        source.write_bytes(b"0123456789")
+        s3.upload_file(str(source), "bucket", "key", ExtraArgs={"ContentType": "audio/wav"})
+        s3.download_file("bucket", "key", str(tmp_path / "out.bin"))
+        assert (tmp_path / "out.bin").read_bytes() == b"0123456789"
+        assert s3.head_object(Bucket="bucket", Key="key")["ContentLength"] == 10
+
+    def test_ranged_get(self):
+        """Range 指定で部分取得できる"""
+        s3 = InMemoryS3()
+        s3.put_object(Bucket="bucket", Key="key", Body=b"0123456789")
+        body = s3.get_object(Bucket="bucket", Key="key", Range="bytes=2-4")["Body"].read()
+        assert body == b"234"
+
+    def test_missing_key_raises_client_error(self, tmp_path):
+        """存在しないキーは ClientError になる"""
+        from botocore.exceptions import ClientError
+
+        with pytest.raises(ClientError):
+            InMemoryS3().download_file("bucket", "missing", str(tmp_path / "out.bin"))
+
+
+class TestRunner:
+    """loadtest/runner.py のテスト"""
+
+    def test_percentile(self):
+        """最近傍順位法でパーセンタイルを求める"""
+        values = [float(v) for v in range(1, 101)]
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile([], 50) is None
+
+    def test_parse_mix_rejects_unknown_endpoint(self):
+        """未知のエンドポイントはエラーになる"""
+        assert parse_mix("process=4,effects") == {"process": 4, "effects": 1}
+        with pytest.raises(ValueError):
+            parse_mix("unknown=1")
+
+    def test_mixed_scenario_runs_offline(self):
+        """S3 を含む全エンドポイントをオフラインで実行できる"""
+        mix = {"process": 1, "s3-process": 1, "upload-url": 1, "effects": 1}
+        scenario = Scenario("smoke", mix, concurrency=2, requests=8)
+        [report] = asyncio.run(run([scenario], audio_seconds=0.5))
+        assert report.overall.requests == 8
+        assert report.overall.errors == 0
+        assert report.requests_per_second > 0
+        assert set(report.endpoints) == set(mix)
+        assert report.overall.p99_ms is not None
+        assert report.first_request_ms is not None
+        assert report.warmup_seconds is not None and report.warmup_seconds > 0
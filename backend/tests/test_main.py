@@ -1,4 +1,5 @@
 import os
+import uuid
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -24,6 +25,26 @@ class TestHealthCheck:
         assert data["status"] == "ok"
         assert data["mode"] == "local"
 
+    def test_health_check_reports_render_load(self, client):
+        """ヘルスチェックが現在のレンダリング負荷を返す"""
+        load = client.get("/api/health").json()["load"]
+        assert load["running"] == 0
+        assert load["queued"] == 0
+        assert "cpu_budget_seconds" in load
+
+    def test_lifespan_warms_up_before_first_request(self):
+        """起動時にウォームアップを行い、所要時間をヘルスチェックで返す"""
+        with TestClient(app) as client:
+            warmup = client.get("/api/health").json()["warmup"]
+        assert warmup["total_seconds"] > 0
+        assert "render" in warmup["steps"]
+
+    def test_health_check_reports_memory(self, client):
+        """ヘルスチェックがプロセスのメモリ使用量を返す"""
+        memory = client.get("/api/health").json()["memory"]
+        assert memory["peak_rss_bytes"] > 0
+        assert "chunked_renders_total" in memory
+
     def test_health_check_returns_s3_mode_in_production(self, client):
         """本番環境では s3 モードを返す"""
         with patch.dict(os.environ, {"ENV": "production"}):
@@ -47,6 +68,19 @@ class TestHealthCheck:
                 importlib.reload(config)
                 importlib.reload(routes)
 
+    def test_config_rejects_unknown_display_normalization(self):
+        """表示用正規化の設定が不正なら起動時に失敗する"""
+        import importlib
+
+        from api import config
+
+        try:
+            with patch.dict(os.environ, {"DISPLAY_NORMALIZATION": "lufs"}):
+                with pytest.raises(ValueError, match="DISPLAY_NORMALIZATION"):
+                    importlib.reload(config)
+        finally:
+            importlib.reload(config)
+
 
 class TestEffects:
     """エフェクト一覧のテスト"""
@@ -69,6 +103,66 @@ class TestEffects:
             assert "default_params" in effect
             assert "class_name" in effect
 
+    def test_effects_supports_conditional_get(self, client):
+        """ETag が一致すれば 304 を返す"""
+        response = client.get("/api/effects")
+        etag = response.headers["etag"]
+        assert "max-age" in response.headers["cache-control"]
+
+        response = client.get("/api/effects", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+
+
+class TestEstimate:
+    """レンダリング時間見積もりのテスト"""
+
+    @pytest.fixture(autouse=True)
+    def cost_model(self, tmp_path_factory):
+        from lib import load_cost_model
+
+        load_cost_model(tmp_path_factory.mktemp("costs") / "costs.json")
+
+    def test_effects_include_measured_cost(self, client):
+        """計測済みならエフェクト一覧に処理コストが含まれる"""
+        effects = client.get("/api/effects").json()["effects"]
+        for effect in effects:
+            assert effect["cost"]["ns_per_sample"]
+            assert effect["cost"]["tail_seconds"] >= 0
+
+    def test_estimate_from_duration(self, client):
+        """長さとチェーンから見積もりを返す"""
+        response = client.post(
+            "/api/estimate",
+            json={"effect_chain": [{"name": "Reverb"}], "duration_seconds": 10},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["frames"] == 441000
+        assert data["estimated_seconds"] > data["stage_seconds"]["0:Reverb"] > 0
+        assert data["tail_seconds"] > 0
+
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"duration_seconds": 1e308},
+            {"duration_seconds": -10},
+            {"duration_seconds": 10, "samplerate": 0},
+            {"duration_seconds": 10, "num_channels": 0},
+        ],
+    )
+    def test_estimate_rejects_out_of_range(self, client, params):
+        """範囲外の長さ・サンプルレート・チャンネル数は 422"""
+        response = client.post(
+            "/api/estimate", json={"effect_chain": [{"name": "Reverb"}], **params}
+        )
+        assert response.status_code == 422
+
+    def test_estimate_requires_input(self, client):
+        """入力ファイルも長さもなければ 400 を返す"""
+        response = client.post("/api/estimate", json={"effect_chain": []})
+        assert response.status_code == 400
+
 
 class TestInputFiles:
     """入力ファイル一覧のテスト"""
@@ -125,13 +219,13 @@ class TestLocalProcess:
 
             assert response.status_code == 200
             data = response.json()
-            # 出力ファイル名が「元のファイル名_ランダム文字列.wav」形式
+            # 出力ファイル名が「元のファイル名_キー.wav」形式
             assert data["output_file"].startswith("my_song_")
             assert data["output_file"].endswith(".wav")
-            # ランダム部分が8文字
+            # キー部分は衝突しないよう32文字（128bit）
             name_without_ext = data["output_file"][:-4]  # .wav を除去
             random_part = name_without_ext.split("_")[-1]
-            assert len(random_part) == 8
+            assert len(random_part) == 32
 
     def test_process_output_file_is_downloadable(self, client, tmp_path):
         """ローカル処理後に出力ファイルがダウンロードできる"""
@@ -170,6 +264,648 @@ class TestLocalProcess:
             # ファイルサイズが0より大きい
             assert len(download_response.content) > 0
 
+    def test_process_returns_loudness_stats(self, client, tmp_path):
+        """処理結果に入出力の統計が含まれる"""
+        input_dir = tmp_path / "input"
+        input_dir.mkdir()
+        self._create_test_audio(input_dir / "my_song.wav")
+
+        with (
+            patch("api.routes.AUDIO_INPUT_DIR", input_dir),
+            patch("api.routes.AUDIO_OUTPUT_DIR", tmp_path / "output"),
+            patch("api.routes.AUDIO_NORMALIZED_DIR", tmp_path / "normalized"),
+        ):
+            request = {
+                "input_file": "my_song.wav",
+                "effect_chain": [{"name": "Distortion"}],
+                "normalization": "loudness",
+            }
+            data = client.post("/api/process", json=request).json()
+            for stats in (data["input_stats"], data["output_stats"]):
+                assert stats["sample_peak_db"] is not None
+                assert stats["true_peak_db"] >= stats["sample_peak_db"]
+                assert stats["integrated_lufs"] is not None
+            # 再処理（キャッシュヒット）でも同じ統計を返す
+            assert client.post("/api/process", json=request).json() == data
+
+    def test_process_keeps_previous_outputs(self, client, tmp_path):
+        """続けて処理しても前回の出力ファイルは削除されない"""
+        input_dir = tmp_path / "input"
+        output_dir = tmp_path / "output"
+        normalized_dir = tmp_path / "normalized"
+        input_dir.mkdir()
+        self._create_test_audio(input_dir / "my_song.wav")
+
+        with (
+            patch("api.routes.AUDIO_INPUT_DIR", input_dir),
+            patch("api.routes.AUDIO_OUTPUT_DIR", output_dir),
+            patch("api.routes.AUDIO_NORMALIZED_DIR", normalized_dir),
+        ):
+            request = {"input_file": "my_song.wav", "effect_chain": [{"name": "Chorus"}]}
+            first = client.post("/api/process", json=request).json()
+            client.post("/api/process", json={**request, "effect_chain": [{"name": "Delay"}]})
+
+            response = client.get(f"/api/audio/{first['output_file']}")
+            assert response.status_code == 200
+            response = client.get(f"/api/normalized/{first['output_normalized']}")
+            assert response.status_code == 200
+
+    def test_process_returns_429_when_overloaded(self, client, tmp_path):
+        """受け付け上限を超えると Retry-After 付きの 429 を返す"""
+        from lib import AdmissionController, RenderCost
+
+        input_dir = tmp_path / "input"
+        input_dir.mkdir()
+        self._create_test_audio(input_dir / "my_song.wav")
+
+        busy = AdmissionController(
+            max_concurrency=1,
+            cpu_budget_seconds=1.0,
+            memory_budget_bytes=1024**3,
+            max_queue=0,
+            max_wait_seconds=0,
+        )
+        busy._acquire(RenderCost(cpu_seconds=5.0, memory_bytes=0))
+
+        with (
+            patch("api.routes.AUDIO_INPUT_DIR", input_dir),
+            patch("api.routes.AUDIO_OUTPUT_DIR", tmp_path / "output"),
+            patch("api.routes.AUDIO_NORMALIZED_DIR", tmp_path / "normalized"),
+            patch("api.routes.admission", busy),
+        ):
+            response = client.post(
+                "/api/process",
+                json={"input_file": "my_song.wav", "effect_chain": [{"name": "Chorus"}]},
+            )
+            assert response.status_code == 429
+            assert int(response.headers["retry-after"]) >= 1
+
+    def _local_dirs(self, tmp_path):
+        input_dir = tmp_path / "input"
+        input_dir.mkdir()
+        self._create_test_audio(input_dir / "my_song.wav")
+        return (
+            patch("api.routes.AUDIO_INPUT_DIR", input_dir),
+            patch("api.routes.AUDIO_OUTPUT_DIR", tmp_path / "output"),
+            patch("api.routes.AUDIO_NORMALIZED_DIR", tmp_path / "normalized"),
+        )
+
+    def test_concurrent_identical_requests_render_once(self, client, tmp_path):
+        """同時に届いた同じリクエストは1回だけレンダリングして結果を共有する"""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        from api.routes import render_local
+
+        calls = []
+
+        def slow_render(*args):
+            calls.append(args)
+            time.sleep(0.2)
+            return render_local(*args)
+
+        request = {"input_file": "my_song.wav", "effect_chain": [{"name": "Chorus"}]}
+        inputs, outputs, normalized = self._local_dirs(tmp_path)
+        with inputs, outputs, normalized, patch("api.routes.render_local", slow_render):
+            with ThreadPoolExecutor(4) as pool:
+                responses = list(
+                    pool.map(lambda _: client.post("/api/process", json=request), range(4))
+                )
+
+        assert [r.status_code for r in responses] == [200] * 4
+        assert len({r.json()["output_file"] for r in responses}) == 1
+        assert len(calls) == 1
+
+    def test_profiled_request_joins_existing_render(self, client, tmp_path):
+        """プロファイル付きのリクエストも同じ出力のレンダリングに相乗りする"""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        from api.routes import render_local
+
+        calls = []
+
+        def slow_render(*args):
+            calls.append(args)
+            time.sleep(0.2)
+            return render_local(*args)
+
+        request = {"input_file": "my_song.wav", "effect_chain": [{"name": "Reverb"}]}
+        headers = [{}, {"X-Profile": "secret"}]
+        inputs, outputs, normalized = self._local_dirs(tmp_path)
+        with (
+            inputs,
+            outputs,
+            normalized,
+            patch("api.routes.render_local", slow_render),
+            patch("api.profiles.PROFILING_TOKEN", "secret"),
+            patch("api.routes.PROFILE_DIR", tmp_path / "profiles"),
+        ):
+            with ThreadPoolExecutor(2) as pool:
+                responses = list(
+                    pool.map(
+                        lambda h: client.post("/api/process", json=request, headers=h), headers
+                    )
+                )
+
+        assert [r.status_code for r in responses] == [200, 200]
+        assert len(calls) == 1
+
+    def test_idempotency_key_replays_response(self, client, tmp_path):
+        """同じ Idempotency-Key の再試行には完了済みの応答を返す"""
+        request = {"input_file": "my_song.wav", "effect_chain": [{"name": "Delay"}]}
+        headers = {"Idempotency-Key": uuid.uuid4().hex}
+        inputs, outputs, normalized = self._local_dirs(tmp_path)
+        with inputs, outputs, normalized:
+            first = client.post("/api/process", json=request, headers=headers)
+            with patch("api.routes.render_local") as render:
+                retry = client.post("/api/process", json=request, headers=headers)
+            render.assert_not_called()
+            assert "idempotent-replayed" not in first.headers
+            assert retry.headers["idempotent-replayed"] == "true"
+            assert retry.json() == first.json()
+
+            # 同じキーを別の内容のリクエストに使うと 422
+            other = client.post(
+                "/api/process",
+                json={**request, "effect_chain": [{"name": "Chorus"}]},
+                headers=headers,
+            )
+            assert other.status_code == 422
+
+    def test_shared_cache_serves_other_workers(self, client, tmp_path):
+        """2段目のキャッシュにある結果は、出力ディレクトリが別のワーカーでもレンダリングしない"""
+        from api.shared_cache import SharedRenderCache
+        from lib import DirectoryRenderCache
+
+        cache = SharedRenderCache(DirectoryRenderCache(tmp_path / "cache"))
+        request = {"input_file": "my_song.wav", "effect_chain": [{"name": "Vibrato"}]}
+        inputs, outputs, normalized = self._local_dirs(tmp_path)
+        with inputs, outputs, normalized, patch("api.routes.shared_cache", cache):
+            first = client.post("/api/process", json=request)
+            cache.writer.flush()
+        assert first.status_code == 200
+        assert cache.snapshot()["stored_total"] == 1
+
+        with (
+            inputs,
+            patch("api.routes.AUDIO_OUTPUT_DIR", tmp_path / "worker2" / "output"),
+            patch("api.routes.AUDIO_NORMALIZED_DIR", tmp_path / "worker2" / "normalized"),
+            patch("api.routes.shared_cache", cache),
+            patch("api.routes.render_local") as render,
+        ):
+            second = client.post("/api/process", json=request)
+        render.assert_not_called()
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        assert (tmp_path / "worker2" / "output" / first.json()["output_file"]).exists()
+
+    def test_process_deadline_cancels_render(self, client, tmp_path):
+        """期限を過ぎたら 504 を返し、レンダリングを中断して書き途中のファイルを残さない"""
+        import time
+
+        from api.cancellation import cancellation_metrics
+        from api.routes import render_local
+
+        def slow_render(*args):
+            time.sleep(0.3)
+            return render_local(*args)
+
+        before = cancellation_metrics.snapshot()["cancelled_renders_total"]
+        request = {"input_file": "my_song.wav", "effect_chain": [{"name": "Dimension"}]}
+        inputs, outputs, normalized = self._local_dirs(tmp_path)
+        with (
+            inputs,
+            outputs,
+            normalized,
+            patch("api.routes.render_local", slow_render),
+            patch("api.cancellation.RENDER_DEADLINE_SECONDS", 0.05),
+        ):
+            response = client.post("/api/process", json=request)
+            # レンダリングのスレッドが中断に気付くまで待つ
+            deadline = time.monotonic() + 5
+            while cancellation_metrics.snapshot()["cancelled_renders_total"] == before:
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+
+        assert response.status_code == 504
+        assert cancellation_metrics.snapshot()["abandoned_requests"]["deadline"] >= 1
+        assert list((tmp_path / "output").glob("*")) == []
+
+    def test_process_deadline_from_lambda_context(self):
+        """Lambda では残り実行時間から余裕を引いた時刻を期限にする"""
+        import time
+
+        from api.cancellation import request_deadline
+
+        class Context:
+            def get_remaining_time_in_millis(self):
+                return 10_000
+
+        http_request = MagicMock(scope={"aws.context": Context()})
+        with patch("api.cancellation.RENDER_DEADLINE_MARGIN_SECONDS", 2):
+            deadline = request_deadline(http_request)
+        assert deadline is not None
+        assert 7.5 < deadline - time.monotonic() <= 8
+        assert request_deadline(MagicMock(scope={})) is None
+
+    def test_process_rejects_unknown_effect_before_io(self, client, tmp_path):
+        """未知のエフェクトは入力ファイルを読む前に 400 を返す"""
+        with patch("api.routes.AUDIO_INPUT_DIR", tmp_path):
+            response = client.post(
+                "/api/process",
+                json={
+                    "input_file": "missing.wav",
+                    "effect_chain": [{"name": "Unknown Effect", "params": {}}],
+                },
+            )
+            assert response.status_code == 400
+            assert "Unknown effect" in response.json()["detail"]
+
+
+class TestAudioCaching:
+    """音声ファイルの HTTP キャッシュのテスト"""
+
+    @pytest.fixture
+    def processed(self, client, tmp_path):
+        """処理済みファイルを用意"""
+        input_dir = tmp_path / "input"
+        input_dir.mkdir()
+        TestLocalProcess()._create_test_audio(input_dir / "my_song.wav")
+
+        with (
+            patch("api.routes.AUDIO_INPUT_DIR", input_dir),
+            patch("api.routes.AUDIO_OUTPUT_DIR", tmp_path / "output"),
+            patch("api.routes.AUDIO_NORMALIZED_DIR", tmp_path / "normalized"),
+        ):
+            response = client.post(
+                "/api/process",
+                json={"input_file": "my_song.wav", "effect_chain": [{"name": "Chorus"}]},
+            )
+            yield response.json()
+
+    def test_output_is_immutable_with_strong_etag(self, client, processed):
+        """出力は強い ETag と immutable な Cache-Control を持つ"""
+        response = client.get(f"/api/audio/{processed['output_file']}")
+        assert response.status_code == 200
+        assert not response.headers["etag"].startswith("W/")
+        assert "immutable" in response.headers["cache-control"]
+
+    def test_output_returns_304_when_etag_matches(self, client, processed):
+        """If-None-Match が一致すれば 304 を返す"""
+        url = f"/api/normalized/{processed['output_normalized']}"
+        etag = client.get(url).headers["etag"]
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_output_supports_range_requests(self, client, processed):
+        """Range リクエストで部分取得できる"""
+        url = f"/api/audio/{processed['output_file']}"
+        full = client.get(url).content
+        response = client.get(url, headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206
+        assert response.content == full[100:200]
+
+    def test_input_audio_is_revalidated(self, client, processed):
+        """入力ファイルは毎回再検証させる"""
+        response = client.get("/api/input-audio/my_song.wav")
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "no-cache"
+        assert "etag" in response.headers
+
+    def test_same_input_and_chain_reuse_output(self, client, processed):
+        """同じ入力・チェーンなら同じ出力名を返す"""
+        response = client.post(
+            "/api/process",
+            json={"input_file": "my_song.wav", "effect_chain": [{"name": "chorus"}]},
+        )
+        assert response.json()["output_file"] == processed["output_file"]
+
+    def test_rerenders_when_output_is_evicted_during_reuse(self, client, processed, tmp_path):
+        """出力の確認後に janitor が削除しても、レンダリングし直して応答する"""
+        from api import routes
+
+        touch = routes.janitor.touch
+
+        def evict(path):
+            # 確認と読み込みの間に削除された状況を再現する（最初の1回だけ）
+            if path.suffix == ".json" and not evicted:
+                evicted.append(path)
+                path.unlink()
+            touch(path)
+
+        evicted = []
+        with patch.object(routes.janitor, "touch", side_effect=evict):
+            response = client.post(
+                "/api/process",
+                json={"input_file": "my_song.wav", "effect_chain": [{"name": "Chorus"}]},
+            )
+        assert response.status_code == 200
+        assert response.json()["output_stats"] == processed["output_stats"]
+        assert evicted and evicted[0].exists()
+
+
+class TestBulkProcess:
+    """一括処理のテスト"""
+
+    def _write_inputs(self, directory, names):
+        import numpy as np
+        from pedalboard.io import AudioFile
+
+        directory.mkdir(parents=True, exist_ok=True)
+        for i, name in enumerate(names):
+            t = np.arange(22050) / 44100
+            audio = (0.5 * np.sin(2 * np.pi * (220 + 110 * i) * t)).astype(np.float32)[None]
+            with AudioFile(str(directory / name), "w", 44100, 1) as f:
+                f.write(audio)
+
+    def test_bulk_process_streams_zip_with_manifest(self, client, tmp_path):
+        """入力ディレクトリの全ファイルを処理して ZIP で返す"""
+        import io
+        import json
+        import zipfile
+
+        self._write_inputs(tmp_path / "input", ["a.wav", "b.wav", "c.wav"])
+        with (
+            patch("api.routes.AUDIO_INPUT_DIR", tmp_path / "input"),
+            patch("api.routes.AUDIO_OUTPUT_DIR", tmp_path / "output"),
+        ):
+            response = client.post("/api/bulk-process", json={"effect_chain": [{"name": "Reverb"}]})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            manifest = json.loads(archive.read("manifest.json"))
+            assert sorted(f["input"] for f in manifest["files"]) == ["a.wav", "b.wav", "c.wav"]
+            for entry in manifest["files"]:
+                assert entry["output"].startswith(entry["input"][:-4] + "_")
+                assert archive.read(entry["output"])[:4] == b"RIFF"
+
+    def test_bulk_process_rejects_missing_input(self, client, tmp_path):
+        """存在しない入力があれば 404 を返す"""
+        self._write_inputs(tmp_path / "input", ["a.wav"])
+        with patch("api.routes.AUDIO_INPUT_DIR", tmp_path / "input"):
+            response = client.post(
+                "/api/bulk-process",
+                json={"input_files": ["a.wav", "missing.wav"], "effect_chain": []},
+            )
+        assert response.status_code == 404
+        assert "missing.wav" in response.json()["detail"]
+
+    def test_s3_bulk_process_writes_job_prefix(self, client, tmp_path):
+        """S3 の入力を処理してジョブのプレフィックスに出力とマニフェストを書き出す"""
+        import json
+
+        from loadtest import InMemoryS3
+
+        self._write_inputs(tmp_path, ["a.wav", "b.wav"])
+        s3 = InMemoryS3()
+        for name in ["a.wav", "b.wav"]:
+            s3.put_object(
+                Bucket="test-bucket", Key=f"input/{name}", Body=(tmp_path / name).read_bytes()
+            )
+
+        with (
+            patch("api.routes.S3_BUCKET", "test-bucket"),
+            patch("api.routes.get_s3_client", return_value=s3),
+        ):
+            response = client.post(
+                "/api/s3-bulk-process",
+                json={
+                    "s3_keys": ["input/a.wav", "input/b.wav", "input/missing.wav"],
+                    "effect_chain": [{"name": "Delay"}],
+                },
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["job_prefix"].startswith("output/bulk/")
+        ok, ok2, failed = data["files"]
+        assert ok["output_key"].startswith(data["job_prefix"])
+        assert ok["output_key"].endswith("_a.wav") and ok2["output_key"].endswith("_b.wav")
+        assert failed["error"] and failed["output_key"] is None
+        manifest = s3.get_object(Bucket="test-bucket", Key=data["manifest_key"])["Body"].read()
+        assert len(json.loads(manifest)["files"]) == 3
+
+
+class TestDirectRender:
+    """直接アップロード処理のテスト"""
+
+    def _wav_bytes(self, seconds=0.5):
+        import io
+
+        import numpy as np
+        from pedalboard.io import AudioFile
+
+        t = np.arange(int(44100 * seconds)) / 44100
+        audio = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)[None]
+        buffer = io.BytesIO()
+        with AudioFile(buffer, "w", 44100, 1, format="wav") as f:
+            f.write(audio)
+        return buffer.getvalue()
+
+    def test_multipart_upload_returns_processed_audio(self, client):
+        """multipart でアップロードすると処理後の WAV と統計を返す"""
+        import json
+
+        response = client.post(
+            "/api/render",
+            files={"file": ("my_clip.wav", self._wav_bytes(), "audio/wav")},
+            data={"effect_chain": json.dumps([{"name": "Reverb"}])},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "audio/wav"
+        assert response.content[:4] == b"RIFF"
+        assert "my_clip_processed.wav" in response.headers["content-disposition"]
+        assert json.loads(response.headers["x-output-stats"])["sample_peak_db"] is not None
+
+    def test_raw_body_returns_peaks(self, client):
+        """生のボディで response=peaks を指定すると波形と統計を返す"""
+        import json
+
+        response = client.post(
+            "/api/render",
+            params={
+                "effect_chain": json.dumps([{"name": "Delay"}]),
+                "response": "peaks",
+                "peaks": 50,
+            },
+            content=self._wav_bytes(),
+            headers={"Content-Type": "audio/wav"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["frames"] == 22050
+        assert len(data["input_peaks"]) == len(data["output_peaks"]) == 50
+        assert max(data["input_peaks"]) == pytest.approx(0.5, abs=0.01)
+        assert data["effects_applied"] == ["Delay"]
+
+    def test_profile_header_requires_token(self, client, tmp_path):
+        """トークンが一致する X-Profile ヘッダーがあればプロファイルへのリンクを返す"""
+        params = {"effect_chain": '[{"name": "Reverb"}]', "response": "peaks"}
+        headers = {"Content-Type": "audio/wav", "X-Profile": "secret"}
+        with (
+            patch("api.profiles.PROFILING_TOKEN", "secret"),
+            patch("api.profiles.PROFILE_INTERVAL_SECONDS", 0.0005),
+            patch("api.routes.PROFILE_DIR", tmp_path),
+        ):
+            response = client.post(
+                "/api/render", params=params, content=self._wav_bytes(), headers=headers
+            )
+            profile_url = response.json()["profile_url"]
+            assert profile_url.startswith("/api/profiles/")
+            profile = client.get(profile_url)
+            assert profile.status_code == 200
+            assert "_render_direct" in profile.text
+
+            headers["X-Profile"] = "wrong"
+            response = client.post(
+                "/api/render", params=params, content=self._wav_bytes(), headers=headers
+            )
+            assert response.json()["profile_url"] is None
+
+    def test_input_over_memory_budget_is_rendered_in_blocks(self, client):
+        """メモリ予算を超える入力は分割処理に切り替えて処理する"""
+        before = client.get("/api/health").json()["memory"]["chunked_renders_total"]
+        with patch("api.routes.RENDER_MEMORY_PER_REQUEST_BYTES", 1024):
+            response = client.post(
+                "/api/render",
+                params={"effect_chain": '[{"name": "Reverb"}]', "response": "peaks"},
+                content=self._wav_bytes(seconds=1.0),
+                headers={"Content-Type": "audio/wav"},
+            )
+        assert response.status_code == 200
+        assert response.json()["frames"] == 44100
+        after = client.get("/api/health").json()["memory"]["chunked_renders_total"]
+        assert after == before + 1
+
+    def test_large_upload_is_redirected_to_s3(self, client):
+        """上限を超えるボディは 413 で S3 経由を案内する"""
+        with patch("api.routes.DIRECT_RENDER_MAX_BYTES", 1000):
+            response = client.post(
+                "/api/render",
+                params={"effect_chain": "[]"},
+                content=self._wav_bytes(),
+                headers={"Content-Type": "audio/wav"},
+            )
+        assert response.status_code == 413
+        assert "/api/upload-url" in response.headers["link"]
+
+    def test_invalid_audio_returns_400(self, client):
+        """音声として読めないボディは 400 を返す"""
+        response = client.post(
+            "/api/render",
+            params={"effect_chain": "[]"},
+            content=b"not audio" * 100,
+            headers={"Content-Type": "audio/wav"},
+        )
+        assert response.status_code == 400
+
+
+class TestPrerender:
+    """事前レンダリングのテスト"""
+
+    def test_prerendered_combination_is_served_from_cache(self, client, tmp_path):
+        """事前レンダリングした組み合わせは再レンダリングせずに返す"""
+        import numpy as np
+        from pedalboard.io import AudioFile
+
+        from api.prerender import prerender_jobs, render_job
+
+        input_dir = tmp_path / "input"
+        input_dir.mkdir()
+        t = np.arange(22050) / 44100
+        with AudioFile(str(input_dir / "demo.wav"), "w", 44100, 1) as f:
+            f.write((0.5 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)[None])
+
+        with (
+            patch("api.routes.AUDIO_INPUT_DIR", input_dir),
+            patch("api.prerender.AUDIO_INPUT_DIR", input_dir),
+            patch("api.routes.AUDIO_OUTPUT_DIR", tmp_path / "output"),
+            patch("api.routes.AUDIO_NORMALIZED_DIR", tmp_path / "normalized"),
+        ):
+            jobs = prerender_jobs(max_jobs=100)
+            # 単体エフェクトのプリセットが全て対象になる
+            assert {job.effect_chain[0][0] for job in jobs} >= {"Reverb", "Delay"}
+            reverb = next(job for job in jobs if job.effect_chain[0][0] == "Reverb")
+            assert render_job(reverb) is True
+            assert render_job(reverb) is False
+
+            with patch("api.routes.render_local") as render:
+                response = client.post(
+                    "/api/process",
+                    json={"input_file": "demo.wav", "effect_chain": [{"name": "Reverb"}]},
+                )
+            assert response.status_code == 200
+            render.assert_not_called()
+
+    def test_prerender_counts_against_admission(self, tmp_path):
+        """事前レンダリングもライブのリクエストと同じ受け付けの予算に計上する"""
+        from api.prerender import admission, render_job
+        from lib import Overloaded, PrerenderJob, compile_effect_chain
+
+        input_dir = tmp_path / "input"
+        input_dir.mkdir()
+        TestLocalProcess()._create_test_audio(input_dir / "demo.wav")
+        job = PrerenderJob.from_chain("demo.wav", compile_effect_chain([{"name": "Reverb"}]))
+        running = []
+
+        with (
+            patch("api.prerender.AUDIO_INPUT_DIR", input_dir),
+            patch("api.routes.AUDIO_OUTPUT_DIR", tmp_path / "output"),
+            patch("api.routes.AUDIO_NORMALIZED_DIR", tmp_path / "normalized"),
+        ):
+            with patch(
+                "api.prerender.render_local",
+                side_effect=lambda *args: running.append(admission.snapshot()["running"]),
+            ):
+                assert render_job(job) is True
+            assert running == [1]
+            assert admission.snapshot()["running"] == 0
+
+            # ライブのリクエストが待っていれば譲る
+            with patch.object(admission, "_waiters", [object()]):
+                with pytest.raises(Overloaded):
+                    render_job(job)
+
+    def test_jobs_from_request_log(self):
+        """リクエストログから多い順に組み合わせを集計する"""
+        import json
+
+        from api.prerender import jobs_from_log
+        from api.routes import REQUEST_LOG_MARKER
+
+        def line(name, chain):
+            entry = {"input_file": name, "effect_chain": chain}
+            return f"INFO:api.routes:{REQUEST_LOG_MARKER}{json.dumps(entry)}"
+
+        lines = [
+            line("a.wav", [{"name": "Reverb"}]),
+            line("b.wav", [{"name": "Delay"}]),
+            line("b.wav", [{"name": "Delay"}]),
+            line("c.wav", [{"name": "Unknown"}]),
+            "unrelated line",
+        ]
+        jobs = jobs_from_log(lines)
+        assert [job.input_file for job in jobs] == ["b.wav", "a.wav"]
+
+    def test_configured_chains_are_validated(self, tmp_path):
+        """設定ファイルのチェーンが読めない・不正なら分かるエラーにする"""
+        from api.prerender import configured_chains
+
+        path = tmp_path / "chains.json"
+        path.write_text('[[{"name": "Reverb"}], [{"name": "Delay"}]]')
+        assert len(configured_chains(path)) == 2
+        assert configured_chains(None) == []
+
+        for content in ["not json", '{"name": "Reverb"}', '[[{"name": "Unknown"}]]', "[[1]]"]:
+            path.write_text(content)
+            with pytest.raises(ValueError, match="PRERENDER_CHAINS_PATH"):
+                configured_chains(path)
+        with pytest.raises(ValueError, match="PRERENDER_CHAINS_PATH"):
+            configured_chains(tmp_path / "missing.json")
+
 
 class TestAudioEndpoints:
     """音声ファイルエンドポイントのテスト"""
@@ -276,6 +1012,7 @@ class TestS3Process:
         mock_s3.download_file.side_effect = lambda bucket, key, path: __import__("shutil").copy(
             str(test_audio), path
         )
+        mock_s3.head_object.return_value = {"ContentLength": 1024}
         mock_s3.upload_file.return_value = None
         mock_s3.generate_presigned_url.side_effect = lambda op, Params, ExpiresIn: (
             f"https://s3.example.com/{Params['Key']}"
@@ -328,6 +1065,7 @@ class TestS3Process:
         mock_s3.download_file.side_effect = lambda bucket, key, path: __import__("shutil").copy(
             str(test_audio), path
         )
+        mock_s3.head_object.return_value = {"ContentLength": 1024}
         mock_s3.upload_file.return_value = None
         mock_s3.generate_presigned_url.side_effect = capture_presigned_url
 
@@ -375,6 +1113,7 @@ class TestS3Process:
         mock_s3.download_file.side_effect = lambda bucket, key, path: __import__("shutil").copy(
             str(test_audio), path
         )
+        mock_s3.head_object.return_value = {"ContentLength": 1024}
         mock_s3.upload_file.return_value = None
         mock_s3.generate_presigned_url.side_effect = capture_presigned_url
 
@@ -398,3 +1137,237 @@ class TestS3Process:
             # 「単音」は URL エンコードされるので直接含まれない
             assert "%E5%8D%98%E9%9F%B3" in captured_params["disposition"]  # 「単音」のURLエンコード
             assert ".wav" in captured_params["disposition"]
+
+    def _stream_s3(self, tmp_path):
+        import numpy as np
+        from pedalboard.io import AudioFile
+
+        from loadtest import InMemoryS3
+
+        test_audio = tmp_path / "test_input.wav"
+        t = np.arange(44100) / 44100
+        audio = np.stack([np.sin(2 * np.pi * 220 * t), np.sin(2 * np.pi * 330 * t)]) * 0.5
+        with AudioFile(str(test_audio), "w", 44100, 2) as f:
+            f.write(audio.astype(np.float32))
+        s3 = InMemoryS3()
+        s3.put_object(Bucket="test-bucket", Key="input/test.wav", Body=test_audio.read_bytes())
+        return s3, test_audio
+
+    def _stream_patches(self, s3):
+        # 小さなパートで複数回の範囲取得・パートのアップロードを行わせる
+        return (
+            patch("api.routes.S3_BUCKET", "test-bucket"),
+            patch("api.routes.get_s3_client", return_value=s3),
+            patch("api.routes.S3_STREAM_MIN_BYTES", 0),
+            patch("api.routes.S3_STREAM_PART_BYTES", 32 * 1024),
+        )
+
+    def test_s3_process_streams_large_wav(self, client, tmp_path):
+        """大きな WAV は範囲取得とマルチパートアップロードで処理し、通常の経路と同じ出力になる"""
+        import numpy as np
+        from pedalboard.io import AudioFile
+
+        from lib import compile_effect_chain, render_file
+
+        s3, test_audio = self._stream_s3(tmp_path)
+        s3.download_file = MagicMock(side_effect=AssertionError("should stream"))
+        s3.upload_part = MagicMock(wraps=s3.upload_part)
+        bucket, client_patch, min_bytes, part_bytes = self._stream_patches(s3)
+        with bucket, client_patch, min_bytes, part_bytes:
+            response = client.post(
+                "/api/s3-process",
+                json={"s3_key": "input/test.wav", "effect_chain": [{"name": "Delay"}]},
+            )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert s3.upload_part.call_count > 1
+        assert s3.pending_uploads() == []
+        assert data["output_normalized_url"]
+
+        streamed = tmp_path / "streamed.wav"
+        streamed.write_bytes(
+            s3.get_object(Bucket="test-bucket", Key=data["output_key"])["Body"].read()
+        )
+        expected = tmp_path / "expected.wav"
+        render_file(test_audio, expected, compile_effect_chain([{"name": "Delay"}]).build())
+        with AudioFile(str(streamed)) as a, AudioFile(str(expected)) as b:
+            assert a.frames == b.frames == 44100
+            np.testing.assert_allclose(a.read(a.frames), b.read(b.frames), atol=1e-3)
+
+    def test_s3_process_aborts_failed_stream_upload(self, client, tmp_path):
+        """アップロードが失敗したらマルチパートアップロードを中止して 500 を返す"""
+        from botocore.exceptions import ClientError
+
+        s3, _ = self._stream_s3(tmp_path)
+        s3.upload_part = MagicMock(
+            side_effect=ClientError({"Error": {"Code": "SlowDown"}}, "UploadPart")
+        )
+        bucket, client_patch, min_bytes, part_bytes = self._stream_patches(s3)
+        with bucket, client_patch, min_bytes, part_bytes:
+            response = client.post(
+                "/api/s3-process",
+                json={"s3_key": "input/test.wav", "effect_chain": [{"name": "Delay"}]},
+            )
+
+        assert response.status_code == 500
+        assert "SlowDown" in response.json()["detail"]
+        assert s3.pending_uploads() == []
+
+    def test_s3_process_calls_s3_off_the_event_loop(self, client, tmp_path):
+        """S3 の呼び出し（後始末の削除を含む）はイベントループのスレッドで行わない"""
+        import asyncio
+
+        from botocore.exceptions import ClientError
+
+        s3, _ = self._stream_s3(tmp_path)
+        on_loop = []
+
+        def off_loop(method):
+            def call(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(method.__name__)
+                except RuntimeError:
+                    pass
+                return method(*args, **kwargs)
+
+            return call
+
+        upload_file = s3.upload_file
+
+        def failing_upload_file(path, bucket, key, **kwargs):
+            if "normalized/output_" in key:
+                raise ClientError({"Error": {"Code": "SlowDown"}}, "PutObject")
+            return upload_file(path, bucket, key, **kwargs)
+
+        s3.upload_file = failing_upload_file
+        for name in ["head_object", "get_object", "download_file", "upload_file", "delete_object"]:
+            setattr(s3, name, off_loop(getattr(s3, name)))
+        bucket, client_patch, min_bytes, part_bytes = self._stream_patches(s3)
+        request = {"s3_key": "input/test.wav", "effect_chain": [{"name": "Delay"}]}
+        with bucket, client_patch, part_bytes:
+            # ダウンロードしてから処理する経路
+            assert client.post("/api/s3-process", json=request).status_code == 500
+            with min_bytes:
+                # 範囲取得でストリーミングする経路
+                assert client.post("/api/s3-process", json=request).status_code == 500
+
+        assert on_loop == []
+        assert s3.keys("test-bucket", "output/") == []
+
+    def _s3_cache(self, s3):
+        from api.shared_cache import SharedRenderCache
+        from lib import S3RenderCache
+
+        return SharedRenderCache(
+            S3RenderCache("test-bucket", "cache/", lambda: s3), write_behind=False
+        )
+
+    def test_s3_process_reuses_shared_cache(self, client, tmp_path):
+        """同じ内容の入力は2段目のキャッシュの成果物をそのまま返し、レンダリングしない"""
+        s3, test_audio = self._stream_s3(tmp_path)
+        s3.put_object(Bucket="test-bucket", Key="input/copy.wav", Body=test_audio.read_bytes())
+        cache = self._s3_cache(s3)
+        request = {"s3_key": "input/test.wav", "effect_chain": [{"name": "Delay"}]}
+        with (
+            patch("api.routes.S3_BUCKET", "test-bucket"),
+            patch("api.routes.get_s3_client", return_value=s3),
+            patch("api.routes.shared_cache", cache),
+        ):
+            first = client.post("/api/s3-process", json=request)
+            s3.download_file = MagicMock(side_effect=AssertionError("should hit the cache"))
+            second = client.post("/api/s3-process", json={**request, "s3_key": "input/copy.wav"})
+
+        assert first.status_code == second.status_code == 200
+        # ミスの場合もキャッシュの位置に1回だけ書き出す（output/ へ書いてから複製しない）
+        assert first.json()["output_key"].startswith("cache/")
+        assert second.json()["output_key"] == first.json()["output_key"]
+        assert second.json()["output_stats"] == first.json()["output_stats"]
+        assert len(s3.keys("test-bucket", "cache/")) == 4
+        assert s3.keys("test-bucket", "output/") == []
+
+    def test_s3_process_rerenders_when_cached_artifact_is_gone(self, client, tmp_path):
+        """統計が残っていても成果物が期限切れで消えていれば、レンダリングし直す"""
+        s3, _ = self._stream_s3(tmp_path)
+        cache = self._s3_cache(s3)
+        request = {"s3_key": "input/test.wav", "effect_chain": [{"name": "Delay"}]}
+        with (
+            patch("api.routes.S3_BUCKET", "test-bucket"),
+            patch("api.routes.get_s3_client", return_value=s3),
+            patch("api.routes.shared_cache", cache),
+        ):
+            first = client.post("/api/s3-process", json=request).json()
+            s3.delete_object(Bucket="test-bucket", Key=first["output_key"])
+            s3.download_file = MagicMock(wraps=s3.download_file)
+            second = client.post("/api/s3-process", json=request)
+
+        assert second.status_code == 200
+        s3.download_file.assert_called_once()
+        assert second.json()["output_key"] == first["output_key"]
+        s3.head_object(Bucket="test-bucket", Key=first["output_key"])
+
+    def test_s3_process_deadline_aborts_stream(self, client, tmp_path):
+        """期限を過ぎたらストリーミング中のマルチパートアップロードを中止する"""
+        import time
+
+        s3, _ = self._stream_s3(tmp_path)
+        upload_part = s3.upload_part
+
+        def slow_upload_part(**kwargs):
+            time.sleep(0.1)
+            return upload_part(**kwargs)
+
+        s3.upload_part = MagicMock(side_effect=slow_upload_part)
+        s3.abort_multipart_upload = MagicMock(wraps=s3.abort_multipart_upload)
+        bucket, client_patch, min_bytes, part_bytes = self._stream_patches(s3)
+        with (
+            bucket,
+            client_patch,
+            min_bytes,
+            part_bytes,
+            patch("api.routes.RENDER_CANCEL_CHECK_SECONDS", 0.05),
+            patch("api.cancellation.RENDER_DEADLINE_SECONDS", 0.05),
+        ):
+            response = client.post(
+                "/api/s3-process",
+                json={"s3_key": "input/test.wav", "effect_chain": [{"name": "Reverb"}]},
+            )
+            deadline = time.monotonic() + 5
+            while not s3.abort_multipart_upload.called:
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+
+        assert response.status_code == 504
+        assert s3.pending_uploads() == []
+        assert s3.keys("test-bucket", "output/") == []
+
+    def test_s3_process_cancel_during_normalize_deletes_output(self, tmp_path):
+        """ストリーミングのアップロード完了後（正規化中）に中断されたら出力を削除する"""
+        from api.routes import render_s3_stream
+
+        def stream_then_cancel(*args):
+            result = render_s3_stream(*args)
+            args[-1].cancel("deadline")  # 最後の引数が CancelToken
+            return result
+
+        s3, _ = self._stream_s3(tmp_path)
+        bucket, client_patch, min_bytes, part_bytes = self._stream_patches(s3)
+        client = TestClient(app, raise_server_exceptions=False)
+        with (
+            bucket,
+            client_patch,
+            min_bytes,
+            part_bytes,
+            patch("api.routes.render_s3_stream", stream_then_cancel),
+            patch("api.routes.write_display_versions") as normalize,
+        ):
+            response = client.post(
+                "/api/s3-process",
+                json={"s3_key": "input/test.wav", "effect_chain": [{"name": "Delay"}]},
+            )
+
+        assert response.status_code == 500
+        normalize.assert_not_called()
+        assert s3.keys("test-bucket", "output/") == []
+        assert s3.pending_uploads() == []
@@ -13,9 +13,20 @@ export interface EffectConfig {
   params?: Record<string, number>;
 }
 
+export type NormalizationMode = 'peak' | 'loudness';
+
+// ピーク・ラウドネス統計（無音の場合は null）
+export interface AudioStats {
+  sample_peak_db: number | null;
+  true_peak_db: number | null;
+  rms_db: number | null;
+  integrated_lufs: number | null;
+}
+
 export interface ProcessRequest {
   input_file: string;
   effect_chain: EffectConfig[];
+  normalization?: NormalizationMode;
 }
 
 export interface ProcessResponse {
@@ -24,12 +35,22 @@ export interface ProcessResponse {
   effects_applied: string[];
   input_normalized: string;
   output_normalized: string;
+  input_stats: AudioStats | null;
+  output_stats: AudioStats | null;
+  profile_url: string | null; // X-Profile を付けた場合のみ
+}
+
+export interface EffectCost {
+  ns_per_sample: Record<string, number>;
+  latency_seconds: number;
+  tail_seconds: number;
 }
 
 export interface AvailableEffect {
   name: string;
   default_params: Record<string, number>;
   class_name: string;
+  cost?: EffectCost;
 }
 
 // S3 Upload types
@@ -41,6 +62,8 @@ export interface UploadUrlResponse {
 export interface S3ProcessRequest {
   s3_key: string;
   effect_chain: EffectConfig[];
+  original_filename?: string;
+  normalization?: NormalizationMode;
 }
 
 export interface S3ProcessResponse {
@@ -49,4 +72,7 @@ export interface S3ProcessResponse {
   effects_applied: string[];
   input_normalized_url: string;
   output_normalized_url: string;
+  input_stats: AudioStats | null;
+  output_stats: AudioStats | null;
+  profile_url: string | null;
 }
@@ -10,8 +10,9 @@ resource "aws_lambda_function" "processor" {
 
   environment {
     variables = {
-      AUDIO_BUCKET = aws_s3_bucket.audio.id
-      ENV          = "production"
+      AUDIO_BUCKET         = aws_s3_bucket.audio.id
+      ENV                  = "production"
+      RENDER_CACHE_BACKEND = "s3"
     }
   }
 
@@ -58,9 +59,16 @@ resource "aws_iam_role_policy" "lambda" {
         Action = [
           "s3:GetObject",
           "s3:PutObject",
-          "s3:DeleteObject"
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload"
         ]
         Resource = "${aws_s3_bucket.audio.arn}/*"
+      },
+      {
+        # レンダリングキャッシュの存在確認で、無いキーを 403 ではなく 404 にする
+        Effect   = "Allow"
+        Action   = ["s3:ListBucket"]
+        Resource = aws_s3_bucket.audio.arn
       }
     ]
   })
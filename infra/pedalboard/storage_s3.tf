@@ -72,4 +72,14 @@ resource "aws_s3_bucket_lifecycle_configuration" "audio" {
       days = 7
     }
   }
+
+  # ストリーミング処理が中断された場合に残る未完了のマルチパートアップロード
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
 }